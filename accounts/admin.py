@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import user_accounts
+from .models import user_accounts, OutboundEmail
 from products.models import Products
 
 # Defines how products are displayed as inline objects in the User admin. This can be either Tabular or Stacked.
@@ -57,4 +57,23 @@ class UserAccountsAdminList(UserAdmin):
         return form
 
 # Registers the custom user model with the custom admin interface
-admin.site.register(user_accounts, UserAccountsAdminList)
\ No newline at end of file
+admin.site.register(user_accounts, UserAccountsAdminList)
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    # Queued account emails: follow delivery, inspect dead letters and requeue them once fixed
+    list_display = ('to', 'subject', 'status', 'attempts', 'created_at', 'delivery_latency', 'last_error')
+    list_filter = ('status',)
+    search_fields = ('to',)
+    actions = ['requeue']
+
+    def delivery_latency(self, obj):
+        if obj.sent_at is None:
+            return '-'
+        return f"{(obj.sent_at - obj.created_at).total_seconds():.1f}s"
+
+    @admin.action(description="Requeue selected emails")
+    def requeue(self, request, queryset):
+        count = queryset.exclude(status=OutboundEmail.SENT).update(
+            status=OutboundEmail.PENDING, attempts=0, lease_owner='', lease_expires_at=None)
+        self.message_user(request, f"{count} emails requeued.")
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from accounts.outbox import deliver_outbox, outbox_depth
+from products.profiling import save_metrics
+from products.scheduler import install_stop_handlers, worker_name
+
+
+class Command(BaseCommand):
+    help = "Run the outbox service that sends queued account emails such as signup activation links"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=settings.EMAIL_OUTBOX_POLL_SECONDS,
+                            help="Seconds between checks for queued emails")
+        parser.add_argument('--once', action='store_true', help="Send the queued emails, then exit")
+
+    def handle(self, *args, **options):
+        # Identified and stopped like the tracking workers: host:pid in leases, clean exit on Ctrl+C or SIGTERM
+        worker = worker_name()
+        stop = install_stop_handlers()
+
+        while not stop.is_set():
+            stats = deliver_outbox(worker)
+            if stats['sent'] or stats['failed']:
+                latencies = stats['latencies']
+                latency = (f"latency avg {sum(latencies) / len(latencies):.1f}s, max {max(latencies):.1f}s"
+                           if latencies else "no latency samples")
+                self.stdout.write(f"Sent {stats['sent']} emails ({latency}), {stats['failed']} failed, "
+                                  f"{stats['dead']} dead-lettered, {outbox_depth()} queued")
+                # Publish the email counters and timings to the metrics endpoint
+                save_metrics(worker)
+            if options['once']:
+                break
+            stop.wait(options['poll'])
@@ -18,3 +18,35 @@ class user_accounts(AbstractUser):
 
     # Specify a custom manager for the user_accounts model.
     objects = UserManager()
+
+
+class OutboundEmail(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (DEAD, 'Dead letter')]
+
+    # An account email (such as signup activation) queued by a request and sent by the outbox
+    # service (manage.py send_emails), so requests never wait on Gmail.
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # Delivery attempts so far and the sender holding the email; a pending email whose lease has
+    # expired (or was never set) can be picked up. Emails that use up their attempts are kept as
+    # dead letters for inspection and can be requeued from the admin.
+    attempts = models.PositiveIntegerField(default=0)
+    lease_owner = models.CharField(max_length=255, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Serves claiming: pending emails whose lease is free, oldest first.
+            models.Index(fields=['status', 'lease_expires_at', 'created_at'], name='outboundemail_claim'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.to}"
@@ -0,0 +1,95 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q, F
+from django.utils.timezone import now
+from trackit import metrics
+from trackit.db import write_atomic
+from trackit.gmail import get_gmail_client
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(to, subject, body):
+    # Store the email for the outbox service; the caller returns without waiting on Gmail
+    return OutboundEmail.objects.create(to=to, subject=subject, body=body)
+
+
+def send_with_gmail(messages):
+    # Account emails are HTML, sent from the configured address in one Gmail batch request
+    return get_gmail_client().send_batch(messages, subtype='html', sender=settings.ACCOUNT_EMAIL_SENDER)
+
+
+def _claimable(queryset, current):
+    return queryset.filter(status=OutboundEmail.PENDING).filter(
+        Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=current))
+
+
+def claim_emails(worker, limit):
+    # Lease up to limit of the oldest pending emails to worker, as in the tracking work queue
+    current = now()
+    expires = current + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+    candidates = list(_claimable(OutboundEmail.objects.all(), current).order_by('created_at', 'id')
+                      .values_list('id', flat=True)[:limit])
+    if not candidates:
+        return []
+    _claimable(OutboundEmail.objects.filter(id__in=candidates), current).update(
+        lease_owner=worker, lease_expires_at=expires, attempts=F('attempts') + 1)
+    return list(OutboundEmail.objects.filter(id__in=candidates, lease_owner=worker, lease_expires_at=expires))
+
+
+def retry_delay(attempts):
+    # Exponential backoff between attempts: 1x, 2x, 4x ... EMAIL_OUTBOX_RETRY_DELAY
+    return timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def deliver_outbox(worker, send=None):
+    """Send every pending email, EMAIL_OUTBOX_BATCH_SIZE per call to send.
+
+    send takes {id: (to, subject, body)} and returns {id: error message, or None if sent};
+    it defaults to the Gmail client. Failed emails are retried with exponential backoff and
+    become dead letters after EMAIL_OUTBOX_MAX_ATTEMPTS. Returns the number sent, failed and
+    dead-lettered, and the delivery latency (seconds from queueing to sending) of each sent email.
+    """
+    send = send or send_with_gmail
+    stats = {'sent': 0, 'failed': 0, 'dead': 0, 'latencies': []}
+    while True:
+        emails = claim_emails(worker, settings.EMAIL_OUTBOX_BATCH_SIZE)
+        if not emails:
+            break
+        try:
+            with metrics.timed('email'):
+                results = send({email.id: (email.to, email.subject, email.body) for email in emails})
+        except Exception as e:
+            results = {email.id: str(e) for email in emails}
+        current = now()
+        sent, failed = [], []
+        for email in emails:
+            error = results.get(email.id)
+            if error is None:
+                sent.append(email.id)
+                stats['latencies'].append((current - email.created_at).total_seconds())
+                continue
+            logger.warning("Failed to email %s: %s", email.to, error)
+            if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                email.status = OutboundEmail.DEAD
+                stats['dead'] += 1
+            else:
+                email.lease_expires_at = current + retry_delay(email.attempts)
+            email.last_error = error[:255]
+            failed.append(email)
+        with write_atomic():
+            OutboundEmail.objects.filter(id__in=sent).update(
+                status=OutboundEmail.SENT, sent_at=current, lease_expires_at=None, last_error='')
+            OutboundEmail.objects.bulk_update(failed, ['status', 'lease_expires_at', 'last_error'])
+        stats['sent'] += len(sent)
+        stats['failed'] += len(failed)
+        metrics.inc('trackit_emails_total', len(sent), kind='account', outcome='sent')
+        metrics.inc('trackit_emails_total', len(failed), kind='account', outcome='failed')
+    return stats
+
+
+def outbox_depth():
+    # Emails waiting to be sent, including those waiting for a retry
+    return OutboundEmail.objects.filter(status=OutboundEmail.PENDING).count()
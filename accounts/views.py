@@ -7,14 +7,10 @@ from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from .tokens import account_activation_token
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from email.mime.text import MIMEText
-import base64
-import os
+from .outbox import queue_email
 from google_auth_oauthlib.flow import Flow
 from django.conf import settings
+from trackit.gmail import SCOPES, get_gmail_client
 
 User = get_user_model()
 
@@ -43,7 +39,7 @@ def entry(request):
             )
             new_user.is_verified = False  # Mark the user as unverified initially
             
-            # Prepare and send the activation email
+            # Prepare the activation email and queue it for the outbox service (manage.py send_emails)
             current_site = get_current_site(request)
             mail_subject = 'Activate your account.'
             message = render_to_string('acc_active_email.html', {
@@ -52,7 +48,7 @@ def entry(request):
                 'uid': urlsafe_base64_encode(force_bytes(new_user.pk)),
                 'token': account_activation_token.make_token(new_user),
             })
-            send_email_with_gmail_api(to_email=new_user.email, subject=mail_subject, message_text=message)
+            queue_email(to=new_user.email, subject=mail_subject, body=message)
             
             messages.info(request, 'Please verify your email address to complete the registration')
             return redirect('entry')
@@ -91,37 +87,12 @@ def activate(request, uidb64, token):
     else:
         return HttpResponse('Activation link is invalid!')
 
-def send_email_with_gmail_api(to_email, subject, message_text):
-    """Send an email using the Gmail API."""
-    # Load credentials from the token file
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', ['https://www.googleapis.com/auth/gmail.send'])
-    
-    if not creds or not creds.valid:
-        print("No valid credentials provided for Gmail API.")
-        return
-    
-    service = build('gmail', 'v1', credentials=creds)
-    
-    # Create and send the email message
-    message = MIMEText(message_text, 'html')
-    message['to'] = to_email
-    message['from'] = 'your_email@gmail.com'  # Replace with your actual email
-    message['subject'] = subject
-    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-    
-    try:
-        service.users().messages().send(userId="me", body={'raw': raw_message}).execute()
-    except Exception as error:
-        print(f"An error occurred: {error}")
-
 # OAuth2 flow for Google authentication and authorization to use Gmail for sending emails
 def google_authenticate(request):
     # Initiate OAuth flow
     flow = Flow.from_client_secrets_file(
         'credentials.json',
-        scopes=['https://www.googleapis.com/auth/gmail.send'],
+        scopes=SCOPES,
         redirect_uri=f'{settings.SITE_URL}/google_callback/'
     )
     
@@ -138,15 +109,14 @@ def google_callback(request):
     state = request.session.get('state')
     flow = Flow.from_client_secrets_file(
         'credentials.json',
-        scopes=['https://www.googleapis.com/auth/gmail.send'],
+        scopes=SCOPES,
         state=state,
         redirect_uri=f'{settings.SITE_URL}/google_callback/'
     )
     
     flow.fetch_token(authorization_response=request.build_absolute_uri())
     
-    credentials = flow.credentials
-    with open('token.json', 'w') as token:
-        token.write(credentials.to_json())
+    # Hand the new credentials to the shared Gmail client, which saves them to the token file
+    get_gmail_client().store(flow.credentials)
     
     return HttpResponse('Google account successfully connected. You can now use the Gmail API to send emails.')
@@ -1,17 +1,17 @@
 from django.contrib import admin
-import threading
+from django.db.models import Count, Q
 from django.http import HttpResponseRedirect
-from .models import Products, PriceUpdate, TrackingStatus
-from .price_update import update_all_products, get_most_recent_update_date
+from .models import (Products, PriceUpdate, PriceRollup, TrackingStatus, TrackingJob, TrackingTask, PriceAlert,
+                     AlertRule)
 
 # Custom admin view for Products
 class ProductAdminList(admin.ModelAdmin):  # Inherits from admin.ModelAdmin
     # Defines the columns that should be displayed in the admin list view
-    list_display = ('product_name', 'product_price', "date_added")
+    list_display = ('product_name', 'product_price', 'current_price', 'last_checked_at', 'next_check_at', 'status', "date_added")
     # Allows filtering of displayed products based on these fields
-    list_filter = ('product_name', 'product_price', "date_added")
+    list_filter = ('product_name', 'product_price', "date_added", 'status', 'retailer')
     # Enables a search box for these fields in the admin
-    search_fields = ('product_name', 'product_price',)
+    search_fields = ('product_name', 'product_price', 'item_id',)
 
 
 # Custom admin view for PriceUpdate
@@ -28,30 +28,89 @@ class ProductPriceAdminList(admin.ModelAdmin):  # Inherits from admin.ModelAdmin
 class TrackingStatusAdmin(admin.ModelAdmin):
     # Specifies a custom template to use for the change form of this model
     change_form_template = "admin/tracking_status_change_form.html"
-    list_display = ('is_tracking',)  # Columns to display in the admin list view for TrackingStatus
+    # Columns to display in the admin list view for TrackingStatus
+    list_display = ('is_tracking', 'scheduler_id', 'scheduler_heartbeat')
+    # Scheduler state is maintained by the run_tracker service and only shown here
+    readonly_fields = ('scheduler_id', 'scheduler_heartbeat')
+
+    def save_model(self, request, obj, form, change):
+        # Only write the fields edited in the form, so scheduler state saved meanwhile is not overwritten
+        if change:
+            obj.save(update_fields=form.changed_data)
+        else:
+            super().save_model(request, obj, form, change)
 
     def response_change(self, request, obj):
         # Customizes the response after a change has been made to a TrackingStatus object
         if "start_tracking" in request.POST:
             # If the "start_tracking" button was pressed, start tracking
             obj.is_tracking = True
-            obj.save()
-            # Run the product update function in a separate thread to avoid blocking
-            thread = threading.Thread(target=update_all_products)
-            thread.daemon = True  # Allows thread to be killed when the main thread exits
-            thread.start()
+            obj.save(update_fields=['is_tracking'])
+            # The run_tracker service picks the change up within seconds; nothing runs in the web process
             self.message_user(request, "Tracking started.")
             return HttpResponseRedirect(".")
         elif "stop_tracking" in request.POST:
             # If the "stop_tracking" button was pressed, stop tracking
             obj.is_tracking = False
-            obj.save()
+            obj.save(update_fields=['is_tracking'])
             self.message_user(request, "Tracking stopped.")
             return HttpResponseRedirect(".")
         else:
             # If neither button was pressed, just proceed with the usual response
             return super().response_change(request, obj)
 
+@admin.register(TrackingJob)
+class TrackingJobAdmin(admin.ModelAdmin):
+    # Shows the progress of each tracking pass, refreshed from its task counts on every page load
+    list_display = ('__str__', 'completion', 'throughput', 'failed_tasks', 'finished_at')
+
+    def get_queryset(self, request):
+        # Every job's task counts come with the list query instead of one query per column and row
+        return super().get_queryset(request).annotate(**{
+            f'tasks_{status}': Count('tasks', filter=Q(tasks__status=status))
+            for status, _ in TrackingTask.STATUS_CHOICES
+        })
+
+    def progress(self, obj):
+        # Computed once per row and shared by the columns
+        if not hasattr(obj, '_progress'):
+            obj._progress = obj.progress({status: getattr(obj, f'tasks_{status}')
+                                          for status, _ in TrackingTask.STATUS_CHOICES})
+        return obj._progress
+
+    def completion(self, obj):
+        progress = self.progress(obj)
+        return f"{progress['percent']:.1f}% ({progress['done'] + progress['failed']}/{progress['total']})"
+
+    def throughput(self, obj):
+        return f"{self.progress(obj)['per_minute']:.1f} products/min"
+
+    def failed_tasks(self, obj):
+        return self.progress(obj)['failed']
+
+@admin.register(PriceAlert)
+class PriceAlertAdmin(admin.ModelAdmin):
+    # Queued price drop emails, to follow delivery and spot failing addresses
+    list_display = ('product', 'user', 'old_price', 'new_price', 'reason', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    list_select_related = ('product', 'user')
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    # Per-user alert rules; products a user has no rule for alert on a DEFAULT_ALERT_DROP_PERCENT drop
+    list_display = ('user', 'product', 'kind', 'threshold', 'window_days', 'is_active')
+    list_filter = ('kind', 'is_active')
+    list_select_related = ('user', 'product')
+    search_fields = ('user__email', 'product__product_name')
+
 # Register the custom admin classes with their respective models
 admin.site.register(Products, ProductAdminList)
 admin.site.register(PriceUpdate, ProductPriceAdminList)
+
+
+@admin.register(PriceRollup)
+class PriceRollupAdmin(admin.ModelAdmin):
+    # Weekly and monthly summaries written by the compact_history job
+    list_display = ('product', 'period', 'period_start', 'min_price', 'max_price', 'close_price', 'samples')
+    list_filter = ('period',)
+    list_select_related = ('product',)
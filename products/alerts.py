@@ -0,0 +1,121 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q, Min, Avg
+from .models import PriceUpdate, PriceRollup, PriceAlert, AlertRule
+
+User = get_user_model()
+
+# Rule kinds that need statistics over the product's earlier history
+HISTORY_KINDS = {AlertRule.ALL_TIME_LOW, AlertRule.BELOW_AVERAGE}
+
+
+def default_rule():
+    # Applies to users without rules of their own: the classic "dropped by 25% or more" alert
+    return AlertRule(kind=AlertRule.PERCENT_DROP, threshold=settings.DEFAULT_ALERT_DROP_PERCENT)
+
+
+def history_stats(product_ids, current_date, windows):
+    """Return {product_id: {'low': ..., 'avg_<days>': ...}} over the history before current_date.
+
+    The all-time low and the moving average for every window are computed for all products
+    in a single aggregate query; a second one takes the lows of history rolled up by the
+    retention job into account. Averages only see the daily rows, so windows are meant to be
+    shorter than PRICE_HISTORY_DAILY_DAYS.
+    """
+    aggregates = {'low': Min('price')}
+    for days in windows:
+        aggregates[f'avg_{days}'] = Avg('price', filter=Q(dates__gte=current_date - timedelta(days=days)))
+    rows = (PriceUpdate.objects.filter(product_id__in=product_ids, dates__lt=current_date)
+            .values('product_id').order_by().annotate(**aggregates))
+    stats = {row.pop('product_id'): row for row in rows}
+    for product_id, low in (PriceRollup.objects.filter(product_id__in=product_ids).values('product_id')
+                            .order_by().annotate(low=Min('min_price')).values_list('product_id', 'low')):
+        row = stats.setdefault(product_id, {'low': None})
+        row['low'] = low if row['low'] is None else min(low, row['low'])
+    return stats
+
+
+def evaluate_rule(kind, threshold, window_days, columns, stats):
+    """Evaluate one rule over every product of a batch at once and return {product_id: reason}.
+
+    columns holds the batch as aligned lists ('id', 'price', 'previous'), so each rule kind is
+    one pass over the columns however many users share the rule.
+    """
+    ids, prices, previous = columns['id'], columns['price'], columns['previous']
+    if kind == AlertRule.ALL_TIME_LOW:
+        lows = [stats.get(product_id, {}).get('low') for product_id in ids]
+        return {product_id: f"lowest price ever, previous low {low}"
+                for product_id, price, low in zip(ids, prices, lows) if low is not None and price < low}
+    if threshold is None:
+        return {}
+    if kind == AlertRule.PERCENT_DROP:
+        return {product_id: f"down {(old - price) / old:.0%}"
+                for product_id, price, old in zip(ids, prices, previous)
+                if old and (old - price) * 100 >= threshold * old}
+    if kind == AlertRule.ABSOLUTE_DROP:
+        return {product_id: f"down {old - price}"
+                for product_id, price, old in zip(ids, prices, previous)
+                if old is not None and old - price >= threshold and old > price}
+    if kind == AlertRule.BELOW_TARGET:
+        # Alert when the price crosses the target, not on every check while it stays below
+        return {product_id: f"at or below your target of {threshold}"
+                for product_id, price, old in zip(ids, prices, previous)
+                if price <= threshold and (old is None or old > threshold)}
+    if kind == AlertRule.BELOW_AVERAGE:
+        lines = [stats.get(product_id, {}).get(f'avg_{window_days}') for product_id in ids]
+        lines = [average * (100 - threshold) / 100 if average is not None else None for average in lines]
+        return {product_id: f"{threshold}% below its {window_days}-day average"
+                for product_id, price, old, line in zip(ids, prices, previous, lines)
+                if line is not None and price <= line and (old is None or old > line)}
+    return {}
+
+
+def queue_alerts(batch, previous_prices, current_date):
+    """Evaluate every subscriber's alert rules over a batch of new prices and queue the alerts in bulk.
+
+    batch holds (product, price) and previous_prices each product's price before this check.
+    Subscriptions, rules and history statistics take one query each, every distinct rule is
+    evaluated once over the whole batch, and a subscriber gets at most one alert per product.
+    Returns the number of alerts queued.
+    """
+    columns = {
+        'id': [product.id for product, _ in batch],
+        'price': [price for _, price in batch],
+        'previous': [previous_prices.get(product.id) for product, _ in batch],
+    }
+    subscriptions = list(User.objects.filter(products__in=columns['id']).values_list('products', 'id'))
+    if not subscriptions:
+        return 0
+    rules_by_user = defaultdict(list)
+    for rule in AlertRule.objects.filter(
+        user_id__in={user_id for _, user_id in subscriptions}, is_active=True
+    ).filter(Q(product__isnull=True) | Q(product_id__in=columns['id'])):
+        rules_by_user[rule.user_id].append(rule)
+
+    fallback = default_rule()
+    rules = [rule for user_rules in rules_by_user.values() for rule in user_rules] + [fallback]
+    stats = {}
+    if any(rule.kind in HISTORY_KINDS for rule in rules):
+        windows = {rule.window_days for rule in rules if rule.kind == AlertRule.BELOW_AVERAGE}
+        stats = history_stats(columns['id'], current_date, windows)
+
+    results = {}
+    prices = dict(zip(columns['id'], zip(columns['previous'], columns['price'])))
+    alerts = []
+    for product_id, user_id in subscriptions:
+        user_rules = [rule for rule in rules_by_user.get(user_id, ()) if rule.product_id in (None, product_id)]
+        for rule in user_rules or [fallback]:
+            signature = (rule.kind, rule.threshold, rule.window_days)
+            if signature not in results:
+                results[signature] = evaluate_rule(*signature, columns, stats)
+            reason = results[signature].get(product_id)
+            if reason:
+                old_price, new_price = prices[product_id]
+                alerts.append(PriceAlert(user_id=user_id, product_id=product_id,
+                                         old_price=old_price if old_price is not None else new_price,
+                                         new_price=new_price, rule=rule if rule.pk else None, reason=reason))
+                break
+    PriceAlert.objects.bulk_create(alerts, batch_size=settings.PRICE_UPDATE_BATCH_SIZE)
+    return len(alerts)
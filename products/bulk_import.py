@@ -0,0 +1,136 @@
+import csv
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from django.conf import settings
+from django.db.models import Q
+from django.utils.timezone import now
+from trackit.db import write_atomic
+from .models import Products
+from .product_fetch import queue_fetches
+from .retailers import canonical_product
+
+# Query parameters that only track where a visitor came from and never change the product
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid')
+
+
+def normalize_url(url):
+    """Return the form of a product URL used to recognise duplicates, or None if it is not a web URL.
+
+    Surrounding whitespace, the fragment and tracking parameters are dropped and the scheme and
+    host lowercased, so the same product pasted from different places is stored once.
+    """
+    parts = urlsplit(url.strip())
+    if parts.scheme.lower() not in ('http', 'https') or not parts.hostname:
+        return None
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not key.lower().startswith(TRACKING_PARAMS)]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', urlencode(query), ''))
+
+
+def read_urls(text):
+    """Return (line number, URL) for every row of a CSV or plain text file of product URLs.
+
+    The URL is the first cell of a row containing '://'; a first row without one is taken for a
+    header and skipped, while later rows without one are returned with an empty URL.
+    """
+    rows = []
+    for line_number, row in enumerate(csv.reader(text.splitlines()), start=1):
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if not cells:
+            continue
+        url = next((cell for cell in cells if '://' in cell), '')
+        if url or line_number > 1:
+            rows.append((line_number, url or cells[0]))
+    return rows
+
+
+def import_urls(user, rows):
+    """Add the products behind a list of (line number, URL) rows to a user's list.
+
+    URLs are normalized and deduplicated by retailer item (see retailers.canonical_product), then
+    looked up among the existing products in a single query on the indexed item key. Existing
+    products are attached to the user with one bulk insert into the many-to-many table, and new
+    ones are created as pending with their fetch queued for the fetch service (manage.py
+    fetch_products), which scrapes them concurrently. Returns counts of the products attached,
+    already tracked by the user and queued, the ids of the products queued ('queued_ids'), plus
+    (line number, URL, reason) per failed row.
+    """
+    report = {'attached': 0, 'tracked': 0, 'queued': 0, 'queued_ids': [], 'duplicates': 0, 'failures': []}
+    # Each product's (retailer, item ID, canonical URL), keyed like the products table: by item, else by URL
+    products = {}
+    for line_number, url in rows:
+        normalized = normalize_url(url)
+        if normalized is None:
+            report['failures'].append((line_number, url, 'Not a web address'))
+            continue
+        retailer, item_id, normalized = canonical_product(normalized)
+        key = (retailer, item_id) if item_id else ('', normalized)
+        if not retailer:
+            report['failures'].append((line_number, url, 'Not a supported retailer'))
+        elif key in products:
+            report['duplicates'] += 1
+        elif len(products) >= settings.BULK_IMPORT_MAX_URLS:
+            report['failures'].append((line_number, url, f'Over the limit of {settings.BULK_IMPORT_MAX_URLS} URLs'))
+        else:
+            products[key] = (retailer, item_id, normalized)
+    if not products:
+        return report
+
+    existing = {_key(product): (product['id'], product['status'])
+                for product in _lookup(products).values('id', 'retailer', 'item_id', 'product_url', 'status')}
+    Subscription = Products.user.through
+    with write_atomic():
+        new_keys = [key for key in products if key not in existing]
+        created = {}
+        if new_keys:
+            new_products = {key: products[key] for key in new_keys}
+            fields = ('id', 'retailer', 'item_id', 'product_url', 'status')
+            # Products added by a concurrent add since the lookup above are existing products too
+            before = {_key(product): (product['id'], product['status'])
+                      for product in _lookup(new_products).values(*fields)}
+            Products.objects.bulk_create([
+                Products(product_url=url, retailer=retailer, item_id=item_id, product_name=url, product_img='',
+                         product_price=0, date_added=now().date(), status=Products.PENDING)
+                for retailer, item_id, url in (products[key] for key in new_keys if key not in before)
+            ], ignore_conflicts=True)
+            # Only rows whose id was not there before the insert were created by it. The transaction
+            # holds the write lock from its start, so no other add inserts between the two lookups
+            before_ids = {product_id for product_id, _ in before.values()}
+            for product in _lookup(new_products).values(*fields):
+                if product['id'] in before_ids:
+                    existing[_key(product)] = (product['id'], product['status'])
+                else:
+                    created[_key(product)] = product['id']
+        product_ids = [product_id for product_id, _ in existing.values()] + list(created.values())
+        tracked = set(Subscription.objects.filter(user_accounts=user, products_id__in=product_ids)
+                      .values_list('products_id', flat=True))
+        Subscription.objects.bulk_create([
+            Subscription(user_accounts=user, products_id=product_id)
+            for product_id in product_ids if product_id not in tracked
+        ], ignore_conflicts=True)
+        # New products, and existing ones whose last fetch failed, get a fetch queued
+        to_fetch = list(created.values()) + [product_id for product_id, status in existing.values()
+                                              if status == Products.FAILED]
+        # Products a concurrent fetch made active in the meantime are not queued again
+        queued = queue_fetches(to_fetch) if to_fetch else []
+    report['tracked'] = len(tracked)
+    report['attached'] = len(product_ids) - len(tracked)
+    report['queued'] = len(queued)
+    report['queued_ids'] = queued
+    return report
+
+
+def _key(product):
+    # The key import_urls gives a product, from its values() row
+    return (product['retailer'], product['item_id']) if product['item_id'] else ('', product['product_url'])
+
+
+def _lookup(products):
+    # One query for the products with the given keys: indexed item matches per retailer, plus URL matches
+    condition = Q(product_url__in=[url for (retailer, item_id), (_, _, url) in products.items() if not retailer])
+    item_ids = {}
+    for retailer, item_id in products:
+        if retailer:
+            item_ids.setdefault(retailer, []).append(item_id)
+    for retailer, ids in item_ids.items():
+        condition |= Q(retailer=retailer, item_id__in=ids)
+    return Products.objects.filter(condition)
@@ -0,0 +1,222 @@
+import codecs
+import logging
+from collections import namedtuple
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+from django.conf import settings
+from trackit import metrics
+
+try:
+    # lxml is optional; its backend is only offered when the package is installed
+    import lxml.html
+except ImportError:
+    lxml = None
+
+logger = logging.getLogger(__name__)
+
+# Extraction rules describe each field to pull out of a product page:
+# tag     - element name to match
+# classes - list of alternative class sets; the element must carry every class of one set
+# inside  - optional (tag, classes) an enclosing element must match
+# attr    - attribute to read; the element's stripped text is used when omitted
+
+# Elements that never have a closing tag and so never enclose other elements
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr',
+}
+
+# Size of the chunks fed to the streaming parser
+STREAM_CHUNK_SIZE = 16384
+
+
+# A field rule compiled once into the forms every backend needs
+Rule = namedtuple('Rule', 'field tag class_sets inside attr css xpath inside_css inside_xpath')
+
+
+def _matches(tag, classes, rule_tag, rule_classes):
+    return tag == rule_tag and any(required <= classes for required in rule_classes)
+
+
+def _css_selector(tag, class_sets):
+    return ', '.join(tag + ''.join('.' + name for name in sorted(required)) for required in class_sets)
+
+
+def _xpath(tag, class_sets, prefix='//'):
+    def has_classes(required):
+        return ' and '.join(f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')" for name in sorted(required))
+    return ' | '.join(f'{prefix}{tag}[{has_classes(required)}]' if required else f'{prefix}{tag}'
+                      for required in class_sets)
+
+
+def compile_rules(fields):
+    """Turn a dict of field rules into Rule tuples with selectors precomputed for every backend."""
+    rules = []
+    for field, rule in fields.items():
+        class_sets = [frozenset(alternative.split()) for alternative in rule['classes']]
+        inside = None
+        inside_css = inside_xpath = None
+        if rule.get('inside'):
+            inside_tag, inside_classes = rule['inside']
+            inside = (inside_tag, [frozenset(inside_classes.split())])
+            inside_css = _css_selector(*inside)
+            inside_xpath = _xpath(*inside)
+        rules.append(Rule(
+            field=field,
+            tag=rule['tag'],
+            class_sets=class_sets,
+            inside=inside,
+            attr=rule.get('attr'),
+            css=_css_selector(rule['tag'], class_sets),
+            xpath=_xpath(rule['tag'], class_sets, './/' if inside else '//'),
+            inside_css=inside_css,
+            inside_xpath=inside_xpath,
+        ))
+    return tuple(rules)
+
+
+def extract_with_soup(content, rules):
+    # Reference backend: build the full BeautifulSoup tree and query it with CSS selectors
+    soup = BeautifulSoup(content, 'html.parser')
+    results = {}
+    for rule in rules:
+        if rule.inside:
+            container = soup.select_one(rule.inside_css)
+            element = container.select_one(rule.css) if container else None
+        else:
+            element = soup.select_one(rule.css)
+        if element is None:
+            results[rule.field] = None
+        elif rule.attr:
+            results[rule.field] = element.get(rule.attr)
+        else:
+            results[rule.field] = element.get_text(strip=True)
+    return results
+
+
+def extract_with_lxml(content, rules):
+    # C-backed backend: lxml builds its tree far faster than html.parser and is queried with XPath
+    tree = lxml.html.document_fromstring(content, parser=lxml.html.HTMLParser(encoding='utf-8'))
+    results = {}
+    for rule in rules:
+        if rule.inside:
+            containers = tree.xpath(rule.inside_xpath)
+            elements = containers[0].xpath(rule.xpath) if containers else []
+        else:
+            elements = tree.xpath(rule.xpath)
+        if not elements:
+            results[rule.field] = None
+        elif rule.attr:
+            results[rule.field] = elements[0].get(rule.attr)
+        else:
+            results[rule.field] = ''.join(text.strip() for text in elements[0].itertext())
+    return results
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _StreamingExtractor(HTMLParser):
+    # Tracks only the stack of open elements and stops as soon as every field has been found
+    def __init__(self, rules):
+        super().__init__(convert_charrefs=True)
+        self.rules = rules
+        self.results = {}
+        self.stack = []
+        # field -> [stack depth of the matched element, collected text parts]
+        self.capturing = {}
+
+    def _inside(self, container):
+        tag, class_sets = container
+        return any(_matches(open_tag, open_classes, tag, class_sets) for open_tag, open_classes in self.stack)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = set((attrs.get('class') or '').split())
+        for rule in self.rules:
+            if rule.field in self.results or rule.field in self.capturing:
+                continue
+            if not _matches(tag, classes, rule.tag, rule.class_sets):
+                continue
+            if rule.inside and not self._inside(rule.inside):
+                continue
+            if rule.attr:
+                self.results[rule.field] = attrs.get(rule.attr)
+            else:
+                self.capturing[rule.field] = [len(self.stack), []]
+        if tag not in VOID_ELEMENTS:
+            self.stack.append((tag, classes))
+        self._check_done()
+
+    def handle_endtag(self, tag):
+        # Close the most recent open element with this name, tolerating unbalanced markup
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                del self.stack[index:]
+                break
+        else:
+            return
+        for field, (depth, parts) in list(self.capturing.items()):
+            if depth >= len(self.stack):
+                self.results[field] = ''.join(parts)
+                del self.capturing[field]
+        self._check_done()
+
+    def handle_data(self, data):
+        for _, parts in self.capturing.values():
+            stripped = data.strip()
+            if stripped:
+                parts.append(stripped)
+
+    def _check_done(self):
+        if len(self.results) == len(self.rules):
+            raise _StopParsing
+
+
+def extract_streaming(content, rules):
+    # Partial parse: feed the page in chunks and stop right after the last wanted element closes
+    parser = _StreamingExtractor(rules)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    try:
+        for start in range(0, len(content), STREAM_CHUNK_SIZE):
+            parser.feed(decoder.decode(content[start:start + STREAM_CHUNK_SIZE]))
+        parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+    except _StopParsing:
+        pass
+    results = {rule.field: parser.results.get(rule.field) for rule in rules}
+    # Elements still open at the end of the page keep whatever text was collected
+    for field, (_, parts) in parser.capturing.items():
+        results[field] = ''.join(parts)
+    return results
+
+
+# Available extraction backends by name
+BACKENDS = {
+    'streaming': extract_streaming,
+    'soup': extract_with_soup,
+}
+if lxml is not None:
+    BACKENDS['lxml'] = extract_with_lxml
+
+
+def extract(content, rules, backend=None):
+    """Extract raw field values from a page with the configured backend.
+
+    rules may be compiled Rule tuples or a dict of field rules, which is compiled on the fly.
+
+    Falls back to the BeautifulSoup backend if the fast backend fails or finds no price.
+    """
+    if isinstance(rules, dict):
+        rules = compile_rules(rules)
+    backend = backend or getattr(settings, 'EXTRACTION_BACKEND', 'streaming')
+    extractor = BACKENDS.get(backend, extract_with_soup)
+    if extractor is not extract_with_soup:
+        try:
+            results = extractor(content, rules)
+            if results.get('price'):
+                return results
+        except Exception as e:
+            logger.warning("%s extraction failed, falling back to BeautifulSoup: %s", backend, e)
+            metrics.inc('trackit_extraction_fallbacks_total', backend=backend)
+    return extract_with_soup(content, rules)
@@ -0,0 +1,115 @@
+from itertools import chain
+from django.conf import settings
+from django.core.cache import cache
+from .models import PriceUpdate, PriceRollup
+from .price_series import get_daily_series
+
+
+def downsample_lttb(dates, prices, threshold):
+    """Reduce a price series to at most threshold points with Largest-Triangle-Three-Buckets.
+
+    LTTB keeps the first and last points and, from each bucket in between, the point that forms
+    the largest triangle with its neighbours, so spikes and drops survive the reduction.
+    """
+    count = len(prices)
+    if threshold >= count or threshold < 3:
+        return list(dates), list(prices)
+    xs = [d.toordinal() for d in dates]
+    bucket_size = (count - 2) / (threshold - 2)
+    selected = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        # Average of the next bucket is the third corner of the triangle
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, count)
+        next_span = range(next_start, next_end) if next_end > next_start else range(count - 1, count)
+        avg_x = sum(xs[i] for i in next_span) / len(next_span)
+        avg_y = sum(prices[i] for i in next_span) / len(next_span)
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((xs[previous] - avg_x) * (prices[i] - prices[previous])
+                       - (xs[previous] - xs[i]) * (avg_y - prices[previous]))
+            if area > best_area:
+                best, best_area = i, area
+        selected.append(best)
+        previous = best
+    selected.append(count - 1)
+    return [dates[i] for i in selected], [prices[i] for i in selected]
+
+
+def history_version(product):
+    # Changes whenever the tracker checks the product or compaction rewrites its history, so it can
+    # key caches and ETags of its history
+    checked = product.last_checked_at.timestamp() if product.last_checked_at else 'never'
+    return f'{checked}:{product.history_revision}'
+
+
+def _chart_cache_key(product, max_points):
+    return f'chart:{product.id}:{max_points}:{history_version(product)}'
+
+
+def history_points(product_id, start=None, end=None, before=None, limit=None):
+    """Return up to limit (date, price) points of a product's history in the date range, newest first.
+
+    The daily PriceUpdate rows come first. History the retention job rolled up is always older
+    than them and continues the list with the close of each week or month, dated by its first day.
+    """
+    rows = PriceUpdate.objects.filter(product_id=product_id)
+    rollups = PriceRollup.objects.filter(product_id=product_id)
+    for lookup, value in (('gte', start), ('lte', end), ('lt', before)):
+        if value:
+            rows = rows.filter(**{f'dates__{lookup}': value})
+            rollups = rollups.filter(**{f'period_start__{lookup}': value})
+    points = list(rows.order_by('-dates', '-id').values_list('dates', 'price')[:limit])
+    if limit is None or len(points) < limit:
+        rollups = rollups.order_by('-period_start').values_list('period_start', 'close_price')
+        points += rollups[:limit - len(points)] if limit is not None else rollups
+    return points
+
+
+def get_chart_histories(products, max_points=None):
+    """Return {product_id: (dates, prices)} of downsampled chart data for the given products.
+
+    Cached charts are fetched in one cache round trip, and every product missing from the cache
+    is loaded with a single query, so the cost does not grow with the product count. With
+    PRICE_HISTORY_BACKEND = 'series' the charts are drawn from the dense daily price series
+    instead of the PriceUpdate rows.
+    """
+    max_points = max_points or settings.CHART_MAX_POINTS
+    keys = {_chart_cache_key(product, max_points): product.id for product in products}
+    histories = {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+    missing = [product_id for product_id in keys.values() if product_id not in histories]
+    if missing:
+        if settings.PRICE_HISTORY_BACKEND == 'series':
+            series = get_daily_series(missing)
+        else:
+            series = {product_id: ([], []) for product_id in missing}
+            # Rolled-up weeks and months are older than every daily row, so they start each series
+            rollups = (PriceRollup.objects.filter(product_id__in=missing).order_by('product_id', 'period_start')
+                       .values_list('product_id', 'period_start', 'close_price'))
+            updates = (PriceUpdate.objects.filter(product_id__in=missing)
+                       .order_by('product_id', 'dates', 'id')
+                       .values_list('product_id', 'dates', 'price'))
+            for product_id, dates, price in chain(rollups.iterator(), updates.iterator()):
+                series[product_id][0].append(dates)
+                series[product_id][1].append(price)
+        fresh = {product_id: downsample_lttb(dates, prices, max_points)
+                 for product_id, (dates, prices) in series.items()}
+        cache.set_many({key: fresh[product_id] for key, product_id in keys.items() if product_id in fresh})
+        histories.update(fresh)
+    return histories
+
+
+def encode_series(dates, prices):
+    """Delta-encode a series for the history API.
+
+    The first date is sent in full as 'start'; 'days' holds the day offset of each point from
+    the previous one and 'prices' the first price followed by the change from each previous price.
+    """
+    if not dates:
+        return {'start': None, 'days': [], 'prices': []}
+    days = [0] + [(dates[i] - dates[i - 1]).days for i in range(1, len(dates))]
+    deltas = [prices[0]] + [prices[i] - prices[i - 1] for i in range(1, len(prices))]
+    return {'start': str(dates[0]), 'days': days, 'prices': deltas}
@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from django.db import connection, connections
+
+
+@contextmanager
+def throwaway_database(settings_dict=None):
+    """Run the enclosed block of a benchmark command against a fresh, empty test database.
+
+    SQLite databases are created on disk in a temporary directory, so commits and reads cost what
+    they do in production and worker processes or threads can share the file; the directory is
+    yielded (None on other databases). settings_dict overrides entries of the connection's settings,
+    such as ENGINE or OPTIONS, for the run; connections opened by other threads pick them up too.
+    """
+    directory = None
+    saved = dict(connection.settings_dict)
+    connection.settings_dict.update(settings_dict or {})
+    if connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp(prefix='trackit-bench-')
+        connection.settings_dict['TEST'] = {**connection.settings_dict['TEST'],
+                                            'NAME': os.path.join(directory, 'bench.sqlite3')}
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield directory
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict.clear()
+        connection.settings_dict.update(saved)
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,140 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, OperationalError
+from django.test import Client
+from products.management.bench import throwaway_database
+from products.models import Products, PriceUpdate
+from products.price_update import write_price_updates
+
+User = get_user_model()
+
+# SQLite as Django configures it out of the box: Django's own backend, so no pragmas and no BEGIN
+# IMMEDIATE from write_atomic(); rollback journal, deferred transactions and a 5 second timeout
+SQLITE_BASELINE = {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {'timeout': 5}}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ("Load test the database: tracker threads write price batches while dashboard users read, "
+            "in a throwaway database")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help="Number of synthetic products")
+        parser.add_argument('--users', type=int, default=20, help="Number of dashboard users")
+        parser.add_argument('--writers', type=int, default=2, help="Concurrent tracker writer threads")
+        parser.add_argument('--readers', type=int, default=4, help="Concurrent dashboard reader threads")
+        parser.add_argument('--batch-size', type=int, default=100, help="Prices written per tracker transaction")
+        parser.add_argument('--scrape-seconds', type=float, default=0.2,
+                            help="Seconds each writer spends \"scraping\" between two batches")
+        parser.add_argument('--seconds', type=float, default=10, help="Duration of each run")
+        parser.add_argument('--baseline', action='store_true',
+                            help="With SQLite, first run against Django's default SQLite settings for comparison")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'database':<16} {'writes/s':>9} {'write p95':>10} {'reads/s':>8} "
+                          f"{'read p50':>9} {'read p95':>9} {'errors':>7}")
+        if options['baseline'] and connection.vendor == 'sqlite':
+            self.run_load(options, 'sqlite default', SQLITE_BASELINE)
+        self.run_load(options, f'{connection.vendor} tuned')
+
+    def run_load(self, options, label, database=None):
+        # A fresh database per run; SQLite keeps its journal mode in the file, so each run gets its own.
+        # The worker threads open their own connections, from the settings of the run
+        with throwaway_database(database):
+            products, users = self.populate(options)
+            stop = threading.Event()
+            results = {'writes': [], 'reads': [], 'errors': []}
+            lock = threading.Lock()
+
+            def record(kind, started):
+                with lock:
+                    results[kind].append(time.perf_counter() - started)
+
+            def writer(seed):
+                # Tracker passes: batches of scraped prices saved in one transaction each
+                rng = random.Random(seed)
+                try:
+                    while not stop.is_set():
+                        batch = [(product, rng.randint(500, 5000))
+                                 for product in rng.sample(products, min(options['batch_size'], len(products)))]
+                        started = time.perf_counter()
+                        try:
+                            write_price_updates(batch, date.today())
+                            record('writes', started)
+                        except OperationalError as e:
+                            with lock:
+                                results['errors'].append(f'write: {e}')
+                        stop.wait(options['scrape_seconds'])
+                finally:
+                    connections.close_all()
+
+            def reader(seed):
+                # Dashboard users: the dashboard page and a page of one product's history
+                rng = random.Random(seed)
+                client = Client(SERVER_NAME='localhost')
+                user = rng.choice(users)
+                client.force_login(user)
+                product_ids = list(user.products_set.values_list('id', flat=True))
+                try:
+                    while not stop.is_set():
+                        url = ('/dashboard/' if rng.random() < 0.5
+                               else f'/products/{rng.choice(product_ids)}/history/?limit=30')
+                        started = time.perf_counter()
+                        try:
+                            status = client.get(url).status_code
+                            if status == 200:
+                                record('reads', started)
+                            else:
+                                with lock:
+                                    results['errors'].append(f'read: HTTP {status}')
+                        except OperationalError as e:
+                            with lock:
+                                results['errors'].append(f'read: {e}')
+                finally:
+                    connections.close_all()
+
+            threads = ([threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+                       + [threading.Thread(target=reader, args=(100 + i,)) for i in range(options['readers'])])
+            for thread in threads:
+                thread.start()
+            time.sleep(options['seconds'])
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+            seconds = options['seconds']
+            writes, reads = results['writes'], results['reads']
+            self.stdout.write(f"{label:<16} {len(writes) * options['batch_size'] / seconds:>9.0f} "
+                              f"{percentile(writes, 0.95) * 1000:>8.0f}ms {len(reads) / seconds:>8.1f} "
+                              f"{percentile(reads, 0.5) * 1000:>7.0f}ms {percentile(reads, 0.95) * 1000:>7.0f}ms "
+                              f"{len(results['errors']):>7}")
+            for error in sorted(set(results['errors']))[:3]:
+                self.stdout.write(f"  {error}")
+
+    def populate(self, options):
+        # Products with a month of history, each user tracking a share of them
+        first_day = date.today() - timedelta(days=30)
+        products = Products.objects.bulk_create([
+            Products(product_name=f'Product {i}', product_url=f'https://www.flipkart.com/p/{i}',
+                     product_img='https://example.com/img.jpg', product_price=1000, date_added=first_day)
+            for i in range(options['products'])
+        ])
+        PriceUpdate.objects.bulk_create([
+            PriceUpdate(product=product, dates=first_day + timedelta(days=day), price=1000)
+            for product in products for day in range(30)
+        ], batch_size=5000)
+        users = [User.objects.create_user(email=f'user{i}@example.com', password='bench') for i in range(options['users'])]
+        rng = random.Random(0)
+        for user in users:
+            user.products_set.add(*rng.sample(products, min(20, len(products))))
+        return products, users
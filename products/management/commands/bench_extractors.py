@@ -0,0 +1,51 @@
+import time
+import tracemalloc
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from products.extractors import BACKENDS
+from products.retailers import RETAILERS
+
+
+class Command(BaseCommand):
+    help = "Compare parse time and peak memory per page of the extraction backends over saved product pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('pages', help="Directory of saved product pages (*.html)")
+        parser.add_argument('--repeat', type=int, default=5, help="Times each page is parsed per backend")
+
+    def handle(self, *args, **options):
+        pages = sorted(Path(options['pages']).glob('*.html'))
+        if not pages:
+            raise CommandError(f"No .html pages found in {options['pages']}")
+
+        # Pick each page's extraction rules from the retailer whose price marker it contains
+        samples = []
+        for path in pages:
+            content = path.read_bytes()
+            retailer = next((r for r in RETAILERS.values() if r.fingerprint_marker in content), None)
+            if retailer is None:
+                self.stderr.write(f"Skipping {path.name}: not a page of any registered retailer")
+                continue
+            samples.append((path.name, content, retailer.rules))
+
+        self.stdout.write(f"{'backend':<10} {'pages':>5} {'ms/page':>9} {'peak KiB/page':>14} {'prices found':>13}")
+        for name, extractor in BACKENDS.items():
+            total_seconds = 0.0
+            total_peak = 0
+            found = 0
+            for _, content, rules in samples:
+                # Time the repeated parses, then measure peak allocations of a single parse separately
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    results = extractor(content, rules)
+                total_seconds += (time.perf_counter() - started) / options['repeat']
+                tracemalloc.start()
+                extractor(content, rules)
+                total_peak += tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                found += 1 if results.get('price') else 0
+            count = len(samples)
+            self.stdout.write(f"{name:<10} {count:>5} {total_seconds / count * 1000:>9.2f} "
+                              f"{total_peak / count / 1024:>14.1f} {found:>13}")
+        # tracemalloc only sees allocations made through Python's allocator
+        self.stdout.write("Peak memory excludes memory allocated directly by C libraries such as lxml.")
@@ -0,0 +1,82 @@
+import random
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from products.management.bench import throwaway_database
+from products.models import Products, PriceUpdate, PriceSeries
+from products.price_series import build_series, get_daily_series
+
+
+def table_bytes(model):
+    # Bytes on disk of a model's table and its indexes, from SQLite's dbstat table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = %s OR name IN "
+                       "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                       [model._meta.db_table, model._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = "Compare storage size and read latency of PriceUpdate rows and compact price series in a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help="Number of synthetic products")
+        parser.add_argument('--days', type=int, default=730, help="Days of daily price history per product")
+        parser.add_argument('--change-rate', type=float, default=0.05,
+                            help="Chance that a product's price changes from one day to the next")
+        parser.add_argument('--reads', type=int, default=100, help="Products whose full history is read per sample")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The storage comparison reads SQLite's dbstat table; run it with the SQLite database")
+        count, days = options['products'], options['days']
+        # A fresh on-disk test database, so sizes and reads cost what they do in production
+        with throwaway_database():
+            first_day = date.today() - timedelta(days=days)
+            products = Products.objects.bulk_create([
+                Products(product_name=f'Product {i}', product_url=f'https://www.flipkart.com/p/{i}',
+                         product_img='https://example.com/img.jpg', product_price=1000, date_added=first_day)
+                for i in range(count)
+            ])
+            # Daily checks; each day a few products change price, the rest hold
+            random.seed(0)
+            for product in products:
+                price, rows = random.randint(500, 50000), []
+                for day in range(days):
+                    if random.random() < options['change_rate']:
+                        price = max(1, price + random.randint(-price // 5, price // 5))
+                    rows.append(PriceUpdate(product=product, dates=first_day + timedelta(days=day), price=price))
+                PriceUpdate.objects.bulk_create(rows)
+
+            started = time.perf_counter()
+            product_ids = [product.id for product in products]
+            for start in range(0, count, 500):
+                build_series(product_ids[start:start + 500])
+            build_seconds = time.perf_counter() - started
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM")
+
+            sample = random.sample(product_ids, min(options['reads'], count))
+            # Before: every row of the products' histories through the ORM
+            started = time.perf_counter()
+            rows = list(PriceUpdate.objects.filter(product_id__in=sample)
+                        .order_by('product_id', 'dates', 'id').values_list('product_id', 'dates', 'price'))
+            rows_seconds = time.perf_counter() - started
+            # After: one row per product, expanded into dense daily series
+            started = time.perf_counter()
+            series = get_daily_series(sample)
+            series_seconds = time.perf_counter() - started
+            points = sum(len(prices) for _, prices in series.values())
+
+            runs = sum(PriceSeries.objects.values_list('runs', flat=True))
+            self.stdout.write(f"{count} products x {days} days, {runs} runs after encoding "
+                              f"(series built in {build_seconds:.2f}s)")
+            self.stdout.write(f"{'store':<8} {'rows':>9} {'bytes':>12} {'bytes/day':>10} "
+                              f"{'read points':>12} {'read ms':>9}")
+            for name, model, row_count, read_points, seconds in (
+                    ('rows', PriceUpdate, PriceUpdate.objects.count(), len(rows), rows_seconds),
+                    ('series', PriceSeries, PriceSeries.objects.count(), points, series_seconds)):
+                size = table_bytes(model)
+                self.stdout.write(f"{name:<8} {row_count:>9} {size:>12} {size / (count * days):>10.2f} "
+                                  f"{read_points:>12} {seconds * 1000:>9.1f}")
@@ -0,0 +1,48 @@
+import time
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from products.management.bench import throwaway_database
+from products.models import Products, PriceUpdate
+from products.price_update import write_price_updates
+
+
+class Command(BaseCommand):
+    help = "Compare query count and wall time of per-row and batched price update writes in a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help="Number of synthetic products")
+
+    def handle(self, *args, **options):
+        count = options['products']
+        # Run against a fresh test database, kept on disk for SQLite so commits cost what they do in production
+        with throwaway_database():
+            yesterday = date.today() - timedelta(days=1)
+            products = Products.objects.bulk_create([
+                Products(product_name=f'Product {i}', product_url=f'https://www.flipkart.com/p/{i}',
+                         product_img='https://example.com/img.jpg', product_price=1000, date_added=yesterday)
+                for i in range(count)
+            ])
+            PriceUpdate.objects.bulk_create([PriceUpdate(product=p, dates=yesterday, price=1000) for p in products])
+
+            self.stdout.write(f"{'path':<10} {'products':>8} {'queries':>8} {'seconds':>9}")
+            # Before: one INSERT (and autocommit) plus one "previous price" query per product
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for product in products:
+                    PriceUpdate.objects.create(product=product, dates=date.today(), price=900)
+                    PriceUpdate.objects.filter(product=product).order_by('-dates').exclude(dates=date.today()).first()
+                elapsed = time.perf_counter() - started
+            self.stdout.write(f"{'per-row':<10} {count:>8} {len(queries):>8} {elapsed:>9.2f}")
+            PriceUpdate.objects.filter(dates=date.today()).delete()
+
+            # After: buffered batches, each with one bulk INSERT and one previous-price query
+            batch_size = settings.PRICE_UPDATE_BATCH_SIZE
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for start in range(0, count, batch_size):
+                    write_price_updates([(p, 900) for p in products[start:start + batch_size]], date.today())
+                elapsed = time.perf_counter() - started
+            self.stdout.write(f"{'batched':<10} {count:>8} {len(queries):>8} {elapsed:>9.2f}")
@@ -0,0 +1,145 @@
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from products.management.bench import throwaway_database
+from products.models import Products, TrackingStatus, TrackingTask
+from products.retailers import Retailer, RETAILERS, register
+from products.scheduler import run_worker
+from products.work_queue import create_job
+
+# Product page served by the stub retailer: the price block is surrounded by enough markup to make parsing count
+STUB_PAGE = ('<html><head><title>Stub product</title></head><body>'
+             + '<div class="filler">Specifications and reviews</div>' * 2000
+             + '<span class="B_NuCI">Stub product {id}</span><div class="_30jeq3 _16Jk6d">&#8377;1,299</div>'
+             + '<img class="_396cs4 _2amPTt _3qGmMb" src="https://example.com/{id}.jpg">'
+             + '<div class="filler">Similar products</div>' * 2000
+             + '</body></html>')
+
+
+def register_stub_retailer():
+    # The stub server is reached as 127.0.0.1 and uses Flipkart's markup
+    flipkart = RETAILERS['flipkart']
+    register(Retailer(name='stub', domains=['127.0.0.1'], fields=flipkart.fields,
+                      fingerprint_marker=flipkart.fingerprint_marker.decode(),
+                      limits={'max_concurrency': 4, 'request_budget': None, 'min_interval': 0}))
+
+
+def start_stub_server(latency):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # Simulate the retailer's response time, then serve a page priced like a Flipkart product
+            time.sleep(latency)
+            body = STUB_PAGE.replace('{id}', self.path.rsplit('/', 1)[-1]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Command(BaseCommand):
+    help = ("Measure tracking throughput with 1 to N worker processes sharing the queue, "
+            "against a local stub retailer in a throwaway database")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help="Number of synthetic products")
+        parser.add_argument('--processes', default='1,2,4,8', help="Comma-separated worker process counts")
+        parser.add_argument('--latency', type=float, default=0.05, help="Seconds the stub server takes per page")
+        parser.add_argument('--batch-size', type=int, default=50, help="Products claimed from the queue at a time")
+        parser.add_argument('--global-interval', type=float, default=None,
+                            help="Shared minimum seconds between stub requests across all workers")
+        # Used by the benchmark to start its own worker processes
+        parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+        parser.add_argument('--database', help=argparse.SUPPRESS)
+        parser.add_argument('--ready-dir', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.run_benchmark_worker(options)
+        else:
+            self.run_benchmark(options)
+
+    def run_benchmark(self, options):
+        counts = [int(count) for count in options['processes'].split(',')]
+        server = start_stub_server(options['latency'])
+        # Worker processes share the throwaway database, so it has to live in a file
+        try:
+            with throwaway_database() as directory:
+                self.run_passes(options, counts, server.server_address[1], directory)
+        finally:
+            server.shutdown()
+
+    def run_passes(self, options, counts, port, directory):
+        with connection.cursor() as cursor:
+            # Let the workers read while one of them writes
+            cursor.execute('PRAGMA journal_mode=WAL')
+        Products.objects.bulk_create([
+            Products(product_name=f'Product {i}', product_url=f'http://127.0.0.1:{port}/p/{i}',
+                     product_img='https://example.com/img.jpg', product_price=1299, date_added=date.today())
+            for i in range(options['products'])
+        ])
+        TrackingStatus.objects.create(is_tracking=False)
+
+        self.stdout.write(f"{'processes':>9} {'products':>8} {'failed':>6} {'seconds':>8} "
+                          f"{'products/min':>13} {'speedup':>8}")
+        baseline = None
+        for count in counts:
+            # Every product is due again for each pass, however recently the previous one checked it
+            Products.objects.update(next_check_at=None)
+            job = create_job()
+            elapsed = self.run_workers(count, options, port, directory)
+            done = job.tasks.filter(status=TrackingTask.DONE).count()
+            failed = job.tasks.filter(status=TrackingTask.FAILED).count()
+            per_minute = done / elapsed * 60
+            baseline = baseline or per_minute
+            self.stdout.write(f"{count:>9} {done:>8} {failed:>6} {elapsed:>8.2f} "
+                              f"{per_minute:>13.0f} {per_minute / baseline:>7.2f}x")
+
+    def run_workers(self, count, options, port, directory):
+        # Start the workers with tracking paused and time the pass from when they are all ready
+        TrackingStatus.objects.update(is_tracking=False)
+        ready_dir = tempfile.mkdtemp(dir=directory)
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_workers', '--worker',
+                   '--database', connection.settings_dict['NAME'], '--ready-dir', ready_dir,
+                   '--batch-size', str(options['batch_size'])]
+        if options['global_interval']:
+            command += ['--global-interval', str(options['global_interval'])]
+        children = [subprocess.Popen(command, stdout=subprocess.DEVNULL) for _ in range(count)]
+        while len(os.listdir(ready_dir)) < count:
+            time.sleep(0.05)
+        started = time.perf_counter()
+        TrackingStatus.objects.update(is_tracking=True)
+        for child in children:
+            child.wait()
+        return time.perf_counter() - started
+
+    def run_benchmark_worker(self, options):
+        connection.close()
+        connection.settings_dict['NAME'] = options['database']
+        register_stub_retailer()
+        settings.SCRAPE_GLOBAL_MIN_INTERVAL = {'stub': options['global_interval']} if options['global_interval'] else {}
+        # The workers of a pass share one page cache file, as they do in production; each pass starts empty
+        settings.PAGE_CACHE_PATH = options['ready_dir'] + '.page_cache.json'
+        settings.TRACKER_POLL_SECONDS = 0.05
+        # Only problems are reported; progress lines of several workers would bury the results table
+        logging.getLogger('products').setLevel(logging.WARNING)
+        open(os.path.join(options['ready_dir'], str(os.getpid())), 'w').close()
+        run_worker(poll_seconds=0.05, batch_size=options['batch_size'], once=True)
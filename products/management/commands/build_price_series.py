@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.models import Products, PriceUpdate
+from products.price_series import build_series
+
+
+class Command(BaseCommand):
+    help = "Build the compact price series of every product (or the given ones) from its PriceUpdate rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int, help="Only rebuild these products")
+        parser.add_argument('--batch-size', type=int, default=settings.PRICE_UPDATE_BATCH_SIZE,
+                            help="Products rebuilt per query and transaction")
+
+    def handle(self, *args, **options):
+        products = Products.objects.order_by('id')
+        if options['product_ids']:
+            products = products.filter(id__in=options['product_ids'])
+        # Walk the catalog in id order, one batch of products at a time, so memory stays bounded
+        built, last_id = 0, 0
+        total = PriceUpdate.objects.filter(product__in=products).count()
+        while True:
+            product_ids = list(products.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not product_ids:
+                break
+            built += build_series(product_ids)
+            last_id = product_ids[-1]
+            self.stdout.write(f"Built {built} series (up to product #{last_id})")
+        self.stdout.write(f"Built {built} price series from {total} price updates")
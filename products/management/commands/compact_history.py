@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+from products.retention import compact_history
+from products.scheduler import install_stop_handlers
+
+
+class Command(BaseCommand):
+    help = "Run the price history retention job: roll daily prices older than the retention window up into weeks and months"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.PRICE_HISTORY_COMPACTION_BATCH_SIZE,
+                            help="Products compacted per transaction")
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help="Seconds between transactions, leaving the database to the tracker")
+        parser.add_argument('--interval', type=int, default=settings.PRICE_HISTORY_COMPACTION_INTERVAL,
+                            help="Seconds between runs")
+        parser.add_argument('--once', action='store_true', help="Compact the history once, then exit")
+
+    def handle(self, *args, **options):
+        stop = install_stop_handlers()
+        while not stop.is_set():
+            stats = compact_history(now().date(), options['batch_size'], options['pause'],
+                                    should_continue=lambda: not stop.is_set())
+            self.stdout.write(f"Rolled {stats['rows']} price updates up into {stats['rollups']} weekly "
+                              f"and monthly rollups")
+            if options['once']:
+                break
+            stop.wait(options['interval'])
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.models import ProductFetch
+from products.product_fetch import run_fetches
+from products.profiling import save_metrics
+from products.scheduler import install_stop_handlers, worker_name
+
+
+class Command(BaseCommand):
+    help = "Run the fetch service that scrapes the details and first price of products added from the dashboard"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=settings.PRODUCT_FETCH_POLL_SECONDS,
+                            help="Seconds between checks for queued fetches")
+        parser.add_argument('--once', action='store_true', help="Fetch the queued products, then exit")
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        stop = install_stop_handlers()
+        while not stop.is_set():
+            stats = run_fetches(worker)
+            if any(stats.values()):
+                self.stdout.write(f"Fetched {stats['fetched']} products, {stats['retried']} to retry, "
+                                  f"{stats['failed']} failed, {ProductFetch.objects.count()} queued")
+                # Publish the scrape counters and timings to the metrics endpoint
+                save_metrics(worker)
+            if options['once']:
+                break
+            stop.wait(options['poll'])
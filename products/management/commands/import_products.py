@@ -0,0 +1,53 @@
+import sys
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from products.bulk_import import import_urls, read_urls
+from products.models import Products, ProductFetch
+from products.product_fetch import run_fetches
+from products.scheduler import worker_name
+
+
+class Command(BaseCommand):
+    help = "Add the product URLs listed in a CSV or text file (one per row) to a user's tracked products"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV or text file of product URLs, or - to read standard input")
+        parser.add_argument('--user', required=True, help="Email of the user the products are added for")
+        parser.add_argument('--wait', action='store_true',
+                            help="Fetch the new products now and report their progress, instead of leaving "
+                                 "them to the fetch service")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user with email {options['user']}")
+        if options['file'] == '-':
+            text = sys.stdin.read()
+        else:
+            try:
+                with open(options['file'], encoding='utf-8-sig', errors='replace') as f:
+                    text = f.read()
+            except OSError as e:
+                raise CommandError(f"Can't read {options['file']}: {e}")
+
+        rows = read_urls(text)
+        report = import_urls(user, rows)
+        for line_number, url, reason in report['failures']:
+            self.stderr.write(f"Line {line_number}: {reason} ({url})")
+        self.stdout.write(f"Read {len(rows)} rows: {report['attached']} products added, {report['tracked']} "
+                          f"already tracked, {report['duplicates']} duplicates, {len(report['failures'])} failed; "
+                          f"{report['queued']} queued for fetching")
+        if not options['wait'] or not report['queued']:
+            return
+
+        # Fetch the queue here, alongside any running fetch service, reporting progress after each batch
+        def progress(totals):
+            self.stdout.write(f"Fetched {totals['fetched']} products, {totals['retried']} to retry, "
+                              f"{totals['failed']} failed, {ProductFetch.objects.count()} still queued")
+
+        run_fetches(worker_name(), progress)
+        # Products whose fetch is still waiting to be retried are finished by the fetch service. The
+        # queued products are looked up by id: they are stored under their canonical URL, not the row's
+        for product in Products.objects.filter(id__in=report['queued_ids'], status=Products.FAILED):
+            self.stderr.write(f"Failed to fetch {product.product_url}: {product.fetch_error}")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.models import TrackingJob
+from products.profiling import pass_profile
+
+# Order of the stages in the report, following a product through a pass
+STAGES = ['connect', 'wait', 'download', 'parse', 'db', 'email']
+
+
+class Command(BaseCommand):
+    help = "Print where the last tracking pass (or the given one) spent its time, and how each retailer fared"
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_id', nargs='?', type=int, help="Tracking pass to profile instead of the last one")
+
+    def handle(self, *args, **options):
+        jobs = TrackingJob.objects.order_by('-created_at')
+        job = jobs.filter(id=options['job_id']).first() if options['job_id'] else jobs.first()
+        if job is None:
+            raise CommandError("No tracking pass found")
+        profile = pass_profile(job)
+        progress = profile['progress']
+        state = f"finished {job.finished_at:%Y-%m-%d %H:%M}" if job.finished_at else f"{progress['percent']:.1f}% done"
+        self.stdout.write(f"{job} ({state}) by {profile['workers']} worker processes")
+        self.stdout.write(f"  {progress['done']} checked, {progress['failed']} failed, {progress['pending']} pending, "
+                          f"{progress['per_minute']:.1f} products/min, {profile['prices_saved']} prices saved")
+
+        stages = profile['stages']
+        self.stdout.write(f"\n{'stage':<10} {'count':>8} {'seconds':>10} {'p50 ms':>9} {'p95 ms':>9}")
+        for stage in sorted(stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+            timing = stages[stage]
+            self.stdout.write(f"{stage:<10} {timing['count']:>8} {timing['seconds']:>10.1f} "
+                              f"{timing['p50'] * 1000:>9.1f} {timing['p95'] * 1000:>9.1f}")
+
+        self.stdout.write(f"\n{'retailer':<12} {'success':>8} {'failure':>8} {'budget':>7} {'requests':>9} {'retries':>8}")
+        for retailer, counts in sorted(profile['retailers'].items()):
+            self.stdout.write(f"{retailer:<12} {counts.get('success', 0):>8} {counts.get('failure', 0):>8} "
+                              f"{counts.get('over_budget', 0):>7} {counts.get('requests', 0):>9} "
+                              f"{counts.get('retries', 0):>8}")
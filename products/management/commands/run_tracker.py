@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from products.scheduler import run_scheduler
+
+
+class Command(BaseCommand):
+    help = "Run the price tracking scheduler: one instance per deployment, paused and resumed via Tracking Status"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=settings.TRACKING_INTERVAL,
+                            help="Seconds between the starts of two passes over the products due for a check")
+        parser.add_argument('--poll', type=int, default=settings.TRACKER_POLL_SECONDS,
+                            help="Seconds between checks of the tracking status while idle")
+        parser.add_argument('--once', action='store_true', help="Run at most one pass, then exit")
+
+    def handle(self, *args, **options):
+        acquired = run_scheduler(
+            interval=options['interval'],
+            poll_seconds=options['poll'],
+            lease_seconds=settings.TRACKER_LEASE_SECONDS,
+            once=options['once'],
+        )
+        if not acquired:
+            raise CommandError("Tracking scheduler is already running elsewhere")
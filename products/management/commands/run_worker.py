@@ -0,0 +1,48 @@
+import os
+import signal
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.scheduler import run_worker
+
+
+class Command(BaseCommand):
+    help = ("Run extra tracking workers that share the scheduler's queue; start any number of them "
+            "on any host using the same database")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Worker processes to start on this host")
+        parser.add_argument('--poll', type=int, default=settings.TRACKER_POLL_SECONDS,
+                            help="Seconds between checks for an open tracking pass while idle")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Products claimed from the queue at a time")
+        parser.add_argument('--once', action='store_true', help="Exit once no tracking pass is open")
+
+    def handle(self, *args, **options):
+        if options['processes'] > 1:
+            self.run_processes(options)
+            return
+        run_worker(poll_seconds=options['poll'], batch_size=options['batch_size'], once=options['once'])
+
+    def run_processes(self, options):
+        # Each process runs this command with a single worker; scraping and parsing then use
+        # one core per process instead of sharing one interpreter lock
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'run_worker',
+                   '--poll', str(options['poll'])]
+        if options['batch_size']:
+            command += ['--batch-size', str(options['batch_size'])]
+        if options['once']:
+            command.append('--once')
+        children = [subprocess.Popen(command) for _ in range(options['processes'])]
+
+        # Ctrl+C reaches the whole process group, but SIGTERM from a service manager only reaches us
+        def stop_children(*args):
+            for child in children:
+                if child.poll() is None:
+                    child.send_signal(signal.SIGTERM)
+        signal.signal(signal.SIGTERM, stop_children)
+        signal.signal(signal.SIGINT, stop_children)
+        for child in children:
+            child.wait()
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.models import PriceAlert
+from products.notifications import deliver_pending_alerts
+from products.profiling import save_metrics
+from products.scheduler import install_stop_handlers, worker_name
+
+
+class Command(BaseCommand):
+    help = "Run the notification service that emails queued price drop alerts as per-user digests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=int, default=settings.NOTIFICATION_POLL_SECONDS,
+                            help="Seconds between checks for alerts ready to be sent")
+        parser.add_argument('--once', action='store_true', help="Send the digests that are ready, then exit")
+
+    def handle(self, *args, **options):
+        sender = worker_name()
+        stop = install_stop_handlers()
+        while not stop.is_set():
+            stats = deliver_pending_alerts(sender)
+            if stats['emails_sent'] or stats['emails_failed']:
+                pending = PriceAlert.objects.filter(status=PriceAlert.PENDING).count()
+                self.stdout.write(f"Sent {stats['emails_sent']} emails with {stats['alerts_sent']} alerts, "
+                                  f"{stats['emails_failed']} failed, {pending} alerts pending")
+                # Publish the email counters and timings to the metrics endpoint
+                save_metrics(sender)
+            if options['once']:
+                break
+            stop.wait(options['poll'])
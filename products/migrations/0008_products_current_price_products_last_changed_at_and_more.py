@@ -0,0 +1,46 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_remove_products_notify_users_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='current_price',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='last_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='last_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='previous_price',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trackingstatus',
+            name='last_completed_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='priceupdate',
+            index=models.Index(fields=['product', 'dates'], name='priceupdate_product_dates'),
+        ),
+        migrations.AddIndex(
+            model_name='priceupdate',
+            index=models.Index(fields=['dates'], name='priceupdate_dates'),
+        ),
+    ]
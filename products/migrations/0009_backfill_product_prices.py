@@ -0,0 +1,36 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:44
+
+from datetime import datetime, time
+
+from django.db import migrations
+from django.utils.timezone import make_aware
+
+
+def backfill_product_prices(apps, schema_editor):
+    # Derive the maintained price columns from each product's existing price history
+    Products = apps.get_model('products', 'Products')
+    PriceUpdate = apps.get_model('products', 'PriceUpdate')
+    for product in list(Products.objects.all()):
+        current = previous = checked = changed = None
+        for price, dates in PriceUpdate.objects.filter(product=product).order_by('dates', 'id').values_list('price', 'dates'):
+            if price != current:
+                previous, changed = current, dates
+            current, checked = price, dates
+        if current is None:
+            continue
+        product.current_price = current
+        product.previous_price = previous
+        product.last_checked_at = make_aware(datetime.combine(checked, time.min))
+        product.last_changed_at = make_aware(datetime.combine(changed, time.min))
+        product.save(update_fields=['current_price', 'previous_price', 'last_checked_at', 'last_changed_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_products_current_price_products_last_changed_at_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_product_prices, migrations.RunPython.noop),
+    ]
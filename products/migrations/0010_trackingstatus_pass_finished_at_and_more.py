@@ -0,0 +1,33 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_backfill_product_prices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackingstatus',
+            name='pass_finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trackingstatus',
+            name='pass_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trackingstatus',
+            name='scheduler_heartbeat',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trackingstatus',
+            name='scheduler_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
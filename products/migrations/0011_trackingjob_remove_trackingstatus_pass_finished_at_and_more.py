@@ -0,0 +1,51 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_trackingstatus_pass_finished_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='trackingstatus',
+            name='pass_finished_at',
+        ),
+        migrations.RemoveField(
+            model_name='trackingstatus',
+            name='pass_started_at',
+        ),
+        migrations.CreateModel(
+            name='TrackingTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('lease_owner', models.CharField(blank=True, default='', max_length=255)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.CharField(blank=True, default='', max_length=255)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='products.trackingjob')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.products')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['job', 'status', 'lease_expires_at'], name='trackingtask_claim')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='trackingtask',
+            constraint=models.UniqueConstraint(fields=('job', 'product'), name='trackingtask_job_product'),
+        ),
+    ]
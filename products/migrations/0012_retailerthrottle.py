@@ -0,0 +1,21 @@
+# Generated by Django 5.0.3 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_trackingjob_remove_trackingstatus_pass_finished_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetailerThrottle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('retailer', models.CharField(max_length=50, unique=True)),
+                ('next_request_at', models.FloatField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.3 on 2026-10-18 17:20
+
+from datetime import timedelta
+
+from django.db import migrations
+
+# Bounds and default of the adaptive check interval at the time of this migration, in seconds
+MIN_INTERVAL = 2 * 60 * 60
+MAX_INTERVAL = 7 * 24 * 60 * 60
+DEFAULT_INTERVAL = 24 * 60 * 60
+
+
+def backfill_check_intervals(apps, schema_editor):
+    # Start each product's schedule from how often its price has changed over its recorded history
+    Products = apps.get_model('products', 'Products')
+    PriceUpdate = apps.get_model('products', 'PriceUpdate')
+    for product in list(Products.objects.all()):
+        history = list(PriceUpdate.objects.filter(product=product).order_by('dates', 'id').values_list('price', 'dates'))
+        if len(history) < 2:
+            interval = DEFAULT_INTERVAL
+        else:
+            changes = sum(1 for (previous, _), (price, _) in zip(history, history[1:]) if price != previous)
+            span = (history[-1][1] - history[0][1]).total_seconds()
+            interval = min(max(span / (changes + 1), MIN_INTERVAL), MAX_INTERVAL)
+        product.check_interval = int(interval)
+        if product.last_checked_at:
+            product.next_check_at = product.last_checked_at + timedelta(seconds=interval)
+        product.save(update_fields=['check_interval', 'next_check_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_products_check_interval_products_failure_count_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_check_intervals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.3 on 2026-10-18 17:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_pricealert'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricealert',
+            name='reason',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('percent_drop', 'Price drops by at least threshold percent'), ('absolute_drop', 'Price drops by at least threshold'), ('all_time_low', 'Price reaches a new all-time low'), ('below_target', 'Price falls to threshold or below'), ('below_average', 'Price falls threshold percent below its window_days moving average')], default='percent_drop', max_length=20)),
+                ('threshold', models.IntegerField(blank=True, null=True)),
+                ('window_days', models.PositiveIntegerField(default=30)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='products.products')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pricealert',
+            name='rule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.alertrule'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.3 on 2026-10-18 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_pricealert_reason_alertrule_pricealert_rule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceSeries',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='price_series', serialize=False, to='products.products')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('days', models.BinaryField()),
+                ('prices', models.BinaryField()),
+                ('runs', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Price series',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.3 on 2026-10-18 17:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_priceseries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('min_price', models.IntegerField()),
+                ('max_price', models.IntegerField()),
+                ('close_price', models.IntegerField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.products')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'period_start'], name='pricerollup_product_start')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pricerollup',
+            constraint=models.UniqueConstraint(fields=('product', 'period', 'period_start'), name='pricerollup_unique_period'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.3 on 2026-10-18 17:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_pricerollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('data', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='products.trackingjob')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='metricssnapshot',
+            constraint=models.UniqueConstraint(fields=('source', 'job'), name='metricssnapshot_source_job'),
+        ),
+    ]
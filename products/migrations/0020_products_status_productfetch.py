@@ -0,0 +1,35 @@
+# Generated by Django 5.0.3 on 2026-10-18 17:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_metricssnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFetch',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fetch', serialize=False, to='products.products')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('lease_owner', models.CharField(blank=True, default='', max_length=255)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.CharField(blank=True, default='', max_length=255)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='fetch_error',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Fetching details'), ('active', 'Tracked'), ('failed', 'Could not be fetched')], default='active', max_length=10),
+        ),
+    ]
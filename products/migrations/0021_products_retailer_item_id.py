@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-18 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_products_status_productfetch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='item_id',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='retailer',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
@@ -0,0 +1,136 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:01
+
+import re
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+
+from django.db import migrations
+
+# Product URL rules of the retailers at the time of this migration: the domain, the path pattern
+# holding the item ID, the query parameter that overrides it and the canonical path
+RETAILER_ITEMS = {
+    'flipkart': ('flipkart.com', re.compile(r'^/(?:[^/]+/)?p/(?P<item>itm[0-9a-zA-Z]+)'), 'pid', None),
+    'ebay': ('ebay.com', re.compile(r'^/itm/(?:[^/]+/)?(?P<item>\d{9,})'), None, '/itm/{item}'),
+}
+
+# Columns describing a product's tracking state, taken from the most recently checked duplicate
+STATE_FIELDS = ['product_name', 'product_img', 'product_price', 'current_price', 'previous_price',
+                'last_checked_at', 'last_changed_at', 'check_interval', 'next_check_at', 'failure_count',
+                'status', 'fetch_error']
+
+
+def canonical_product(url):
+    # (retailer, item ID, canonical URL) of a product URL, with an empty item ID if it has none
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    for name, (domain, pattern, param, canonical_path) in RETAILER_ITEMS.items():
+        if host not in (domain, 'www.' + domain, 'm.' + domain):
+            continue
+        match = pattern.search(parts.path)
+        if match is None:
+            return name, '', url
+        item_id, query = match.group('item'), ''
+        value = parse_qs(parts.query).get(param, [''])[0] if param else ''
+        if value:
+            item_id, query = value, urlencode({param: value})
+        path = canonical_path.format(**match.groupdict()) if canonical_path else match.group(0)
+        return name, item_id, urlunsplit(('https', 'www.' + domain, path, query, ''))
+    return '', '', url
+
+
+def merge_products(apps, survivor_id, duplicate_ids):
+    # Move the users, history, rollups and alerts of duplicate products onto the survivor and delete
+    # the duplicates; returns the survivor's columns to update
+    Products = apps.get_model('products', 'Products')
+    PriceUpdate = apps.get_model('products', 'PriceUpdate')
+    PriceRollup = apps.get_model('products', 'PriceRollup')
+    PriceSeries = apps.get_model('products', 'PriceSeries')
+    PriceAlert = apps.get_model('products', 'PriceAlert')
+    AlertRule = apps.get_model('products', 'AlertRule')
+    TrackingTask = apps.get_model('products', 'TrackingTask')
+    ProductFetch = apps.get_model('products', 'ProductFetch')
+    Subscription = Products.user.through
+
+    # Users of any duplicate now track the survivor
+    user_ids = set(Subscription.objects.filter(products_id__in=duplicate_ids).values_list('user_accounts_id', flat=True))
+    user_ids -= set(Subscription.objects.filter(products_id=survivor_id).values_list('user_accounts_id', flat=True))
+    Subscription.objects.bulk_create([Subscription(products_id=survivor_id, user_accounts_id=user_id)
+                                      for user_id in user_ids])
+    # Histories are combined, keeping one price per day (the survivor's, else the earliest row's)
+    seen = set(PriceUpdate.objects.filter(product_id=survivor_id).values_list('dates', flat=True))
+    dropped = []
+    for update_id, day in PriceUpdate.objects.filter(product_id__in=duplicate_ids).order_by('id').values_list('id', 'dates'):
+        if day in seen:
+            dropped.append(update_id)
+        seen.add(day)
+    PriceUpdate.objects.filter(id__in=dropped).delete()
+    PriceUpdate.objects.filter(product_id__in=duplicate_ids).update(product_id=survivor_id)
+    # Rollups of the same period are combined into one. Rollups do not record when their last price
+    # was seen, so the close is taken from the most recently checked product, as its data is the latest
+    checked = {product_id: last_checked_at.timestamp() if last_checked_at else 0 for product_id, last_checked_at in
+               Products.objects.filter(id__in=[survivor_id] + duplicate_ids).values_list('id', 'last_checked_at')}
+    rollups = {(rollup.period, rollup.period_start): (rollup, survivor_id)
+               for rollup in PriceRollup.objects.filter(product_id=survivor_id)}
+    for rollup in PriceRollup.objects.filter(product_id__in=duplicate_ids).order_by('id'):
+        key = (rollup.period, rollup.period_start)
+        if key not in rollups:
+            rollups[key] = (rollup, rollup.product_id)
+            rollup.product_id = survivor_id
+            rollup.save(update_fields=['product'])
+            continue
+        kept, source_id = rollups[key]
+        kept.min_price = min(kept.min_price, rollup.min_price)
+        kept.max_price = max(kept.max_price, rollup.max_price)
+        kept.samples += rollup.samples
+        if checked[rollup.product_id] > checked[source_id]:
+            kept.close_price = rollup.close_price
+            rollups[key] = (kept, rollup.product_id)
+        kept.save(update_fields=['min_price', 'max_price', 'close_price', 'samples'])
+        rollup.delete()
+    # Alerts and alert rules follow the product; in-flight queue entries are recreated by the next pass
+    PriceAlert.objects.filter(product_id__in=duplicate_ids).update(product_id=survivor_id)
+    AlertRule.objects.filter(product_id__in=duplicate_ids).update(product_id=survivor_id)
+    TrackingTask.objects.filter(product_id__in=duplicate_ids).delete()
+    ProductFetch.objects.filter(product_id__in=duplicate_ids).delete()
+    # Compact series are rebuilt from the combined history by manage.py build_price_series
+    PriceSeries.objects.filter(product_id__in=[survivor_id] + duplicate_ids).delete()
+
+    # The survivor keeps the earliest date added and the tracking state of the most recently checked duplicate
+    products = list(Products.objects.filter(id__in=[survivor_id] + duplicate_ids).values('date_added', *STATE_FIELDS))
+    latest = max(products, key=lambda product: product['last_checked_at'].timestamp() if product['last_checked_at'] else 0)
+    fields = {field: latest[field] for field in STATE_FIELDS}
+    fields['date_added'] = min(product['date_added'] for product in products)
+    Products.objects.filter(id__in=duplicate_ids).delete()
+    return fields
+
+
+def merge_duplicate_products(apps, schema_editor):
+    # Key every product by its retailer item and fold products sharing an item into the oldest one
+    Products = apps.get_model('products', 'Products')
+
+    groups = {}
+    for product_id, url in Products.objects.order_by('id').values_list('id', 'product_url'):
+        retailer, item_id, canonical_url = canonical_product(url)
+        key = (retailer, item_id) if item_id else ('', url)
+        groups.setdefault(key, []).append((product_id, url, retailer, item_id, canonical_url))
+
+    for members in groups.values():
+        survivor_id, url, retailer, item_id, canonical_url = members[0]
+        duplicate_ids = [member[0] for member in members[1:]]
+        fields = {'retailer': retailer, 'item_id': item_id}
+        if duplicate_ids:
+            fields.update(merge_products(apps, survivor_id, duplicate_ids))
+        # Products are stored under their canonical URL unless another product already holds it
+        if canonical_url != url and not Products.objects.filter(product_url=canonical_url).exists():
+            fields['product_url'] = canonical_url
+        Products.objects.filter(id=survivor_id).update(**fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_products_retailer_item_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_products, migrations.RunPython.noop),
+    ]
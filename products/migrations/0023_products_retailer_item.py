@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_merge_duplicate_products'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='products',
+            constraint=models.UniqueConstraint(condition=models.Q(('item_id', ''), _negated=True), fields=('retailer', 'item_id'), name='products_retailer_item'),
+        ),
+    ]
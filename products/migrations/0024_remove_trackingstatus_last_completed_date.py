@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:57
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0023_products_retailer_item'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='trackingstatus',
+            name='last_completed_date',
+        ),
+    ]
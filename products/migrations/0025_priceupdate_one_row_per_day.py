@@ -0,0 +1,32 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:58
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def keep_last_price_of_each_day(apps, schema_editor):
+    # Products checked more than once a day have several rows for the day; the last check's price is
+    # the day's price, as in the compact price series
+    PriceUpdate = apps.get_model('products', 'PriceUpdate')
+    kept = (PriceUpdate.objects.values('product_id', 'dates').order_by()
+            .annotate(last_id=Max('id')).values('last_id'))
+    PriceUpdate.objects.exclude(id__in=kept).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0024_remove_trackingstatus_last_completed_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_last_price_of_each_day, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='priceupdate',
+            name='priceupdate_product_dates',
+        ),
+        migrations.AddConstraint(
+            model_name='priceupdate',
+            constraint=models.UniqueConstraint(fields=('product', 'dates'), name='priceupdate_product_date'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0025_priceupdate_one_row_per_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='history_revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,10 +1,16 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils.timezone import now
 
 # Retrieve the custom user model
 User = get_user_model()
 
 class Products(models.Model):
+    PENDING = 'pending'
+    ACTIVE = 'active'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Fetching details'), (ACTIVE, 'Tracked'), (FAILED, 'Could not be fetched')]
+
     # Many-to-Many relationship with the User model. A product can be associated with multiple users and vice versa.
     user = models.ManyToManyField(User)
     # CharField for storing the name of the product.
@@ -17,11 +23,55 @@ class Products(models.Model):
     product_price = models.IntegerField()
     # DateField for storing the date when the product was added to the database.
     date_added = models.DateField()
+    # Latest scraped price and the price before its last change, maintained by the tracker so the
+    # current price never requires scanning PriceUpdate.
+    current_price = models.IntegerField(null=True, blank=True)
+    previous_price = models.IntegerField(null=True, blank=True)
+    # When the tracker last scraped the product, and when that changed its current price.
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    last_changed_at = models.DateTimeField(null=True, blank=True)
+    # Bumped whenever stored history is rewritten rather than added to by a check (compaction by
+    # retention.py), so with last_checked_at it versions the history for chart caches and ETags.
+    history_revision = models.PositiveIntegerField(default=0)
+    # Adaptive refresh schedule: the base seconds between checks (shortened when the price moves,
+    # stretched while it holds), when the product is next due, and failed checks in a row.
+    check_interval = models.PositiveIntegerField(null=True, blank=True)
+    next_check_at = models.DateTimeField(null=True, blank=True)
+    failure_count = models.PositiveIntegerField(default=0)
+    # Products added from the dashboard are pending until a background fetch (see product_fetch.py)
+    # fills in their details; only active products are tracked.
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    fetch_error = models.CharField(max_length=255, blank=True, default='')
+    # The retailer and its stable item ID, extracted from the URL (see retailers.canonical_product), so
+    # the same item reached through different URLs is one product. URLs without an item ID leave it blank.
+    retailer = models.CharField(max_length=50, blank=True, default='')
+    item_id = models.CharField(max_length=64, blank=True, default='')
     
     class Meta:
         # Custom names for the Product model in the Django admin site
         verbose_name = "Product"
         verbose_name_plural = "Products"
+        constraints = [
+            # One product per retailer item; also serves the dashboard's and importer's lookups by item.
+            models.UniqueConstraint(fields=['retailer', 'item_id'], condition=~models.Q(item_id=''),
+                                    name='products_retailer_item'),
+        ]
+        indexes = [
+            # Serves the scheduler's "products due for a check" query.
+            models.Index(fields=['next_check_at'], name='products_next_check'),
+        ]
+
+class ProductFetch(models.Model):
+    # The in-flight fetch of a newly added product's details. There is at most one per product, so
+    # users adding the same URL at once share a single scrape; the row is deleted once it is done.
+    product = models.OneToOneField(Products, on_delete=models.CASCADE, primary_key=True, related_name='fetch')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Number of times a fetcher has claimed the fetch, and the fetcher holding it until its lease lapses.
+    attempts = models.PositiveIntegerField(default=0)
+    lease_owner = models.CharField(max_length=255, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True, default='')
+
 
 class PriceUpdate(models.Model):
     # ForeignKey linking to a Product. CASCADE means if the referenced Product is deleted, delete this too.
@@ -31,9 +81,66 @@ class PriceUpdate(models.Model):
     # IntegerField for the new price of the product.
     price = models.IntegerField()
 
+    class Meta:
+        constraints = [
+            # One price per product and day: later checks on the same day overwrite the day's price.
+            # Also serves a product's history in date order and "latest update before a date" lookups.
+            models.UniqueConstraint(fields=['product', 'dates'], name='priceupdate_product_date'),
+        ]
+        indexes = [
+            # Serves catalog-wide "most recent update" lookups.
+            models.Index(fields=['dates'], name='priceupdate_dates'),
+        ]
+
+
+class PriceRollup(models.Model):
+    # A week or month of PriceUpdate rows that aged out of the daily retention window (see retention.py).
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = [(WEEK, 'Week'), (MONTH, 'Month')]
+
+    product = models.ForeignKey(Products, on_delete=models.CASCADE)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    # First day of the period: a Monday for weeks, the 1st for months
+    period_start = models.DateField()
+    # Lowest and highest price seen in the period and the last one, so all-time lows and highs survive
+    min_price = models.IntegerField()
+    max_price = models.IntegerField()
+    close_price = models.IntegerField()
+    # Number of price updates rolled into the period
+    samples = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'period', 'period_start'], name='pricerollup_unique_period'),
+        ]
+        indexes = [
+            # Serves a product's rolled-up history in date order.
+            models.Index(fields=['product', 'period_start'], name='pricerollup_product_start'),
+        ]
+
+
+class PriceSeries(models.Model):
+    # A product's whole price history in one row, kept as runs of unchanged prices (see price_series.py).
+    product = models.OneToOneField(Products, on_delete=models.CASCADE, primary_key=True, related_name='price_series')
+    # First and last day the product was checked; the price of the last run holds until end_date.
+    start_date = models.DateField()
+    end_date = models.DateField()
+    # Packed 32-bit arrays: the day (counted from start_date) each run begins, and its price.
+    days = models.BinaryField()
+    prices = models.BinaryField()
+    # Number of runs, i.e. price changes plus one
+    runs = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Price series"
+
 class TrackingStatus(models.Model):
     # BooleanField indicating whether tracking is active or not, defaults to False.
     is_tracking = models.BooleanField(default=False, verbose_name="Is Tracking Active")
+    # Lease held by the running scheduler service, so only one instance tracks at a time.
+    scheduler_id = models.CharField(max_length=255, blank=True, default='')
+    scheduler_heartbeat = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         # Human-readable string representation of the model, indicating tracking status.
@@ -42,3 +149,152 @@ class TrackingStatus(models.Model):
     class Meta:
         # Custom name for the TrackingStatus model in the Django admin site, ensuring correct pluralization.
         verbose_name_plural = "Tracking Status"
+
+
+class TrackingJob(models.Model):
+    # One tracking pass over the catalog, made of one TrackingTask per product.
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set once every task is done or has failed for good; open jobs are resumed by any worker.
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def progress(self, counts=None):
+        # Completion and throughput of the pass so far, computed from its task counts by status,
+        # which are queried unless given (e.g. annotated on a list of jobs)
+        if counts is None:
+            counts = dict(self.tasks.values_list('status').annotate(count=models.Count('id')))
+        total = sum(counts.values())
+        done = counts.get(TrackingTask.DONE, 0)
+        failed = counts.get(TrackingTask.FAILED, 0)
+        elapsed = ((self.finished_at or now()) - self.created_at).total_seconds()
+        return {
+            'total': total,
+            'done': done,
+            'failed': failed,
+            'pending': counts.get(TrackingTask.PENDING, 0),
+            'percent': (done + failed) / total * 100 if total else 100.0,
+            'per_minute': (done + failed) / elapsed * 60 if elapsed > 0 else 0.0,
+        }
+
+    def __str__(self):
+        return f"Tracking pass #{self.pk} started {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class TrackingTask(models.Model):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    # The pass this task belongs to and the product it scrapes.
+    job = models.ForeignKey(TrackingJob, on_delete=models.CASCADE, related_name='tasks')
+    product = models.ForeignKey(Products, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # Number of times a worker has claimed the task.
+    attempts = models.PositiveIntegerField(default=0)
+    # Worker currently holding the task and when its claim lapses; a pending task whose lease
+    # has expired (or was never set) can be claimed by any worker.
+    lease_owner = models.CharField(max_length=255, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'product'], name='trackingtask_job_product'),
+        ]
+        indexes = [
+            # Serves claiming: pending tasks of a job whose lease is free.
+            models.Index(fields=['job', 'status', 'lease_expires_at'], name='trackingtask_claim'),
+        ]
+
+
+class RetailerThrottle(models.Model):
+    # Request spacing for one retailer shared by every tracker process and host using this
+    # database: the earliest time (Unix seconds) at which the next request may be sent.
+    retailer = models.CharField(max_length=50, unique=True)
+    next_request_at = models.FloatField(default=0)
+
+    def __str__(self):
+        return f"{self.retailer} throttle"
+
+
+class PriceAlert(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    # A price drop waiting to be mailed to one subscriber; a user's pending alerts go out together
+    # in a single digest email.
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    product = models.ForeignKey(Products, on_delete=models.CASCADE)
+    old_price = models.IntegerField()
+    new_price = models.IntegerField()
+    # The alert rule that fired (None for the default drop rule) and a description for the email.
+    rule = models.ForeignKey('AlertRule', null=True, blank=True, on_delete=models.SET_NULL)
+    reason = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    # Delivery attempts so far, and the sender holding the alert while it is being mailed; a
+    # pending alert whose lease has expired (or was never set) can be picked up by any sender.
+    attempts = models.PositiveIntegerField(default=0)
+    lease_owner = models.CharField(max_length=255, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Serves finding the users with pending alerts ready to be sent.
+            models.Index(fields=['status', 'user', 'created_at'], name='pricealert_pending'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.product_name}: {self.old_price} -> {self.new_price} for {self.user.email}"
+
+
+class AlertRule(models.Model):
+    PERCENT_DROP = 'percent_drop'
+    ABSOLUTE_DROP = 'absolute_drop'
+    ALL_TIME_LOW = 'all_time_low'
+    BELOW_TARGET = 'below_target'
+    BELOW_AVERAGE = 'below_average'
+    KIND_CHOICES = [
+        (PERCENT_DROP, 'Price drops by at least threshold percent'),
+        (ABSOLUTE_DROP, 'Price drops by at least threshold'),
+        (ALL_TIME_LOW, 'Price reaches a new all-time low'),
+        (BELOW_TARGET, 'Price falls to threshold or below'),
+        (BELOW_AVERAGE, 'Price falls threshold percent below its window_days moving average'),
+    ]
+
+    # When a user is alerted about a product; a rule without a product applies to every product
+    # the user tracks. Where a user has no rule for a product, they are alerted on a drop of
+    # DEFAULT_ALERT_DROP_PERCENT.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='alert_rules')
+    product = models.ForeignKey(Products, null=True, blank=True, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=PERCENT_DROP)
+    # Percent for percentage and moving average rules, price (in the stored unit) for absolute
+    # drop and target rules; unused for all-time lows.
+    threshold = models.IntegerField(null=True, blank=True)
+    window_days = models.PositiveIntegerField(default=30)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        target = self.product.product_name if self.product_id else "all products"
+        return f"{self.get_kind_display()} ({self.threshold}) for {self.user.email} on {target}"
+
+
+class MetricsSnapshot(models.Model):
+    # Counters and histograms recorded by one process (see trackit/metrics.py), saved as it runs so the
+    # metrics endpoint can add up every tracker and email process. Rows with a job hold only what the
+    # process recorded during that tracking pass, for the pass profile.
+    source = models.CharField(max_length=255)
+    job = models.ForeignKey(TrackingJob, null=True, blank=True, on_delete=models.CASCADE, related_name='metrics')
+    data = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'job'], name='metricssnapshot_source_job'),
+        ]
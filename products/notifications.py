@@ -0,0 +1,157 @@
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q, F, Min
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+from trackit import metrics
+from trackit.db import write_atomic
+from trackit.gmail import get_gmail_client
+from .models import PriceAlert
+
+logger = logging.getLogger(__name__)
+
+
+class GmailTransport:
+    """Sends emails through the process-wide Gmail client, a whole batch per Gmail batch HTTP request."""
+
+    def send(self, messages):
+        """Send {key: (to, subject, body)} and return {key: error message, or None if sent}."""
+        return get_gmail_client().send_batch(messages)
+
+
+class FakeTransport:
+    """Records emails instead of sending them, for tests and local development.
+
+    Sent messages are appended to FakeTransport.outbox as dicts; deliveries to addresses in
+    FakeTransport.fail_addresses are reported as failed.
+    """
+    outbox = []
+    fail_addresses = set()
+
+    def send(self, messages):
+        results = {}
+        for key, (to, subject, body) in messages.items():
+            if to in self.fail_addresses:
+                results[key] = f"Delivery to {to} failed"
+            else:
+                self.outbox.append({'to': to, 'subject': subject, 'body': body})
+                results[key] = None
+        return results
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport():
+    # One long-lived instance of the configured transport per process, so clients are reused
+    path = settings.NOTIFICATION_TRANSPORT
+    with _transports_lock:
+        if path not in _transports:
+            _transports[path] = import_string(path)()
+        return _transports[path]
+
+
+def _claimable(queryset, current):
+    return queryset.filter(status=PriceAlert.PENDING).filter(
+        Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=current))
+
+
+def claim_digests(sender, limit):
+    """Lease the pending alerts of up to limit users whose digest is ready, grouped by user id.
+
+    A user's digest is ready once their oldest pending alert has waited NOTIFICATION_DIGEST_WINDOW
+    seconds, so drops found close together reach them as a single email.
+    """
+    current = now()
+    ready_before = current - timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW)
+    user_ids = list(
+        _claimable(PriceAlert.objects.all(), current).values('user_id')
+        .annotate(oldest=Min('created_at')).filter(oldest__lte=ready_before)
+        .order_by('oldest').values_list('user_id', flat=True)[:limit]
+    )
+    if not user_ids:
+        return {}
+    expires = current + timedelta(seconds=settings.NOTIFICATION_LEASE_SECONDS)
+    _claimable(PriceAlert.objects.filter(user_id__in=user_ids), current).update(
+        lease_owner=sender, lease_expires_at=expires, attempts=F('attempts') + 1)
+    digests = {}
+    for alert in (PriceAlert.objects.filter(user_id__in=user_ids, lease_owner=sender, lease_expires_at=expires)
+                  .select_related('user', 'product').order_by('created_at', 'id')):
+        digests.setdefault(alert.user_id, []).append(alert)
+    return digests
+
+
+def build_digest(alerts):
+    """Render one email (to, subject, body) for all of a user's pending alerts.
+
+    Several alerts for the same product collapse into one line, from the first old price to
+    the latest new price, with the reason of the latest alert.
+    """
+    changes = {}
+    for alert in alerts:
+        first_old = changes.get(alert.product_id, (alert.product, alert.old_price, None, None))[1]
+        changes[alert.product_id] = (alert.product, first_old, alert.new_price, alert.reason)
+    lines = [f"{product.product_name}: {old_price} -> {new_price}" + (f" ({reason})" if reason else "")
+             + f"\n{product.product_url}"
+             for product, old_price, new_price, reason in changes.values()]
+    if len(changes) == 1:
+        subject = 'Price Drop Alert!'
+    else:
+        subject = f'Price Drop Alert: {len(changes)} of your products are cheaper'
+    body = "Hi there,\n\nGreat news! Prices have dropped on products you are tracking:\n\n"
+    body += "\n\n".join(lines)
+    body += "\n\nCheck them out on the website now!\n"
+    return alerts[0].user.email, subject, body
+
+
+def finish_digests(delivered, failed):
+    """Mark the alerts of delivered digests sent, and schedule failed ones for a retry or give up on them."""
+    current = now()
+    retry_at = current + timedelta(seconds=settings.NOTIFICATION_RETRY_DELAY)
+    with write_atomic():
+        PriceAlert.objects.filter(id__in=[alert.id for alert in delivered]).update(
+            status=PriceAlert.SENT, sent_at=current, lease_expires_at=None, last_error='')
+        for alert, error in failed:
+            if alert.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+                alert.status = PriceAlert.FAILED
+            else:
+                alert.lease_expires_at = retry_at
+            alert.last_error = (error or '')[:255]
+        PriceAlert.objects.bulk_update([alert for alert, _ in failed], ['status', 'lease_expires_at', 'last_error'])
+
+
+def deliver_pending_alerts(sender, transport=None):
+    """Email every ready digest, NOTIFICATION_BATCH_SIZE emails per transport call.
+
+    Returns the number of emails sent and failed and of alerts they carried.
+    """
+    transport = transport or get_transport()
+    stats = {'emails_sent': 0, 'emails_failed': 0, 'alerts_sent': 0}
+    while True:
+        digests = claim_digests(sender, settings.NOTIFICATION_BATCH_SIZE)
+        if not digests:
+            break
+        messages = {user_id: build_digest(alerts) for user_id, alerts in digests.items()}
+        try:
+            with metrics.timed('email'):
+                results = transport.send(messages)
+        except Exception as e:
+            results = {user_id: str(e) for user_id in messages}
+        delivered, failed = [], []
+        for user_id, alerts in digests.items():
+            error = results.get(user_id)
+            if error is None:
+                delivered.extend(alerts)
+                stats['emails_sent'] += 1
+                metrics.inc('trackit_emails_total', kind='alert', outcome='sent')
+            else:
+                logger.warning("Failed to email %s: %s", messages[user_id][0], error)
+                failed.extend((alert, error) for alert in alerts)
+                stats['emails_failed'] += 1
+                metrics.inc('trackit_emails_total', kind='alert', outcome='failed')
+        finish_digests(delivered, failed)
+        stats['alerts_sent'] += len(delivered)
+    return stats
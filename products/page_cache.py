@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl; msvcrt locks a byte range of the lock file instead
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _file_lock(path):
+    # Exclusive lock held across processes for the duration of the block, on a separate lock file
+    with open(path, 'a+') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class PageCache:
+    """Bounded LRU cache of per-URL validators and price-region fingerprints.
+
+    Each entry keeps the ETag and Last-Modified headers of the last successful fetch,
+    a hash of the price-relevant part of the page and the data parsed from it, so an
+    unchanged page can be answered without downloading or parsing it again. The cache
+    is loaded from and saved to a JSON file so it survives between tracking passes.
+    Several worker processes can share the file: each one saves only the entries it
+    changed, merged into the file's current contents under a file lock.
+    """
+
+    def __init__(self, path=None, max_entries=50000):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        # URLs put since the cache was loaded or last saved
+        self.changed = set()
+        self.lock = threading.Lock()
+        # Hit/miss counters for the lifetime of this cache object
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def load(self):
+        # Read saved entries, ignoring a missing or corrupt file
+        entries = self._read()
+        with self.lock:
+            self.entries = OrderedDict(entries)
+            self._evict()
+        return self
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable page cache %s: %s", self.path, e)
+            return []
+
+    def save(self):
+        """Merge the entries changed since loading into the cache file.
+
+        Under a lock shared with the other processes using the file, its current contents are read
+        again and this cache's changes applied on top as the most recently used entries, so what
+        other workers saved meanwhile is kept. The result is written to a temporary file first and
+        moved into place, so a crash never leaves a half-written cache behind.
+        """
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with _file_lock(self.path + '.lock'):
+            merged = OrderedDict(self._read())
+            with self.lock:
+                for url, entry in self.entries.items():
+                    if url in self.changed:
+                        merged.pop(url, None)
+                        merged[url] = entry
+                self.entries = merged
+                self.changed = set()
+                self._evict()
+                entries = list(self.entries.items())
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.page_cache.')
+            try:
+                with os.fdopen(fd, 'w') as cache_file:
+                    json.dump(entries, cache_file)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+
+    def get(self, url):
+        # Look up an entry and mark it as most recently used
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                self.entries.move_to_end(url)
+            return entry
+
+    def put(self, url, etag=None, last_modified=None, fingerprint=None, data=None):
+        with self.lock:
+            self.entries[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'fingerprint': fingerprint,
+                'data': data,
+            }
+            self.entries.move_to_end(url)
+            self.changed.add(url)
+            self._evict()
+
+    def record(self, outcome):
+        # outcome is 'hit' (unchanged fingerprint), 'not_modified' (HTTP 304) or 'miss' (page parsed)
+        with self.lock:
+            if outcome == 'miss':
+                self.misses += 1
+            else:
+                self.hits += 1
+                if outcome == 'not_modified':
+                    self.not_modified += 1
+
+    def _evict(self):
+        # Drop least recently used entries beyond max_entries; caller holds the lock
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'not_modified': self.not_modified,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
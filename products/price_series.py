@@ -0,0 +1,146 @@
+import sys
+from array import array
+from datetime import timedelta
+from django.conf import settings
+from trackit.db import write_atomic
+from .models import PriceSeries, PriceUpdate, PriceRollup
+
+
+def _pack(values, typecode):
+    # Arrays are stored little-endian whatever the machine, so the blobs can be moved between hosts
+    packed = array(typecode, values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack(data, typecode):
+    values = array(typecode)
+    values.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def encode_runs(points):
+    """Run-length encode (date, price) points, in date order, into PriceSeries field values.
+
+    Only the days on which the price changed are kept. When a day has several points (the
+    tracker may check a product more than once a day) the last one is the price of the day.
+    """
+    start_date = end_date = None
+    days, prices = array('I'), array('i')
+    for day, price in points:
+        if start_date is None:
+            start_date = day
+        offset = (day - start_date).days
+        if days and days[-1] == offset:
+            # A later check on the same day replaces the day's price
+            days.pop()
+            prices.pop()
+        if not prices or prices[-1] != price:
+            days.append(offset)
+            prices.append(price)
+        end_date = day
+    return {'start_date': start_date, 'end_date': end_date, 'days': _pack(days, 'I'),
+            'prices': _pack(prices, 'i'), 'runs': len(days)}
+
+
+def decode_runs(series):
+    # The (date, price) at which each run begins
+    return [(series.start_date + timedelta(days=offset), price)
+            for offset, price in zip(_unpack(series.days, 'I'), _unpack(series.prices, 'i'))]
+
+
+def daily_prices(series, start=None, end=None):
+    """Expand a series into a dense daily (dates, prices) series from start to end (inclusive).
+
+    Every day between checks carries the last price seen, and the range is clipped to the days
+    the product was tracked.
+    """
+    first = max(start, series.start_date) if start else series.start_date
+    last = min(end, series.end_date) if end else series.end_date
+    if first > last:
+        return [], []
+    offsets, run_prices = _unpack(series.days, 'I'), _unpack(series.prices, 'i')
+    first_offset, last_offset = (first - series.start_date).days, (last - series.start_date).days
+    prices = []
+    # Each run covers the days up to the next run's start, or up to end_date for the last run
+    ends = list(offsets[1:]) + [(series.end_date - series.start_date).days + 1]
+    for run_start, run_end, price in zip(offsets, ends, run_prices):
+        days = min(run_end, last_offset + 1) - max(run_start, first_offset)
+        if days > 0:
+            prices.extend([price] * days)
+    dates = [first + timedelta(days=i) for i in range(len(prices))]
+    return dates, prices
+
+
+def get_daily_series(product_ids, start=None, end=None):
+    """Return {product_id: (dates, prices)} of dense daily series, loaded with a single query.
+
+    Products without a series (never checked, or not yet built) map to empty series.
+    """
+    series = {product_id: ([], []) for product_id in product_ids}
+    for row in PriceSeries.objects.filter(product_id__in=product_ids).iterator():
+        series[row.product_id] = daily_prices(row, start, end)
+    return series
+
+
+def build_series(product_ids):
+    """Rebuild the series of the given products from their PriceUpdate rows; returns the number built.
+
+    History the retention job rolled up contributes each period's close from its first day on.
+    Rollups and rows are streamed in one ordered query each, and the series replaced in one transaction.
+    """
+    points = {}
+    for product_id, day, price in (PriceRollup.objects.filter(product_id__in=product_ids)
+                                   .order_by('product_id', 'period_start')
+                                   .values_list('product_id', 'period_start', 'close_price').iterator()):
+        points.setdefault(product_id, []).append((day, price))
+    for product_id, day, price in (PriceUpdate.objects.filter(product_id__in=product_ids)
+                                   .order_by('product_id', 'dates', 'id')
+                                   .values_list('product_id', 'dates', 'price').iterator()):
+        points.setdefault(product_id, []).append((day, price))
+    series = [PriceSeries(product_id=product_id, **encode_runs(product_points))
+              for product_id, product_points in points.items()]
+    with write_atomic():
+        PriceSeries.objects.filter(product_id__in=product_ids).delete()
+        PriceSeries.objects.bulk_create(series, batch_size=settings.PRICE_UPDATE_BATCH_SIZE)
+    return len(series)
+
+
+def append_prices(batch, current_date):
+    """Add a batch of (product, price) checks made on current_date to the products' series.
+
+    Existing series are read in one query and written back with one bulk UPDATE; products
+    without a series get a new one. A check dated before the end of a series can not be
+    appended, so such series are rebuilt from PriceUpdate instead (which must already hold it).
+    """
+    product_ids = [product.id for product, _ in batch]
+    existing = {row.product_id: row for row in PriceSeries.objects.filter(product_id__in=product_ids)}
+    created, changed, stale = {}, {}, set()
+    for product, price in batch:
+        row = created.get(product.id) or existing.get(product.id)
+        if row is None:
+            created[product.id] = PriceSeries(product_id=product.id, **encode_runs([(current_date, price)]))
+            continue
+        if current_date < row.end_date:
+            stale.add(product.id)
+            continue
+        points = decode_runs(row)
+        # The last run is repeated on end_date so a same-day check replaces the day's price
+        points.append((row.end_date, points[-1][1]))
+        points.append((current_date, price))
+        for field, value in encode_runs(points).items():
+            setattr(row, field, value)
+        if row.product_id in existing:
+            changed[row.product_id] = row
+    with write_atomic():
+        PriceSeries.objects.bulk_create(created.values(), batch_size=settings.PRICE_UPDATE_BATCH_SIZE)
+        PriceSeries.objects.bulk_update(
+            [row for product_id, row in changed.items() if product_id not in stale],
+            ['start_date', 'end_date', 'days', 'prices', 'runs'],
+            batch_size=settings.PRICE_UPDATE_BATCH_SIZE,
+        )
+        if stale:
+            build_series(stale)
@@ -1,129 +1,171 @@
+import logging
 import time
-from datetime import datetime, timedelta
-from django.utils.timezone import now, make_aware
-from .models import Products, PriceUpdate, TrackingStatus
-from .utils import flipkart_scrapper, ebay_scrapper
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-import os.path
-import base64
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from django.utils.timezone import now
+from .models import Products, PriceUpdate, MetricsSnapshot
+from .scrape_engine import scrape_products
+from .page_cache import PageCache
+from .refresh import adapt_interval, check_delay, subscriber_counts
+from .work_queue import claim_tasks, complete_tasks, fail_tasks, finish_job_if_complete, release_tasks, renew_leases
+from .alerts import queue_alerts
+from .profiling import save_metrics
+from .price_series import append_prices
+from django.conf import settings
+from trackit import metrics
+from trackit.db import write_atomic
 
-def get_most_recent_update_date():
-    # Attempt to find the most recent price update from the database
-    last_update = PriceUpdate.objects.all().order_by('-dates').first()
-    if last_update:
-        # If an update exists, return the date of the last update
-        return last_update.dates
-    else:
-        # If there's no update, return a date far in the past to ensure a new update is processed
-        return make_aware(datetime.now() - timedelta(days=365)).date()
-    
-# Function to send email using Gmail API
-def send_email_notification(email_address, product_name, old_price, new_price):
-    SCOPES = ['https://www.googleapis.com/auth/gmail.send']
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
+logger = logging.getLogger(__name__)
 
-    try:
-        service = build('gmail', 'v1', credentials=creds)
-        message = MIMEMultipart()
-        message['to'] = email_address
-        message['subject'] = 'Price Drop Alert!'
-        body = f"""
-        Hi there,
+def write_price_updates(batch, current_date):
+    """Save a batch of (product, price) results and return each product's previously known price.
 
-        Great news! The price of {product_name} has dropped by more than 25%.
-        Previous Price: {old_price}
-        New Price: {new_price}
+    The products' maintained price columns are read in a single query, then the day's PriceUpdate
+    rows are upserted with one bulk INSERT and the current/previous price and check/change times
+    written with one bulk UPDATE inside the same transaction. The same UPDATE moves each product's
+    next check earlier or later depending on whether its price changed and how many users track it.
+    The products' compact price series are extended in the same transaction.
+    """
+    checked_at = now()
+    product_ids = [product.id for product, _ in batch]
+    with write_atomic():
+        known = {
+            product_id: (current_price, previous_price, last_changed_at, check_interval)
+            for product_id, current_price, previous_price, last_changed_at, check_interval in
+            Products.objects.filter(id__in=product_ids)
+            .values_list('id', 'current_price', 'previous_price', 'last_changed_at', 'check_interval')
+        }
+        subscribers = subscriber_counts(product_ids)
+        # A product keeps one row per day: a later check on the same day overwrites the day's price
+        PriceUpdate.objects.bulk_create(
+            [PriceUpdate(product=product, dates=current_date, price=price) for product, price in batch],
+            batch_size=settings.PRICE_UPDATE_BATCH_SIZE,
+            update_conflicts=True, unique_fields=['product', 'dates'], update_fields=['price'],
+        )
+        changed = []
+        for product, price in batch:
+            current_price, previous_price, last_changed_at, check_interval = known.get(
+                product.id, (None, None, None, None))
+            # The first price ever recorded is not a change, so new products keep the default interval
+            if current_price is None:
+                previous_price, last_changed_at = None, checked_at
+            elif price != current_price:
+                previous_price, last_changed_at = current_price, checked_at
+                check_interval = adapt_interval(check_interval, changed=True)
+            else:
+                check_interval = adapt_interval(check_interval, changed=False)
+            check_interval = check_interval or settings.REFRESH_DEFAULT_INTERVAL
+            changed.append(Products(
+                id=product.id,
+                current_price=price,
+                previous_price=previous_price,
+                last_checked_at=checked_at,
+                last_changed_at=last_changed_at,
+                check_interval=check_interval,
+                next_check_at=checked_at + check_delay(check_interval, subscribers.get(product.id, 0)),
+                failure_count=0,
+            ))
+        Products.objects.bulk_update(
+            changed,
+            ['current_price', 'previous_price', 'last_checked_at', 'last_changed_at',
+             'check_interval', 'next_check_at', 'failure_count'],
+            batch_size=settings.PRICE_UPDATE_BATCH_SIZE,
+        )
+        append_prices(batch, current_date)
+    return {product_id: values[0] for product_id, values in known.items()}
 
-        Check it out on the website now!
-        """
-        message.attach(MIMEText(body, 'plain'))
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        message_body = {'raw': raw_message}
-        send_message = service.users().messages().send(userId='me', body=message_body).execute()
-        print(f"Email sent to {email_address}: {send_message}")
-    except HttpError as error:
-        print(f'An error occurred: {error}')
 
-def update_all_products():
-    while True:  # Start an infinite loop to continuously check for price updates
-        # Check the tracking status to see if updates should be processed
-        tracking_status = TrackingStatus.objects.first()  # Assumes a single tracking status entry
-        if not tracking_status or not tracking_status.is_tracking:
-            # Exit loop if tracking is not enabled or not configured
-            print("Tracking stopped or not configured. Exiting the loop.")
-            break
+def process_price_batch(batch, current_date, tasks=(), worker=None):
+    # Persist a batch of scraped prices, mark its queue tasks done and queue alerts for subscribers
+    # whose alert rules the new prices meet, all in the same transaction, which takes the write lock
+    # up front: SQLite cannot upgrade a transaction that has only read while another worker is writing.
+    # Only prices of tasks still leased to worker are saved: a task whose lease lapsed may have been
+    # taken over, and the worker now holding it saves its price instead.
+    with metrics.timed('db'), write_atomic():
+        if tasks:
+            held = complete_tasks(tasks, worker)
+            held_products = {task.product_id for task in tasks if task.id in held}
+            batch = [(product, price) for product, price in batch if product.id in held_products]
+        previous_prices = write_price_updates(batch, current_date) if batch else {}
+        # Rules are evaluated over the whole batch at once; the emails are sent by the notification
+        # service (manage.py send_alerts), so mailing never holds up scraping
+        queued = queue_alerts(batch, previous_prices, current_date) if batch else 0
+    metrics.inc('trackit_prices_saved_total', len(batch))
+    logger.info("Saved %d price updates, queued %d price alerts", len(batch), queued)
 
-        # Tracking is active; proceed with updating prices
-        current_date = now().date()
-        last_checked_date = get_most_recent_update_date()
-        # Log the date checking process
-        print(f"Current Date: {current_date}, Last Checked Date: {last_checked_date}")
 
-        if current_date > last_checked_date:
-            # Only proceed if the current date is after the last checked date
-            products = Products.objects.all()
-            for product in products:
-                # Determine which scraper to use based on the product's URL
-                if "flipkart" in product.product_url:
-                    scrape_data = flipkart_scrapper(product.product_url)
-                elif "ebay" in product.product_url:
-                    scrape_data = ebay_scrapper(product.product_url)
-                else:
-                    # Skip if no suitable scraper is found
-                    print(f"No suitable scraper found for {product.product_url}")
-                    continue
+def run_tracking_pass(job, worker, should_continue=None, batch_size=None):
+    """Work through a tracking job's queue until it is finished or the worker is told to stop.
+
+    Tasks are claimed in batches under a lease, scraped concurrently and marked done in the
+    same transaction that saves their prices, so a worker that dies mid-batch only loses its
+    lease and the tasks are picked up again by the next worker. While a batch is scraped, its
+    leases are renewed every TASK_CHECKPOINT_SECONDS so a slow batch keeps its tasks, and only
+    tasks still leased to this worker are saved. should_continue is called
+    before each batch and at each of those checkpoints, and stops the pass when it returns
+    False: the results in hand are saved and the batch's unfinished tasks handed back to the
+    queue for other workers. batch_size is the number of
+    tasks claimed at a time (settings.PRICE_UPDATE_BATCH_SIZE by default); smaller batches
+    spread a job more evenly over many workers. Returns True once the job is finished.
+    After every batch the worker saves its metrics, and separately what it recorded for this
+    job, which makes up the job's share of the pass profile (manage.py profile_pass).
+    """
+    current_date = now().date()
+    batch_size = batch_size or settings.PRICE_UPDATE_BATCH_SIZE
+    logger.info("Tracking pass #%d: %d products left to check", job.pk, job.progress()['pending'])
+    # Whatever this process already recorded for the job is kept when it resumes the job
+    saved = MetricsSnapshot.objects.filter(source=worker, job=job).values_list('data', flat=True).first()
+    baseline = metrics.subtract(metrics.snapshot(), saved) if saved else metrics.snapshot()
+
+    # Validators and fingerprints from earlier passes let unchanged pages skip the download or the parse
+    page_cache = PageCache(settings.PAGE_CACHE_PATH, settings.PAGE_CACHE_SIZE).load()
+    completed = False
+    try:
+        while not should_continue or should_continue():
+            tasks = claim_tasks(job, worker, batch_size)
+            if not tasks:
+                if finish_job_if_complete(job):
+                    completed = True
+                    break
+                # The remaining tasks are leased by other workers or waiting to be retried
+                time.sleep(settings.TRACKER_POLL_SECONDS)
+                continue
 
-                # If scraping is successful and a price is found, update the product's price
-                if scrape_data and 'price' in scrape_data and scrape_data['price'] is not None:
-                    PriceUpdate.objects.create(
-                        product=product,
-                        dates=current_date,
-                        price=scrape_data['price']
-                        
-                    )
-                    print(f"Updated price for {product.product_name} to {scrape_data['price']}")
-                    
+            tasks_by_product = {task.product_id: task for task in tasks}
+            batch, done, failed = [], [], []
+            checkpoint = time.monotonic()
+            stopped = False
+            # Pages are fetched concurrently within per-retailer limits; results arrive as they finish
+            for product, scrape_data in scrape_products([task.product for task in tasks], cache=page_cache):
+                if time.monotonic() - checkpoint >= settings.TASK_CHECKPOINT_SECONDS:
+                    if should_continue and not should_continue():
+                        stopped = True
+                        break
+                    renew_leases(tasks, worker)
+                    checkpoint = time.monotonic()
+                task = tasks_by_product[product.id]
+                if scrape_data and scrape_data.get('price') is not None:
+                    batch.append((product, scrape_data['price']))
+                    done.append(task)
                 else:
-                    # Log failure if scraping didn't return a price
-                    print(f"Failed to fetch price for {product.product_name}")
-                
-                try:
-                    # Try to get the previous price update for the product
-                    previous_update = PriceUpdate.objects.filter(product=product).order_by('-dates').exclude(dates=current_date).first()
-                    if previous_update:
-                        price_drop_percentage = ((previous_update.price - scrape_data['price']) / previous_update.price) * 100
-                        if price_drop_percentage >= 25:
-                            # If the price dropped by 25% or more, send an email notification
-                            for user in product.user.all():
-                                send_email_notification(user.email, product.product_name, previous_update.price, scrape_data['price'])
-                                print(f"Email sent to {user.email} about a price drop in {product.product_name}")
-                except Exception as e:
-                    print(f"Error checking price drop or sending email for {product.product_name}: {str(e)}")
+                    # Failures are counted by retailer in trackit_scrapes_total; the log names the product
+                    logger.warning("Failed to fetch price for %s", product.product_name)
+                    failed.append((task, (scrape_data or {}).get('error', 'No price found')))
+            if batch:
+                process_price_batch(batch, current_date, done, worker)
+            if failed:
+                with metrics.timed('db'):
+                    fail_tasks(failed, worker)
+            if stopped:
+                # The rest of the batch goes back to the queue now instead of when its lease runs out
+                finished = {task.id for task in done} | {task.id for task, _ in failed}
+                release_tasks([task for task in tasks if task.id not in finished], worker)
+            save_metrics(worker)
+            save_metrics(worker, job, metrics.subtract(metrics.snapshot(), baseline))
+            if stopped:
+                break
 
-            print("All products updated. Waiting for the next day to check again.")
-        else:
-            # If the current date hasn't changed since the last check, wait for 4 hours before trying again
-            print("No date change detected. Next check in 4 hours.")
-        
-        time.sleep(14400)  # Sleep for 4 hours (14400 seconds) before the next iteration
+            progress = job.progress()
+            logger.info("Tracking pass #%d: %.1f%% complete, %.1f products/min, %d failed",
+                        job.pk, progress['percent'], progress['per_minute'], progress['failed'])
+    finally:
+        page_cache.save()
+    return completed
@@ -0,0 +1,121 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q, F
+from django.utils.timezone import now
+from trackit.db import write_atomic
+from .models import Products, ProductFetch
+from .price_update import write_price_updates
+from .retailers import canonical_product, product_key
+from .scrape_engine import scrape_products
+
+
+def add_product(product_url, user):
+    """Add a product to a user's list without waiting for its page, returning (product, queued).
+
+    A product seen for the first time is created as pending and a fetch of its details is queued
+    for the fetch service (manage.py fetch_products). Users adding a URL that is already pending
+    join the fetch in flight, so concurrent adds of the same URL cause a single scrape; a product
+    whose fetch failed is queued again.
+    """
+    # Products are looked up by their retailer item, so the same item reached through another URL is
+    # found; the unique item key makes a racing insert fail, and get_or_create then returns the winner's row
+    retailer, item_id, product_url = canonical_product(product_url)
+    product, created = Products.objects.get_or_create(
+        **product_key(retailer, item_id, product_url),
+        defaults={'product_url': product_url, 'retailer': retailer, 'item_id': item_id,
+                  'product_name': product_url, 'product_img': '', 'product_price': 0,
+                  'date_added': now().date(), 'status': Products.PENDING},
+    )
+    product.user.add(user)
+    queued = (created or product.status == Products.FAILED) and bool(queue_fetches([product.id]))
+    if queued:
+        product.status = Products.PENDING
+    return product, queued
+
+
+def queue_fetches(product_ids):
+    # Mark products pending and queue a fetch of each; products that already have one queued keep it.
+    # Products that became active meanwhile (fetched by the service) are left as they are; returns the
+    # ids of the products queued
+    with write_atomic():
+        product_ids = list(Products.objects.filter(id__in=product_ids).exclude(status=Products.ACTIVE)
+                           .values_list('id', flat=True))
+        Products.objects.filter(id__in=product_ids).update(status=Products.PENDING, fetch_error='')
+        ProductFetch.objects.bulk_create([ProductFetch(product_id=product_id) for product_id in product_ids],
+                                         ignore_conflicts=True)
+    return product_ids
+
+
+def _claimable(queryset, current):
+    return queryset.filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=current))
+
+
+def claim_fetches(worker, limit):
+    # Lease up to limit of the oldest queued fetches to worker, as in the tracking work queue
+    current = now()
+    expires = current + timedelta(seconds=settings.PRODUCT_FETCH_LEASE_SECONDS)
+    candidates = list(_claimable(ProductFetch.objects.all(), current).order_by('created_at')
+                      .values_list('product_id', flat=True)[:limit])
+    if not candidates:
+        return []
+    _claimable(ProductFetch.objects.filter(product_id__in=candidates), current).update(
+        lease_owner=worker, lease_expires_at=expires, attempts=F('attempts') + 1)
+    return list(ProductFetch.objects.filter(product_id__in=candidates, lease_owner=worker, lease_expires_at=expires)
+                .select_related('product'))
+
+
+def finish_fetches(results):
+    """Save the outcome of a batch of fetches given as {fetch: scrape_data}.
+
+    Fetched products get their details and first price (through the tracker's write path, which
+    also schedules their next check) and become active. Failed fetches are retried after
+    PRODUCT_FETCH_RETRY_DELAY, and their product marked failed after PRODUCT_FETCH_MAX_ATTEMPTS.
+    """
+    current = now()
+    fetched, retried, failed = [], [], []
+    for fetch, data in results.items():
+        product = fetch.product
+        if data and data.get('price') is not None:
+            product.product_name = data.get('title') or product.product_name
+            product.product_img = data.get('img_link') or ''
+            product.product_price = data['price']
+            product.status = Products.ACTIVE
+            fetched.append(product)
+            continue
+        fetch.last_error = ((data or {}).get('error') or 'No price found')[:255]
+        if fetch.attempts >= settings.PRODUCT_FETCH_MAX_ATTEMPTS:
+            product.status, product.fetch_error = Products.FAILED, fetch.last_error
+            failed.append(fetch)
+        else:
+            fetch.lease_expires_at = current + timedelta(seconds=settings.PRODUCT_FETCH_RETRY_DELAY)
+            retried.append(fetch)
+    with write_atomic():
+        ProductFetch.objects.filter(product_id__in=[product.id for product in fetched]
+                                    + [fetch.product_id for fetch in failed]).delete()
+        ProductFetch.objects.bulk_update(retried, ['lease_expires_at', 'last_error'])
+        Products.objects.bulk_update(fetched, ['product_name', 'product_img', 'product_price', 'status'])
+        Products.objects.bulk_update([fetch.product for fetch in failed], ['status', 'fetch_error'])
+        if fetched:
+            write_price_updates([(product, product.product_price) for product in fetched], current.date())
+    return {'fetched': len(fetched), 'retried': len(retried), 'failed': len(failed)}
+
+
+def run_fetches(worker, progress=None):
+    """Fetch every queued product, PRODUCT_FETCH_BATCH_SIZE at a time, and return the totals.
+
+    progress, if given, is called with the running totals after each batch.
+    """
+    totals = {'fetched': 0, 'retried': 0, 'failed': 0}
+    while True:
+        fetches = claim_fetches(worker, settings.PRODUCT_FETCH_BATCH_SIZE)
+        if not fetches:
+            break
+        by_product = {fetch.product_id: fetch for fetch in fetches}
+        # Pages are fetched concurrently within the same per-retailer limits as the tracker
+        results = {by_product[product.id]: data
+                   for product, data in scrape_products([fetch.product for fetch in fetches])}
+        for key, value in finish_fetches(results).items():
+            totals[key] += value
+        if progress:
+            progress(totals)
+    return totals
@@ -0,0 +1,82 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils.timezone import now
+from trackit import metrics
+from trackit.db import write_atomic
+from .models import MetricsSnapshot, TrackingJob, PriceAlert
+from accounts.outbox import outbox_depth
+
+
+def save_metrics(source, job=None, data=None):
+    """Save this process's metrics (or data, e.g. the share of a pass) under source.
+
+    On a process's first save, snapshots of processes that have not saved for
+    METRICS_RETENTION_SECONDS are deleted, so restarted processes do not pile up.
+    """
+    # update_or_create reads the row before writing it, so the write lock is taken up front
+    with write_atomic():
+        _, created = MetricsSnapshot.objects.update_or_create(
+            source=source, job=job, defaults={'data': data if data is not None else metrics.snapshot()})
+    if created and job is None:
+        stale_before = now() - timedelta(seconds=settings.METRICS_RETENTION_SECONDS)
+        MetricsSnapshot.objects.filter(job__isnull=True, updated_at__lt=stale_before).delete()
+
+
+def collect_metrics():
+    # Every process's counters and histograms added up
+    return metrics.merge(MetricsSnapshot.objects.filter(job__isnull=True).values_list('data', flat=True))
+
+
+def current_gauges():
+    """Return (name, help, value) gauges read from the database: the latest pass and the queues."""
+    gauges = []
+    job = TrackingJob.objects.order_by('-created_at').first()
+    if job:
+        progress = job.progress()
+        gauges += [
+            ('trackit_pass_products_per_minute', "Products checked per minute by the latest tracking pass",
+             round(progress['per_minute'], 3)),
+            ('trackit_pass_percent_complete', "Completion of the latest tracking pass", round(progress['percent'], 3)),
+            ('trackit_pass_pending_tasks', "Products the latest tracking pass has yet to check", progress['pending']),
+            ('trackit_pass_failed_tasks', "Products the latest tracking pass gave up on", progress['failed']),
+        ]
+    gauges += [
+        ('trackit_alerts_pending', "Price alerts waiting to be emailed",
+         PriceAlert.objects.filter(status=PriceAlert.PENDING).count()),
+        ('trackit_outbox_pending', "Account emails waiting to be sent", outbox_depth()),
+    ]
+    return gauges
+
+
+def pass_profile(job):
+    """Return the profile of a tracking pass: throughput, time per stage and outcomes per retailer."""
+    data = metrics.merge(job.metrics.values_list('data', flat=True))
+    # Stage timings of every retailer added up per stage
+    by_stage = {}
+    for key, histogram in data['histograms'].items():
+        stage = metrics.parse_series(key)[1]['stage']
+        by_stage.setdefault(stage, []).append({'histograms': {stage: histogram}})
+    stages = {stage: metrics.merge(parts)['histograms'][stage] for stage, parts in by_stage.items()}
+    # Requests, retries and scrape outcomes per retailer
+    retailers = {}
+    for key, value in data['counters'].items():
+        name, labels = metrics.parse_series(key)
+        if name == 'trackit_scrapes_total':
+            column = labels['outcome']
+        elif name == 'trackit_http_requests_total':
+            column = 'requests'
+        elif name == 'trackit_http_retries_total':
+            column = 'retries'
+        else:
+            continue
+        counts = retailers.setdefault(labels['retailer'], {})
+        counts[column] = counts.get(column, 0) + value
+    return {
+        'progress': job.progress(),
+        'workers': job.metrics.count(),
+        'prices_saved': data['counters'].get('trackit_prices_saved_total', 0),
+        'stages': {stage: {'count': histogram['count'], 'seconds': histogram['sum'],
+                           'p50': metrics.quantile(histogram, 0.5), 'p95': metrics.quantile(histogram, 0.95)}
+                   for stage, histogram in stages.items()},
+        'retailers': retailers,
+    }
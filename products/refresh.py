@@ -0,0 +1,46 @@
+import math
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count
+from .models import Products
+
+
+def adapt_interval(interval, changed):
+    """Return a product's new base check interval in seconds after a successful check.
+
+    Products whose price moved are checked twice as often, and each check that finds the
+    same price stretches the interval by half again, within the configured bounds.
+    """
+    interval = interval or settings.REFRESH_DEFAULT_INTERVAL
+    interval = interval / 2 if changed else interval * 1.5
+    return int(min(max(interval, settings.REFRESH_MIN_INTERVAL), settings.REFRESH_MAX_INTERVAL))
+
+
+def check_delay(interval, subscribers):
+    # Products more users are waiting on are checked sooner: one more step of speed-up per doubling
+    weight = 1 + math.log2(subscribers) if subscribers > 1 else 1
+    return timedelta(seconds=max(interval / weight, settings.REFRESH_MIN_INTERVAL))
+
+
+def failure_delay(failures):
+    # Exponential backoff for product pages that keep failing: 1x, 2x, 4x ... the base delay, capped
+    delay = settings.REFRESH_FAILURE_DELAY * 2 ** (failures - 1)
+    return timedelta(seconds=min(delay, settings.REFRESH_MAX_INTERVAL))
+
+
+def subscriber_counts(product_ids):
+    # Number of users tracking each product, in a single query over the many-to-many table
+    return dict(
+        Products.user.through.objects.filter(products_id__in=product_ids)
+        .values('products_id').annotate(subscribers=Count('id')).values_list('products_id', 'subscribers')
+    )
+
+
+def record_check_failures(product_ids, failed_at):
+    """Push back the next check of products whose tracking task has used up its attempts."""
+    products = list(Products.objects.filter(id__in=product_ids).only('id', 'failure_count'))
+    for product in products:
+        product.failure_count += 1
+        product.next_check_at = failed_at + failure_delay(product.failure_count)
+    Products.objects.bulk_update(products, ['failure_count', 'next_check_at'],
+                                 batch_size=settings.PRICE_UPDATE_BATCH_SIZE)
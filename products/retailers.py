@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from urllib.parse import parse_qs, urlencode, urlparse, urlsplit, urlunsplit
+from django.conf import settings
+from trackit import metrics
+from .extractors import compile_rules, extract
+from .utils import fetch_and_parse
+
+logger = logging.getLogger(__name__)
+
+# Matches the first number in a price text, e.g. "1,29,999" in "₹1,29,999" or "1,234.56" in "US $1,234.56"
+PRICE_PATTERN = re.compile(r'\d[\d,]*(?:\.\d+)?')
+
+# Host prefixes that serve the same catalog as the bare domain
+HOST_PREFIXES = ('www.', 'm.')
+
+# Seconds between checks of the selector overrides file for changes
+SELECTOR_RELOAD_INTERVAL = 30
+
+
+class Retailer:
+    """Everything the tracker needs to know about one retailer.
+
+    fields describes where the title, price and image live on a product page (see
+    products.extractors), price_scale converts the displayed price into the stored
+    integer (100 stores eBay prices in cents), and limits holds the scrape engine's
+    max_concurrency, request_budget and min_interval for this retailer.
+
+    item_pattern finds the retailer's stable item ID (its 'item' group) in a product URL's path,
+    and item_param names a query parameter that, when present, identifies the item more precisely
+    (e.g. a Flipkart variant). canonical_path formats the path of the canonical URL from the
+    pattern's groups; by default the matched part of the path is kept.
+    """
+
+    def __init__(self, name, domains, fields, fingerprint_marker, price_scale=1,
+                 price_pattern=PRICE_PATTERN, limits=None, item_pattern=None, item_param=None,
+                 canonical_path=None):
+        self.name = name
+        self.domains = domains
+        self.price_scale = price_scale
+        self.price_pattern = price_pattern
+        self.limits = limits or {}
+        self.item_pattern = re.compile(item_pattern) if item_pattern else None
+        self.item_param = item_param
+        self.canonical_path = canonical_path
+        self.set_selectors(fields, fingerprint_marker)
+
+    def set_selectors(self, fields, fingerprint_marker):
+        # Compile the rules before swapping them in, so concurrent scrapes always see a complete set
+        rules = compile_rules(fields)
+        self.fields = fields
+        self.rules = rules
+        self.fingerprint_marker = fingerprint_marker.encode()
+
+    def parse_price(self, text):
+        # Convert displayed price text to an integer in the retailer's stored unit
+        match = self.price_pattern.search(text or '')
+        if not match:
+            return None
+        try:
+            return int(Decimal(match.group().replace(',', '')) * self.price_scale)
+        except InvalidOperation:
+            logger.warning("Price conversion error for %s: %s", self.name, text)
+            metrics.inc('trackit_parse_errors_total', retailer=self.name)
+            return None
+
+    def parse(self, content):
+        fields = extract(content, self.rules)
+        return {'title': fields['title'], 'price': self.parse_price(fields['price']), 'img_link': fields['img_link']}
+
+    def canonicalize(self, url):
+        # (item ID, canonical URL) of one of this retailer's product URLs, or None if it has no item ID
+        parts = urlsplit(url.strip())
+        match = self.item_pattern.search(parts.path) if self.item_pattern else None
+        if match is None:
+            return None
+        item_id, query = match.group('item'), ''
+        if self.item_param:
+            value = parse_qs(parts.query).get(self.item_param, [''])[0]
+            if value:
+                item_id, query = value, urlencode({self.item_param: value})
+        # Mobile and bare hosts serve the same page as www
+        host = (parts.hostname or '').lower()
+        for prefix in HOST_PREFIXES:
+            if host.startswith(prefix):
+                host = host[len(prefix):]
+                break
+        path = self.canonical_path.format(**match.groupdict()) if self.canonical_path else match.group(0)
+        return item_id, urlunsplit(('https', 'www.' + host, path, query, ''))
+
+    def scrape(self, url, cache=None):
+        # Fetch and parse a product page, returning {'title', 'price', 'img_link'} or {'error'}
+        return fetch_and_parse(url, self.parse, self.fingerprint_marker, cache, self.name)
+
+
+# Registered retailers by name, and by every hostname they serve for constant-time URL lookup
+RETAILERS = {}
+_retailers_by_host = {}
+
+
+def register(retailer):
+    RETAILERS[retailer.name] = retailer
+    for domain in retailer.domains:
+        _retailers_by_host[domain] = retailer
+        for prefix in HOST_PREFIXES:
+            _retailers_by_host[prefix + domain] = retailer
+    return retailer
+
+
+def get_retailer(url):
+    """Return the Retailer serving a product URL, or None if the site is not supported."""
+    reload_selectors()
+    hostname = (urlparse(url).hostname or '').lower()
+    return _retailers_by_host.get(hostname)
+
+
+def canonical_product(url):
+    """Return (retailer name, item ID, URL) identifying the product behind a URL.
+
+    A supported product URL gives its retailer's stable item ID and canonical URL, so the same item
+    reached through tracking parameters, reordered query strings or mobile hosts is one product.
+    Other URLs give an empty item ID and the URL unchanged, with an empty retailer name if the site
+    is not supported.
+    """
+    retailer = get_retailer(url)
+    if retailer is None:
+        return '', '', url
+    canonical = retailer.canonicalize(url)
+    if canonical is None:
+        return retailer.name, '', url
+    return (retailer.name, *canonical)
+
+
+def product_key(retailer_name, item_id, url):
+    # Lookup of the product behind a canonical_product() result: by its indexed item key when it has one
+    if item_id:
+        return {'retailer': retailer_name, 'item_id': item_id}
+    return {'product_url': url}
+
+
+def retailer_for(product):
+    """Return the Retailer scraping a product, from its stored retailer name or else its URL."""
+    retailer = RETAILERS.get(product.retailer)
+    if retailer is None:
+        return get_retailer(product.product_url)
+    reload_selectors()
+    return retailer
+
+
+register(Retailer(
+    name='flipkart',
+    domains=['flipkart.com'],
+    fields={
+        'title': {'tag': 'span', 'classes': ['B_NuCI']},
+        'price': {'tag': 'div', 'classes': ['_30jeq3 _16Jk6d']},
+        'img_link': {'tag': 'img', 'classes': ['_2r_T1I _396QI4', '_396cs4 _2amPTt _3qGmMb'], 'attr': 'src'},
+    },
+    fingerprint_marker='_30jeq3',
+    limits={'max_concurrency': 4, 'request_budget': None, 'min_interval': 0.25},
+    # /<slug>/p/itm<listing id>?pid=<product id>; the pid tells a listing's variants apart, so it is the
+    # item ID when present. A URL without it is keyed by the listing, and can not be matched to the
+    # variant pid URLs of the same listing without fetching the page, so they stay separate products
+    item_pattern=r'^/(?:[^/]+/)?p/(?P<item>itm[0-9a-zA-Z]+)',
+    item_param='pid',
+))
+
+register(Retailer(
+    name='ebay',
+    domains=['ebay.com'],
+    fields={
+        'title': {'tag': 'span', 'classes': ['ux-textspans ux-textspans--BOLD']},
+        'price': {'tag': 'span', 'classes': ['ux-textspans'], 'inside': ('div', 'x-price-primary')},
+        'img_link': {'tag': 'img', 'classes': [''], 'inside': ('div', 'ux-image-carousel-item'), 'attr': 'src'},
+    },
+    fingerprint_marker='x-price-primary',
+    # eBay prices are stored in cents
+    price_scale=100,
+    limits={'max_concurrency': 4, 'request_budget': None, 'min_interval': 0.25},
+    # /itm/<item number> or /itm/<slug>/<item number>
+    item_pattern=r'^/itm/(?:[^/]+/)?(?P<item>\d{9,})',
+    canonical_path='/itm/{item}',
+))
+
+
+# State of the selector overrides file: when it was last checked and the mtime that was loaded
+_selectors_lock = threading.Lock()
+_selectors_checked_at = 0.0
+_selectors_mtime = None
+
+
+def reload_selectors(force=False):
+    """Apply selector overrides from settings.RETAILER_SELECTORS_PATH if the file has changed.
+
+    The file is a JSON object keyed by retailer name, each value holding 'fields' and/or
+    'fingerprint_marker'. It is checked at most every SELECTOR_RELOAD_INTERVAL seconds,
+    so selectors can be fixed without restarting the tracker or the web server.
+    """
+    global _selectors_checked_at, _selectors_mtime
+    path = getattr(settings, 'RETAILER_SELECTORS_PATH', None)
+    if not path:
+        return
+    current = time.monotonic()
+    if not force and current - _selectors_checked_at < SELECTOR_RELOAD_INTERVAL:
+        return
+    with _selectors_lock:
+        _selectors_checked_at = current
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime == _selectors_mtime:
+            return
+        try:
+            with open(path) as selectors_file:
+                overrides = json.load(selectors_file)
+            for name, override in overrides.items():
+                retailer = RETAILERS.get(name)
+                if retailer is None:
+                    logger.warning("Ignoring selectors for unknown retailer %s", name)
+                    continue
+                retailer.set_selectors(
+                    override.get('fields', retailer.fields),
+                    override.get('fingerprint_marker', retailer.fingerprint_marker.decode()),
+                )
+            logger.info("Loaded retailer selectors from %s", path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error("Could not load retailer selectors from %s: %s", path, e)
+        # Remember the mtime either way so a broken file is reported once, not on every check
+        _selectors_mtime = mtime
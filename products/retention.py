@@ -0,0 +1,122 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from trackit.db import write_atomic
+from .models import Products, PriceUpdate, PriceRollup
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def retention_cutoffs(today):
+    """Return (daily_cutoff, weekly_cutoff) for compacting history on today.
+
+    PriceUpdate rows before daily_cutoff are rolled up, into weeks or, when the week starts
+    before weekly_cutoff, into months; weekly rollups before weekly_cutoff are folded into
+    months. Both cutoffs fall on period boundaries, so only whole weeks and months are rolled up.
+    """
+    daily_cutoff = week_start(today - timedelta(days=settings.PRICE_HISTORY_DAILY_DAYS))
+    weekly_cutoff = month_start(today - timedelta(days=settings.PRICE_HISTORY_WEEKLY_DAYS))
+    return daily_cutoff, min(weekly_cutoff, daily_cutoff)
+
+
+def _bucket(day, weekly_cutoff):
+    # Months are made of whole weeks, assigned to the month the week starts in
+    start = week_start(day)
+    if start < weekly_cutoff:
+        return PriceRollup.MONTH, month_start(start)
+    return PriceRollup.WEEK, start
+
+
+def _merge(buckets, key, low, high, close, samples):
+    # Data reaches a period in date order, so the latest close always replaces the earlier one
+    if key in buckets:
+        previous = buckets[key]
+        buckets[key] = (min(previous[0], low), max(previous[1], high), close, previous[3] + samples)
+    else:
+        buckets[key] = (low, high, close, samples)
+
+
+def compact_products(product_ids, daily_cutoff, weekly_cutoff):
+    """Roll the aged history of the given products up and delete what was rolled up.
+
+    Everything is read first and then written in one short transaction that starts with a write,
+    so the database is locked only for the writes. Returns (rows rolled up, rollups written).
+    """
+    # Only this job writes rows this old and rollups, so they can be read outside the transaction
+    aged_weeks = list(PriceRollup.objects.filter(product_id__in=product_ids, period=PriceRollup.WEEK,
+                                                 period_start__lt=weekly_cutoff)
+                      .order_by('product_id', 'period_start'))
+    rows = list(PriceUpdate.objects.filter(product_id__in=product_ids, dates__lt=daily_cutoff)
+                .order_by('product_id', 'dates', 'id').values_list('id', 'product_id', 'dates', 'price'))
+    if not aged_weeks and not rows:
+        return 0, 0
+
+    keys = {(week.product_id, PriceRollup.MONTH, month_start(week.period_start)) for week in aged_weeks}
+    keys |= {(product_id, *_bucket(day, weekly_cutoff)) for _, product_id, day, _ in rows}
+    # Periods already rolled up by earlier runs hold older data, so they are merged in first
+    existing = {}
+    for rollup in PriceRollup.objects.filter(product_id__in=product_ids,
+                                             period_start__in={start for _, _, start in keys}):
+        key = (rollup.product_id, rollup.period, rollup.period_start)
+        if key in keys:
+            existing[key] = rollup
+    buckets = {key: (rollup.min_price, rollup.max_price, rollup.close_price, rollup.samples)
+               for key, rollup in existing.items()}
+    for week in aged_weeks:
+        _merge(buckets, (week.product_id, PriceRollup.MONTH, month_start(week.period_start)),
+               week.min_price, week.max_price, week.close_price, week.samples)
+    for _, product_id, day, price in rows:
+        _merge(buckets, (product_id, *_bucket(day, weekly_cutoff)), price, price, price, 1)
+
+    created, changed = [], []
+    for key, (low, high, close, samples) in buckets.items():
+        rollup = existing.get(key) or PriceRollup(product_id=key[0], period=key[1], period_start=key[2])
+        rollup.min_price, rollup.max_price, rollup.close_price, rollup.samples = low, high, close, samples
+        (changed if rollup.pk else created).append(rollup)
+
+    with write_atomic():
+        if rows:
+            # Bounded by the last row read, so a row backfilled meanwhile is never deleted unseen
+            PriceUpdate.objects.filter(product_id__in=product_ids, dates__lt=daily_cutoff,
+                                       id__lte=max(row[0] for row in rows)).delete()
+        PriceRollup.objects.filter(id__in=[week.id for week in aged_weeks]).delete()
+        PriceRollup.objects.bulk_create(created, batch_size=settings.PRICE_UPDATE_BATCH_SIZE)
+        PriceRollup.objects.bulk_update(changed, ['min_price', 'max_price', 'close_price', 'samples'],
+                                        batch_size=settings.PRICE_UPDATE_BATCH_SIZE)
+        # Histories served or cached before the compaction are stale now
+        compacted = {product_id for _, product_id, _, _ in rows} | {week.product_id for week in aged_weeks}
+        Products.objects.filter(id__in=compacted).update(history_revision=F('history_revision') + 1)
+    return len(rows), len(created) + len(changed)
+
+
+def compact_history(today, batch_size=None, pause=0, should_continue=None):
+    """Apply the retention policy to the whole catalog, batch_size products per transaction.
+
+    Products are walked in id order; pause seconds between batches leave the database to the
+    tracker's writes. should_continue is called before each batch and stops the run when it
+    returns False. Returns the number of rows rolled up and of rollups written.
+    """
+    batch_size = batch_size or settings.PRICE_HISTORY_COMPACTION_BATCH_SIZE
+    daily_cutoff, weekly_cutoff = retention_cutoffs(today)
+    stats = {'rows': 0, 'rollups': 0}
+    last_id = 0
+    while not should_continue or should_continue():
+        product_ids = list(Products.objects.filter(id__gt=last_id).order_by('id')
+                           .values_list('id', flat=True)[:batch_size])
+        if not product_ids:
+            break
+        rows, rollups = compact_products(product_ids, daily_cutoff, weekly_cutoff)
+        stats['rows'] += rows
+        stats['rollups'] += rollups
+        last_id = product_ids[-1]
+        if rows and pause:
+            time.sleep(pause)
+    return stats
+
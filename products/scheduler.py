@@ -0,0 +1,141 @@
+import logging
+import os
+import signal
+import socket
+import threading
+from datetime import timedelta
+from django.db.models import Q
+from django.utils.timezone import now
+from .models import TrackingStatus, TrackingJob
+from .price_update import run_tracking_pass
+from .work_queue import get_open_job, create_job
+
+logger = logging.getLogger(__name__)
+
+
+def get_tracking_status():
+    # The single TrackingStatus row, created (with tracking off) if the admin has not made one yet
+    return TrackingStatus.objects.order_by('pk').first() or TrackingStatus.objects.create()
+
+
+class SchedulerLease:
+    """Single-instance lock stored on the TrackingStatus row.
+
+    The holder renews its heartbeat while it runs; if it crashes, the lease expires after
+    lease_seconds and another scheduler can take over.
+    """
+
+    def __init__(self, status_id, owner, lease_seconds):
+        self.status_id = status_id
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+
+    def acquire(self):
+        # Take the lease if it is free, expired or already ours, in a single conditional UPDATE
+        expired = now() - timedelta(seconds=self.lease_seconds)
+        return TrackingStatus.objects.filter(pk=self.status_id).filter(
+            Q(scheduler_id='') | Q(scheduler_id=self.owner) | Q(scheduler_heartbeat__lt=expired)
+            | Q(scheduler_heartbeat__isnull=True)
+        ).update(scheduler_id=self.owner, scheduler_heartbeat=now()) == 1
+
+    def renew(self):
+        # Returns False if another scheduler has taken the lease over
+        return TrackingStatus.objects.filter(pk=self.status_id, scheduler_id=self.owner).update(
+            scheduler_heartbeat=now()) == 1
+
+    def release(self):
+        TrackingStatus.objects.filter(pk=self.status_id, scheduler_id=self.owner).update(
+            scheduler_id='', scheduler_heartbeat=None)
+
+
+def worker_name():
+    # Identifies a scheduler or worker process in leases: host name and process id
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def install_stop_handlers():
+    # Returns an event set on Ctrl+C or a service manager's SIGTERM, so loops can stop cleanly
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop.set())
+    return stop
+
+
+def tracking_enabled(status_id):
+    return TrackingStatus.objects.filter(pk=status_id, is_tracking=True).exists()
+
+
+def pass_due(interval):
+    # Time for a new pass over the due products if none has run yet or the interval since the last one started has passed
+    last_job = TrackingJob.objects.order_by('-created_at').first()
+    return last_job is None or now() >= last_job.created_at + timedelta(seconds=interval)
+
+
+def run_scheduler(interval, poll_seconds, lease_seconds, once=False):
+    """Run tracking passes on a fixed cadence until stopped.
+
+    Each pass only covers the products whose adaptive next check is due (see products.refresh).
+    TrackingStatus.is_tracking is re-read every poll_seconds and between batches, so pausing
+    and resuming from the admin takes effect within seconds. Each pass is a TrackingJob in the
+    work queue, so an interrupted pass is resumed rather than restarted.
+    """
+    status = get_tracking_status()
+    lease = SchedulerLease(status.pk, worker_name(), lease_seconds)
+    if not lease.acquire():
+        status.refresh_from_db()
+        logger.warning("Another scheduler (%s) holds the tracking lock; exiting.", status.scheduler_id)
+        return False
+
+    # Stop cleanly on Ctrl+C or a service manager's SIGTERM, releasing the lock on the way out
+    stop = install_stop_handlers()
+
+    def should_continue():
+        return not stop.is_set() and lease.renew() and tracking_enabled(status.pk)
+
+    logger.info("Scheduler %s started; passes every %ss", lease.owner, interval)
+    try:
+        while not stop.is_set():
+            if not lease.renew():
+                logger.warning("Lost the tracking lock to another scheduler; exiting.")
+                break
+            status.refresh_from_db()
+            if status.is_tracking:
+                # Resume an unfinished pass, or queue the due products when the cadence says so
+                job = get_open_job()
+                if job is None and pass_due(interval):
+                    job = create_job()
+                if job is not None and run_tracking_pass(job, lease.owner, should_continue):
+                    logger.info("Pass #%d took %.0fs", job.pk, (job.finished_at - job.created_at).total_seconds())
+            if once:
+                break
+            stop.wait(poll_seconds)
+    finally:
+        lease.release()
+        logger.info("Scheduler %s stopped", lease.owner)
+    return True
+
+
+def run_worker(poll_seconds, batch_size=None, once=False):
+    """Work on open tracking passes alongside the scheduler until stopped.
+
+    Workers do not create passes or hold the scheduler lock; any number of them, on this host
+    or others sharing the database, claim tasks from the scheduler's open job under leases,
+    so no product is scraped twice. With once, the worker exits when no pass is left open.
+    """
+    status = get_tracking_status()
+    worker = worker_name()
+    stop = install_stop_handlers()
+
+    def should_continue():
+        return not stop.is_set() and tracking_enabled(status.pk)
+
+    logger.info("Worker %s started", worker)
+    while not stop.is_set():
+        if tracking_enabled(status.pk):
+            job = get_open_job()
+            if job is None and once:
+                break
+            if job is not None and run_tracking_pass(job, worker, should_continue, batch_size) and once:
+                break
+        stop.wait(poll_seconds)
+    logger.info("Worker %s stopped", worker)
@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.conf import settings
+from trackit import metrics
+from .utils import get_http_stats
+from .retailers import RETAILERS, retailer_for
+from .throttle import reserve_request_slot
+
+logger = logging.getLogger(__name__)
+
+# Default number of worker threads, overridable through settings.SCRAPE_WORKERS
+DEFAULT_WORKERS = 8
+
+# Outcome label of trackit_scrapes_total for each ScrapeStats outcome
+METRIC_OUTCOMES = {'scraped': 'success', 'failed': 'failure', 'over_budget': 'over_budget'}
+
+
+class RetailerLimiter:
+    # Enforces the concurrency cap, request budget and request spacing of a single retailer
+    def __init__(self, max_concurrency=4, request_budget=None, min_interval=0):
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.request_budget = request_budget
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.requests_made = 0
+        self.next_request_at = 0.0
+
+    def acquire(self):
+        # Reserve a request from the budget; returns False once the budget for this pass is spent
+        with self.lock:
+            if self.request_budget is not None and self.requests_made >= self.request_budget:
+                return False
+            self.requests_made += 1
+        self.slots.acquire()
+        # Space out requests to the same retailer by at least min_interval seconds
+        with self.lock:
+            current = time.monotonic()
+            delay = max(0.0, self.next_request_at - current)
+            self.next_request_at = max(current, self.next_request_at) + self.min_interval
+        if delay:
+            time.sleep(delay)
+        return True
+
+    def release(self):
+        self.slots.release()
+
+
+class ScrapeStats:
+    # Counters collected over a single scraping pass, used for the end-of-pass throughput report
+    def __init__(self, workers):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.per_retailer = {}
+
+    def record(self, retailer, outcome):
+        with self.lock:
+            counts = self.per_retailer.setdefault(retailer, {'scraped': 0, 'failed': 0, 'over_budget': 0})
+            counts[outcome] += 1
+        metrics.inc('trackit_scrapes_total', retailer=retailer, outcome=METRIC_OUTCOMES[outcome])
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def total(self):
+        return sum(sum(counts.values()) for counts in self.per_retailer.values())
+
+    @property
+    def throughput(self):
+        # Products processed per minute over the whole pass
+        return self.total / self.elapsed * 60 if self.elapsed else 0.0
+
+    def report(self):
+        lines = [f"Scraped {self.total} products in {self.elapsed:.1f}s with {self.workers} workers "
+                 f"({self.throughput:.1f} products/min)"]
+        for retailer, counts in sorted(self.per_retailer.items()):
+            lines.append(f"  {retailer}: {counts['scraped']} scraped, {counts['failed']} failed, "
+                         f"{counts['over_budget']} over budget")
+        return "\n".join(lines)
+
+
+def build_limiters():
+    # Create one limiter per retailer from its registered limits merged with any settings overrides
+    overrides = getattr(settings, 'SCRAPE_RETAILER_LIMITS', {})
+    limiters = {}
+    for name, retailer in RETAILERS.items():
+        limits = dict(retailer.limits)
+        limits.update(overrides.get(name, {}))
+        limiters[name] = RetailerLimiter(**limits)
+    return limiters
+
+
+def _scrape(product, retailer, limiter, stats, cache, not_before=None):
+    # Runs inside a worker thread: fetch and parse a single product page within its retailer's limits
+    if not_before is not None:
+        # Wait for the slot reserved under the retailer's limit shared with other tracker processes
+        time.sleep(max(0.0, not_before - time.time()))
+    if not limiter.acquire():
+        stats.record(retailer.name, 'over_budget')
+        return {'error': f'Request budget exhausted for {retailer.name}'}
+    try:
+        scrape_data = retailer.scrape(product.product_url, cache=cache)
+    except Exception as e:
+        scrape_data = {'error': str(e)}
+    finally:
+        limiter.release()
+    stats.record(retailer.name, 'scraped' if scrape_data and scrape_data.get('price') is not None else 'failed')
+    return scrape_data
+
+
+def scrape_products(products, workers=None, stats=None, cache=None):
+    """Scrape products concurrently, yielding (product, scrape_data) pairs as each page finishes.
+
+    Only the fetching and parsing run in worker threads; results are handed back to the
+    calling thread so that database writes stay on a single connection. At most a few
+    pages per worker are in flight at once, so large catalogs are not queued up front.
+    An optional PageCache lets unchanged pages skip the download or the parse.
+    Retailers listed in settings.SCRAPE_GLOBAL_MIN_INTERVAL also get a request slot reserved
+    in the database before each page is submitted, which spaces out their requests across
+    every tracker process sharing the database.
+    """
+    workers = workers or getattr(settings, 'SCRAPE_WORKERS', DEFAULT_WORKERS)
+    stats = stats or ScrapeStats(workers)
+    limiters = build_limiters()
+    global_intervals = getattr(settings, 'SCRAPE_GLOBAL_MIN_INTERVAL', {})
+    max_in_flight = workers * 4
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scraper') as executor:
+        pending = {}
+        products = iter(products)
+        exhausted = False
+        while True:
+            # Keep the pool fed until the in-flight window is full or the catalog runs out
+            while not exhausted and len(pending) < max_in_flight:
+                product = next(products, None)
+                if product is None:
+                    exhausted = True
+                    break
+                retailer = retailer_for(product)
+                if retailer is None:
+                    # Report products no scraper can handle without spending a worker on them
+                    logger.warning("No suitable scraper found for %s", product.product_url)
+                    metrics.inc('trackit_scrapes_total', retailer='', outcome='unsupported')
+                    yield product, {'error': 'No suitable scraper found'}
+                    continue
+                # Slots are reserved here rather than in the workers so the database stays on this thread
+                interval = global_intervals.get(retailer.name)
+                not_before = reserve_request_slot(retailer.name, interval) if interval else None
+                future = executor.submit(_scrape, product, retailer, limiters[retailer.name], stats, cache,
+                                         not_before)
+                pending[future] = product
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            try:
+                for future in done:
+                    yield pending.pop(future), future.result()
+            except GeneratorExit:
+                # The caller stopped early: pages not yet started are dropped rather than fetched
+                for future in pending:
+                    future.cancel()
+                raise
+
+    stats.finish()
+    logger.info("%s", stats.report())
+    http = get_http_stats()
+    logger.info("HTTP: %d requests, %d retries, %d failures, %d reused / %d new connections, "
+                "%.1fs in requests, %.1fs backing off", http['requests'], http['retries'], http['failures'],
+                http['connections_reused'], http['connections_opened'], http['request_seconds'],
+                http['backoff_seconds'])
+    if cache is not None:
+        cache_stats = cache.stats()
+        logger.info("Page cache: %d hits (%d not modified), %d misses, %d evictions, %d entries",
+                    cache_stats['hits'], cache_stats['not_modified'], cache_stats['misses'],
+                    cache_stats['evictions'], cache_stats['entries'])
@@ -1,3 +1,786 @@
-from django.test import TestCase
+import contextlib
+import io
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+from products import bulk_import, retailers
+from products.bulk_import import import_urls
+from products.extractors import BACKENDS, compile_rules, extract, extract_with_soup
+from products.models import (PriceRollup, PriceSeries, PriceUpdate, ProductFetch, Products, TrackingJob,
+                             TrackingTask)
+from products.page_cache import PageCache
+from products.price_series import append_prices, build_series, daily_prices, decode_runs, encode_runs, get_daily_series
+from products.price_update import run_tracking_pass, write_price_updates
+from products.retention import compact_history, week_start
+from products.scrape_engine import ScrapeStats, scrape_products
+from products.work_queue import claim_tasks, complete_tasks, create_job, fail_tasks, renew_leases
+from trackit.db import write_atomic
+from trackit.sqlite_backend.base import DatabaseWrapper
 
-# Create your tests here.
+User = get_user_model()
+
+# Product page served by the stub retailer, in Flipkart's markup
+STUB_PAGE = ('<html><body><span class="B_NuCI">Stub product {id}</span>'
+             '<div class="_30jeq3 _16Jk6d">&#8377;1,299</div>'
+             '<img class="_396cs4 _2amPTt _3qGmMb" src="https://example.com/{id}.jpg"></body></html>')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Serves /p/<id> as a product page after server.latency seconds and anything else as a 404,
+    # counting the requests and the most that were in flight at once
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(server.latency)
+            if self.path.startswith('/p/'):
+                body, status = STUB_PAGE.replace('{id}', self.path.rsplit('/', 1)[-1]).encode(), 200
+            else:
+                body, status = b'Not found', 404
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class StubRetailerMixin:
+    """Runs a local HTTP server registered as the 'stub' retailer for the tests of the class.
+
+    Pages are served without a page cache or shared request spacing, so every scrape is a request.
+    The tracker's progress and failure logs are kept out of the test output.
+    """
+
+    latency = 0
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub_settings = override_settings(PAGE_CACHE_PATH=None, SCRAPE_GLOBAL_MIN_INTERVAL={})
+        cls.stub_settings.enable()
+        cls.logger = logging.getLogger('products')
+        cls.logger_level = cls.logger.level
+        cls.logger.setLevel(logging.ERROR)
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        cls.server.daemon_threads = True
+        cls.server.latency = cls.latency
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        flipkart = retailers.RETAILERS['flipkart']
+        retailers.register(retailers.Retailer(
+            name='stub', domains=['127.0.0.1'], fields=flipkart.fields,
+            fingerprint_marker=flipkart.fingerprint_marker.decode(),
+            limits={'max_concurrency': 4, 'request_budget': None, 'min_interval': 0}))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        del retailers.RETAILERS['stub']
+        for host in [host for host, retailer in retailers._retailers_by_host.items() if retailer.name == 'stub']:
+            del retailers._retailers_by_host[host]
+        cls.stub_settings.disable()
+        cls.logger.setLevel(cls.logger_level)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        with self.server.lock:
+            self.server.requests = self.server.active = self.server.max_active = 0
+
+    def stub_url(self, path):
+        return f'http://127.0.0.1:{self.server.server_address[1]}{path}'
+
+
+class ExtractorTests(SimpleTestCase):
+    # Every extraction backend reads the same fields as the BeautifulSoup reference
+
+    FLIPKART_PAGE = (b'<html><head><title>Phone</title></head><body><div><p>Intro<br>text</div>'
+                     b'<span class="B_NuCI">Phone <b>128 GB</b></span>'
+                     b'<div class="_30jeq3 _16Jk6d extra">&#8377;1,29,999</div>'
+                     b'<img class="_396cs4 _2amPTt _3qGmMb" src="https://example.com/phone.jpg">'
+                     b'<ul><li>Unclosed item<li>Another</ul></body></html>')
+    EBAY_PAGE = (b'<html><body><span class="ux-textspans">Shipping $5.00</span>'
+                 b'<span class="ux-textspans ux-textspans--BOLD">Camera</span>'
+                 b'<div class="x-price-primary"><span class="ux-textspans">US $1,234.56</span></div>'
+                 b'<div class="ux-image-carousel-item"><img class="" src="https://example.com/camera.jpg"></div>'
+                 b'</body></html>')
+
+    def test_backends_agree_with_beautifulsoup(self):
+        for name, page in (('flipkart', self.FLIPKART_PAGE), ('ebay', self.EBAY_PAGE)):
+            rules = retailers.RETAILERS[name].rules
+            expected = extract_with_soup(page, rules)
+            self.assertTrue(expected['price'])
+            for backend, extractor in BACKENDS.items():
+                with self.subTest(retailer=name, backend=backend):
+                    self.assertEqual(extractor(page, rules), expected)
+
+    def test_fields_are_read_from_the_right_elements(self):
+        self.assertEqual(extract(self.FLIPKART_PAGE, retailers.RETAILERS['flipkart'].rules, 'streaming'),
+                         {'title': 'Phone128 GB', 'price': '\u20b91,29,999', 'img_link': 'https://example.com/phone.jpg'})
+        # The price is the span inside the price block, not the first span of the page
+        self.assertEqual(retailers.RETAILERS['ebay'].parse(self.EBAY_PAGE)['price'], 123456)
+
+    def test_streaming_stops_after_the_last_field(self):
+        # Everything after the wanted elements is left unparsed, so a long tail costs nothing
+        rules = retailers.RETAILERS['flipkart'].rules
+        page = self.FLIPKART_PAGE + b'<div class="filler">Reviews</div>' * 2000
+        peaks = {}
+        for backend in ('streaming', 'soup'):
+            tracemalloc.start()
+            try:
+                results = BACKENDS[backend](page, rules)
+                peaks[backend] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(results['price'], '\u20b91,29,999')
+        self.assertLess(peaks['streaming'], peaks['soup'] / 20)
+
+    def test_falls_back_to_beautifulsoup(self):
+        rules = compile_rules(retailers.RETAILERS['flipkart'].fields)
+
+        def broken(content, rules):
+            raise ValueError('unsupported markup')
+
+        with mock.patch.dict(BACKENDS, {'broken': broken, 'empty': lambda content, rules: {'price': None}}), \
+                self.assertLogs('products.extractors', 'WARNING') as logs:
+            for backend in ('broken', 'empty'):
+                with self.subTest(backend=backend):
+                    self.assertEqual(extract(self.FLIPKART_PAGE, rules, backend)['price'], '\u20b91,29,999')
+        # Only the backend that raised is reported; a page it found no price on is not an error
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('unsupported markup', logs.output[0])
+
+    def test_pages_without_the_fields_give_none(self):
+        results = extract(b'<html><body><p>Captcha</p></body></html>', retailers.RETAILERS['flipkart'].rules)
+        self.assertEqual(results, {'title': None, 'price': None, 'img_link': None})
+
+
+class ScrapeEngineTests(StubRetailerMixin, SimpleTestCase):
+    # Concurrent scraping within each retailer's limits
+    latency = 0.05
+
+    def scrape(self, paths, limits, workers=8):
+        products = [Products(id=i, product_url=self.stub_url(path)) for i, path in enumerate(paths)]
+        stats = ScrapeStats(workers)
+        with override_settings(SCRAPE_RETAILER_LIMITS={'stub': limits}):
+            results = {product.id: data for product, data in scrape_products(products, workers, stats)}
+        return [results[i] for i in range(len(paths))], stats.per_retailer['stub']
+
+    def test_concurrency_is_capped_per_retailer(self):
+        results, counts = self.scrape([f'/p/{i}' for i in range(12)], {'max_concurrency': 2})
+        self.assertEqual(self.server.requests, 12)
+        self.assertEqual(self.server.max_active, 2)
+        self.assertEqual([result['price'] for result in results], [1299] * 12)
+        self.assertEqual(counts['scraped'], 12)
+
+    def test_request_budget_stops_requests_for_the_pass(self):
+        results, counts = self.scrape([f'/p/{i}' for i in range(6)], {'request_budget': 4})
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(counts, {'scraped': 4, 'failed': 0, 'over_budget': 2})
+        over_budget = [result for result in results if 'error' in result]
+        self.assertEqual(len(over_budget), 2)
+        self.assertIn('budget', over_budget[0]['error'])
+
+    def test_failed_pages_do_not_affect_the_others(self):
+        paths = ['/p/1', '/missing/2', '/p/3', '/missing/4', '/p/5']
+        results, counts = self.scrape(paths, {'max_concurrency': 4})
+        self.assertEqual([result.get('price') for result in results], [1299, None, 1299, None, 1299])
+        self.assertEqual(results[0]['title'], 'Stub product 1')
+        self.assertIn('error', results[1])
+        self.assertEqual(counts, {'scraped': 3, 'failed': 2, 'over_budget': 0})
+
+    def test_products_without_a_scraper_are_reported_without_a_request(self):
+        products = [Products(id=1, product_url='https://unsupported.example.com/p/1')]
+        with self.assertLogs('products.scrape_engine', 'WARNING') as logs:
+            [(product, data)] = list(scrape_products(products))
+        self.assertEqual(data, {'error': 'No suitable scraper found'})
+        self.assertIn(products[0].product_url, logs.output[0])
+        self.assertEqual(self.server.requests, 0)
+
+
+class PageCacheTests(SimpleTestCase):
+    # The page cache file shared by several worker processes
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'page_cache.json')
+
+    def test_workers_saving_in_turn_keep_each_others_entries(self):
+        seed = PageCache(self.path)
+        seed.put('https://example.com/old', etag='"old"')
+        seed.save()
+        first = PageCache(self.path).load()
+        second = PageCache(self.path).load()
+        first.put('https://example.com/a', etag='"a"')
+        second.put('https://example.com/b', etag='"b"')
+        second.put('https://example.com/old', etag='"new"')
+        first.save()
+        second.save()
+        saved = PageCache(self.path).load()
+        self.assertEqual(saved.get('https://example.com/a')['etag'], '"a"')
+        self.assertEqual(saved.get('https://example.com/b')['etag'], '"b"')
+        self.assertEqual(saved.get('https://example.com/old')['etag'], '"new"')
+
+    def test_entries_loaded_but_not_changed_do_not_overwrite_newer_ones(self):
+        cache = PageCache(self.path)
+        cache.put('https://example.com/a', etag='"1"')
+        cache.save()
+        stale = PageCache(self.path).load()
+        fresh = PageCache(self.path).load()
+        fresh.put('https://example.com/a', etag='"2"')
+        fresh.save()
+        stale.save()
+        self.assertEqual(PageCache(self.path).load().get('https://example.com/a')['etag'], '"2"')
+
+    def test_merged_file_stays_within_the_size_limit(self):
+        first, second = PageCache(self.path, max_entries=3), PageCache(self.path, max_entries=3)
+        for i in range(3):
+            first.put(f'https://example.com/a{i}')
+            second.put(f'https://example.com/b{i}')
+        first.save()
+        second.save()
+        saved = PageCache(self.path, max_entries=10).load()
+        # The last save's entries are the most recently used
+        self.assertEqual(list(saved.entries), [f'https://example.com/b{i}' for i in range(3)])
+
+
+class TrackingPassTests(StubRetailerMixin, TransactionTestCase):
+    # Tracking passes over a catalog of stub products
+
+    def add_products(self, count, users=1):
+        products = Products.objects.bulk_create([
+            Products(product_name=f'Product {i}', product_url=self.stub_url(f'/p/{i}'), product_img='',
+                     product_price=1000, date_added=date.today())
+            for i in range(count)
+        ])
+        Subscription = Products.user.through
+        for _ in range(users):
+            user = User.objects.create_user(email=f'user{User.objects.count()}@example.com', password='secret')
+            Subscription.objects.bulk_create([Subscription(user_accounts=user, products=product)
+                                              for product in products])
+        return products
+
+    def run_pass(self, job, worker='test-worker', **kwargs):
+        return run_tracking_pass(job, worker, **kwargs)
+
+    def test_workers_share_a_job_without_checking_a_product_twice(self):
+        self.add_products(30)
+        job = create_job()
+        # The first worker stops after one batch and the second finishes the job
+        calls = []
+        self.assertFalse(self.run_pass(job, 'worker-a', should_continue=lambda: calls.append(1) or len(calls) < 2,
+                                       batch_size=10))
+        self.assertTrue(self.run_pass(job, 'worker-b', batch_size=10))
+        self.assertEqual(self.server.requests, 30)
+        self.assertEqual(job.tasks.filter(status=TrackingTask.DONE).count(), 30)
+        self.assertEqual(PriceUpdate.objects.count(), 30)
+        self.assertEqual(set(job.tasks.values_list('lease_owner', flat=True)), {'worker-a', 'worker-b'})
+        job.refresh_from_db()
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(TASK_CHECKPOINT_SECONDS=0)
+    def test_stopping_mid_batch_hands_the_rest_back(self):
+        self.add_products(20)
+        job = create_job()
+        calls = []
+        self.assertFalse(self.run_pass(job, 'worker-a', should_continue=lambda: calls.append(1) or len(calls) < 4,
+                                       batch_size=20))
+        done = job.tasks.filter(status=TrackingTask.DONE).count()
+        self.assertGreater(done, 0)
+        self.assertLess(done, 20)
+        # The unfinished tasks are free to claim at once, and the aborted claim is not counted as an attempt
+        released = job.tasks.filter(status=TrackingTask.PENDING)
+        self.assertEqual(released.filter(lease_owner='', lease_expires_at__isnull=True, attempts=0).count(), 20 - done)
+        self.assertEqual(len(claim_tasks(job, 'worker-b', 20)), 20 - done)
+
+    def peak_memory(self, size):
+        # Peak memory traced while a job is created for a fresh catalog of size products and checked
+        self.add_products(size, users=3)
+        tracemalloc.start()
+        try:
+            job = create_job()
+            self.assertTrue(self.run_pass(job, batch_size=50))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(job.tasks.filter(status=TrackingTask.DONE).count(), size)
+        Products.objects.all().delete()
+        return peak
+
+    @override_settings(PAGE_CACHE_SIZE=50)
+    def test_pass_memory_does_not_grow_with_the_catalog(self):
+        # Jobs are queued and tasks claimed and saved a batch at a time, so four times the products
+        # must not mean more memory. Both catalogs are larger than the bounded caches a pass fills
+        # (the page cache, limited to one batch here, and the URL parsing and SQL statement caches),
+        # whose entries tracemalloc would otherwise count as growth while they fill up.
+        self.peak_memory(10)
+        small, large = self.peak_memory(150), self.peak_memory(600)
+        self.assertLess(large, small * 1.25, f'Peak memory grew from {small} to {large} bytes')
+
+
+class WorkQueueTests(TestCase):
+    # Leases on tracking tasks shared by several workers
+
+    def setUp(self):
+        Products.objects.bulk_create([
+            Products(product_name=f'Product {i}', product_url=f'https://www.flipkart.com/p/itm{i}', product_img='',
+                     product_price=1000, date_added=date.today())
+            for i in range(6)
+        ])
+        self.job = create_job()
+
+    def expire(self, tasks):
+        TrackingTask.objects.filter(id__in=[task.id for task in tasks]).update(
+            lease_expires_at=now() - timedelta(seconds=1))
+
+    def test_claims_do_not_overlap(self):
+        first, second = claim_tasks(self.job, 'worker-a', 4), claim_tasks(self.job, 'worker-b', 4)
+        self.assertEqual(len(first), 4)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({task.id for task in first} & {task.id for task in second})
+        self.assertEqual(claim_tasks(self.job, 'worker-c', 4), [])
+
+    def test_a_lapsed_lease_is_taken_over(self):
+        lapsed = claim_tasks(self.job, 'worker-a', 3)
+        self.expire(lapsed)
+        taken = claim_tasks(self.job, 'worker-b', 3)
+        self.assertEqual({task.id for task in taken}, {task.id for task in lapsed})
+        self.assertEqual(taken[0].attempts, 2)
+        # The first worker's late results are not saved over the new holder's
+        self.assertEqual(complete_tasks(lapsed, 'worker-a'), set())
+        self.assertEqual(renew_leases(lapsed, 'worker-a'), set())
+        fail_tasks([(task, 'Timed out') for task in lapsed], 'worker-a')
+        self.assertEqual(TrackingTask.objects.filter(lease_owner='worker-b', last_error='').count(), 3)
+        self.assertEqual(complete_tasks(taken, 'worker-b'), {task.id for task in taken})
+        self.assertEqual(TrackingTask.objects.filter(status=TrackingTask.DONE).count(), 3)
+
+    def test_renewed_leases_are_not_taken_over(self):
+        tasks = claim_tasks(self.job, 'worker-a', 6)
+        TrackingTask.objects.update(lease_expires_at=now() + timedelta(seconds=1))
+        self.assertEqual(renew_leases(tasks, 'worker-a'), {task.id for task in tasks})
+        self.assertTrue(all(task.lease_expires_at > now() + timedelta(seconds=settings.TASK_LEASE_SECONDS - 60)
+                            for task in TrackingTask.objects.all()))
+        self.assertEqual(claim_tasks(self.job, 'worker-b', 6), [])
+
+    @override_settings(TASK_MAX_ATTEMPTS=2)
+    def test_failed_tasks_are_retried_then_given_up(self):
+        tasks = claim_tasks(self.job, 'worker-a', 1)
+        fail_tasks([(tasks[0], 'HTTP 500')], 'worker-a')
+        # Held back for the retry delay, then claimable again
+        self.assertNotIn(tasks[0].id, [task.id for task in claim_tasks(self.job, 'worker-b', 6)])
+        self.expire(tasks)
+        retried = [task for task in claim_tasks(self.job, 'worker-c', 6) if task.id == tasks[0].id]
+        self.assertEqual(retried[0].attempts, 2)
+        fail_tasks([(retried[0], 'HTTP 500')], 'worker-c')
+        task = TrackingTask.objects.get(id=tasks[0].id)
+        self.assertEqual((task.status, task.last_error), (TrackingTask.FAILED, 'HTTP 500'))
+        self.assertEqual(Products.objects.get(id=task.product_id).failure_count, 1)
+
+
+class TrackingJobAdminTests(TestCase):
+    # The admin list of tracking passes
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser(email='admin@example.com', password='secret'))
+        self.products = Products.objects.bulk_create([
+            Products(product_name=f'Product {i}', product_url=f'https://www.flipkart.com/p/itm{i}', product_img='',
+                     product_price=1000, date_added=date.today())
+            for i in range(4)
+        ])
+
+    def add_job(self, statuses):
+        job = TrackingJob.objects.create()
+        TrackingTask.objects.bulk_create([TrackingTask(job=job, product=product, status=status)
+                                          for product, status in zip(self.products, statuses)])
+        return job
+
+    def changelist(self):
+        return self.client.get(reverse('admin:products_trackingjob_changelist'), SERVER_NAME='localhost')
+
+    def test_progress_comes_with_the_list_query(self):
+        self.add_job([TrackingTask.DONE, TrackingTask.FAILED, TrackingTask.PENDING, TrackingTask.PENDING])
+        with CaptureQueriesContext(connection) as one_job:
+            response = self.changelist()
+        self.assertContains(response, '50.0% (2/4)')
+        for _ in range(3):
+            self.add_job([TrackingTask.DONE] * 4)
+        with CaptureQueriesContext(connection) as four_jobs:
+            response = self.changelist()
+        self.assertContains(response, '100.0% (4/4)', count=3)
+        self.assertEqual(len(four_jobs), len(one_job))
+
+
+class WritePriceUpdatesTests(TestCase):
+    # A batch of scraped prices is written with a fixed number of queries
+
+    def add_products(self, count):
+        first = Products.objects.count()
+        return Products.objects.bulk_create([
+            Products(product_name=f'Product {i}', product_url=f'https://www.flipkart.com/p/itm{i}', product_img='',
+                     product_price=1000, date_added=date.today())
+            for i in range(first, first + count)
+        ])
+
+    def test_query_count_does_not_depend_on_the_batch_size(self):
+        counts = []
+        for size in (5, 50):
+            batch = [(product, 900) for product in self.add_products(size)]
+            with CaptureQueriesContext(connection) as queries:
+                write_price_updates(batch, date.today())
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_writes_history_and_price_columns(self):
+        unchanged, changed, new = self.add_products(3)
+        yesterday = date.today() - timedelta(days=1)
+        write_price_updates([(unchanged, 1000), (changed, 1000)], yesterday)
+        first_checked = Products.objects.get(id=unchanged.id).last_checked_at
+
+        previous = write_price_updates([(unchanged, 1000), (changed, 800), (new, 500)], date.today())
+        self.assertEqual(previous, {unchanged.id: 1000, changed.id: 1000, new.id: None})
+        self.assertEqual(PriceUpdate.objects.filter(dates=date.today()).count(), 3)
+        self.assertEqual(list(PriceUpdate.objects.filter(product=changed).order_by('dates')
+                              .values_list('price', flat=True)), [1000, 800])
+        unchanged, changed, new = Products.objects.order_by('id')
+        self.assertEqual((unchanged.current_price, unchanged.previous_price), (1000, None))
+        self.assertEqual(unchanged.last_changed_at, first_checked)
+        self.assertEqual((changed.current_price, changed.previous_price), (800, 1000))
+        self.assertEqual(changed.last_changed_at, changed.last_checked_at)
+        self.assertEqual((new.current_price, new.previous_price), (500, None))
+        for product in (unchanged, changed, new):
+            self.assertGreater(product.next_check_at, product.last_checked_at)
+
+    def test_later_checks_on_the_same_day_overwrite_the_days_price(self):
+        product, = self.add_products(1)
+        write_price_updates([(product, 1000)], date.today())
+        previous = write_price_updates([(product, 900)], date.today())
+        self.assertEqual(previous, {product.id: 1000})
+        self.assertEqual(list(PriceUpdate.objects.filter(product=product).values_list('dates', 'price')),
+                         [(date.today(), 900)])
+        product.refresh_from_db()
+        self.assertEqual((product.current_price, product.previous_price), (900, 1000))
+
+
+class PriceSeriesTests(TestCase):
+    # The run-length encoded series hold the same daily history as the PriceUpdate rows
+
+    def setUp(self):
+        self.product = Products.objects.create(
+            product_name='Phone', product_url='https://www.flipkart.com/phone/p/itm0001', product_img='',
+            product_price=1000, date_added=date.today())
+        self.first_day = date(2024, 1, 1)
+
+    def history(self, days, checked_every=1):
+        # Daily prices that change now and then, checked every few days
+        random.seed(days)
+        price, points = 1000, []
+        for day in range(0, days, checked_every):
+            if random.random() < 0.1:
+                price += random.randint(-100, 100)
+            points.append((self.first_day + timedelta(days=day), price))
+        return points
+
+    def dense(self, points):
+        # The expected daily series: each check's price carried forward to the next check
+        dates, prices = [], []
+        for (day, price), (next_day, _) in zip(points, points[1:] + [(points[-1][0] + timedelta(days=1), None)]):
+            while day < next_day:
+                dates.append(day)
+                prices.append(price)
+                day += timedelta(days=1)
+        return dates, prices
+
+    def test_encoding_keeps_only_price_changes(self):
+        points = self.history(365)
+        row = PriceSeries(product=self.product, **encode_runs(points))
+        changes = sum(1 for (_, a), (_, b) in zip(points, points[1:]) if a != b)
+        self.assertEqual(row.runs, changes + 1)
+        self.assertEqual(len(row.days) + len(row.prices), 8 * row.runs)
+        self.assertEqual(daily_prices(row), self.dense(points))
+        self.assertEqual(decode_runs(row)[0], points[0])
+
+    def test_ranges_are_clipped_to_the_tracked_days(self):
+        row = PriceSeries(product=self.product, **encode_runs(self.history(100)))
+        dates, prices = daily_prices(row, self.first_day + timedelta(days=10), self.first_day + timedelta(days=19))
+        self.assertEqual(dates, [self.first_day + timedelta(days=10 + i) for i in range(10)])
+        self.assertEqual(prices, self.dense(self.history(100))[1][10:20])
+        self.assertEqual(daily_prices(row, end=self.first_day - timedelta(days=1)), ([], []))
+
+    def test_built_series_matches_the_rows(self):
+        points = self.history(200, checked_every=3)
+        PriceUpdate.objects.bulk_create([PriceUpdate(product=self.product, dates=day, price=price)
+                                         for day, price in points])
+        # Rolled-up history continues the series with the close of each period before the rows
+        PriceRollup.objects.create(product=self.product, period=PriceRollup.WEEK,
+                                   period_start=self.first_day - timedelta(days=7),
+                                   min_price=900, max_price=1100, close_price=950, samples=7)
+        self.assertEqual(build_series([self.product.id]), 1)
+        expected = self.dense([(self.first_day - timedelta(days=7), 950)] + points)
+        self.assertEqual(get_daily_series([self.product.id])[self.product.id], expected)
+
+    def test_appended_checks_match_a_rebuild(self):
+        for day, price in self.history(60, checked_every=2):
+            PriceUpdate.objects.create(product=self.product, dates=day, price=price)
+            append_prices([(self.product, price)], day)
+        appended = get_daily_series([self.product.id])[self.product.id]
+        build_series([self.product.id])
+        self.assertEqual(get_daily_series([self.product.id])[self.product.id], appended)
+
+    def test_a_later_check_on_the_same_day_replaces_its_price(self):
+        append_prices([(self.product, 1000)], self.first_day)
+        append_prices([(self.product, 900)], self.first_day + timedelta(days=1))
+        append_prices([(self.product, 800)], self.first_day + timedelta(days=1))
+        self.assertEqual(get_daily_series([self.product.id])[self.product.id][1], [1000, 800])
+
+
+class WriteAtomicTests(TransactionTestCase):
+    # Transactions that write take SQLite's write lock when they begin; others stay deferred
+
+    def begins(self, queries):
+        return [query['sql'] for query in queries if query['sql'].startswith('BEGIN')]
+
+    def test_only_write_blocks_begin_immediate(self):
+        with CaptureQueriesContext(connection) as queries:
+            with write_atomic():
+                Products.objects.count()
+            with transaction.atomic():
+                Products.objects.count()
+        self.assertEqual(self.begins(queries), ['BEGIN IMMEDIATE', 'BEGIN'])
+
+    def test_nested_write_block_leaves_the_next_transaction_deferred(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                with write_atomic():
+                    Products.objects.count()
+            with transaction.atomic():
+                Products.objects.count()
+        self.assertEqual(self.begins(queries), ['BEGIN', 'BEGIN'])
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    # The tuned SQLite backend on a database file shared by several connections, as in production
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory.name, 'test.sqlite3')}
+        self.settings_dict['OPTIONS'] = {**self.settings_dict['OPTIONS'], 'timeout': 5}
+        with self.connect() as writer:
+            writer.cursor().execute('CREATE TABLE prices (price INTEGER)')
+
+    @contextlib.contextmanager
+    def connect(self):
+        wrapper = DatabaseWrapper(self.settings_dict, alias='sqlite-test')
+        try:
+            yield wrapper
+        finally:
+            wrapper.close()
+
+    def begin(self, wrapper, immediate):
+        # What an outermost atomic() does on this backend, with write_atomic() setting immediate
+        wrapper.begin_immediate = immediate
+        wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+
+    def end(self, wrapper):
+        wrapper.commit()
+        wrapper.set_autocommit(True)
+
+    def test_connections_use_the_configured_pragmas(self):
+        pragmas = connection.settings_dict['OPTIONS'].get('pragmas')
+        if not pragmas:
+            self.skipTest('No pragmas configured')
+        with self.connect() as wrapper:
+            cursor = wrapper.cursor()
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], pragmas['journal_mode'].lower())
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_readers_see_the_last_commit_while_a_write_is_open(self):
+        with self.connect() as writer, self.connect() as reader:
+            self.begin(writer, immediate=True)
+            writer.cursor().execute('INSERT INTO prices VALUES (100)')
+            cursor = reader.cursor()
+            cursor.execute('SELECT COUNT(*) FROM prices')
+            self.assertEqual(cursor.fetchone()[0], 0)
+            self.end(writer)
+
+    def test_write_transactions_wait_for_the_write_lock(self):
+        held = threading.Event()
+        released_at = []
+
+        def hold_lock():
+            with self.connect() as other:
+                self.begin(other, immediate=True)
+                other.cursor().execute('INSERT INTO prices VALUES (100)')
+                held.set()
+                time.sleep(0.3)
+                released_at.append(time.monotonic())
+                self.end(other)
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        held.wait()
+        with self.connect() as writer:
+            # A transaction that reads before it writes: begun IMMEDIATE, it waits for the lock up front
+            self.begin(writer, immediate=True)
+            started = time.monotonic()
+            cursor = writer.cursor()
+            cursor.execute('SELECT COUNT(*) FROM prices')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('INSERT INTO prices VALUES (200)')
+            self.end(writer)
+        thread.join()
+        self.assertGreaterEqual(time.monotonic(), released_at[0])
+        self.assertLess(started, released_at[0] + 0.1)
+
+    def test_deferred_transactions_that_read_first_fail_to_write(self):
+        # The failure write_atomic() avoids: a deferred transaction holding an old snapshot can not
+        # upgrade to a write once another connection has committed, however long it would wait
+        with self.connect() as writer, self.connect() as other:
+            self.begin(writer, immediate=False)
+            writer.cursor().execute('SELECT COUNT(*) FROM prices')
+            other.cursor().execute('INSERT INTO prices VALUES (100)')
+            with self.assertRaises(OperationalError):
+                writer.cursor().execute('INSERT INTO prices VALUES (200)')
+            writer.rollback()
+            writer.set_autocommit(True)
+
+
+class BulkImportTests(TestCase):
+    # Importing a list of URLs attaches existing products and creates and queues only the new ones
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@example.com', password='secret')
+
+    def add_product(self, item, status):
+        return Products.objects.create(
+            product_name=item, product_url=f'https://www.flipkart.com/p/{item}', retailer='flipkart', item_id=item,
+            product_img='', product_price=1000, date_added=date.today(), status=status)
+
+    def test_creates_and_queues_only_new_and_failed_products(self):
+        active = self.add_product('itmactive', Products.ACTIVE)
+        failed = self.add_product('itmfailed', Products.FAILED)
+        rows = [(1, 'https://www.flipkart.com/p/itmactive'),
+                (2, 'https://www.flipkart.com/slug/p/itmfailed?utm_source=x'),
+                (3, 'https://www.flipkart.com/p/itmnew'),
+                (4, 'https://www.flipkart.com/p/itmnew#reviews'),
+                (5, 'https://example.com/p/1')]
+        report = import_urls(self.user, rows)
+        self.assertEqual((report['attached'], report['tracked'], report['queued'], report['duplicates']), (3, 0, 2, 1))
+        self.assertEqual([line for line, _, _ in report['failures']], [5])
+        new = Products.objects.get(item_id='itmnew')
+        self.assertEqual(new.status, Products.PENDING)
+        self.assertEqual(set(ProductFetch.objects.values_list('product_id', flat=True)), {failed.id, new.id})
+        active.refresh_from_db()
+        self.assertEqual(active.status, Products.ACTIVE)
+
+        report = import_urls(self.user, rows)
+        self.assertEqual((report['attached'], report['tracked'], report['queued']), (0, 3, 0))
+        self.assertEqual(Products.objects.count(), 3)
+
+    def test_products_added_concurrently_are_not_counted_as_created(self):
+        rows = [(1, 'https://www.flipkart.com/p/itmraced'), (2, 'https://www.flipkart.com/p/itmnew')]
+        real_lookup = bulk_import._lookup
+        calls = []
+
+        def racing_lookup(products):
+            # Another add creates and fetches one of the products between the first and second lookups
+            calls.append(products)
+            if len(calls) == 2:
+                self.add_product('itmraced', Products.ACTIVE)
+            return real_lookup(products)
+
+        with mock.patch.object(bulk_import, '_lookup', racing_lookup):
+            report = import_urls(self.user, rows)
+        self.assertEqual((report['attached'], report['queued']), (2, 1))
+        self.assertEqual(Products.objects.get(item_id='itmraced').status, Products.ACTIVE)
+        self.assertEqual(list(ProductFetch.objects.values_list('product__item_id', flat=True)), ['itmnew'])
+
+    def test_import_command_reports_failed_fetches(self):
+        def fail_fetches(worker, progress):
+            Products.objects.filter(status=Products.PENDING).update(status=Products.FAILED, fetch_error='HTTP 404')
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as urls:
+            # Stored under its canonical URL, on the www host and without the row's search parameters
+            urls.write('url\nhttps://m.flipkart.com/some-phone/p/itmgone?otracker=search&utm_source=mail#specs\n')
+            urls.flush()
+            stderr = io.StringIO()
+            with mock.patch('products.management.commands.import_products.run_fetches', fail_fetches):
+                call_command('import_products', urls.name, user=self.user.email, wait=True,
+                             stdout=io.StringIO(), stderr=stderr)
+        self.assertIn('Failed to fetch https://www.flipkart.com/some-phone/p/itmgone: HTTP 404', stderr.getvalue())
+
+
+class PriceHistoryViewTests(TestCase):
+    # The JSON price history served to the dashboard charts
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@example.com', password='secret')
+        self.product = Products.objects.create(
+            product_name='Phone', product_url='https://www.flipkart.com/phone/p/itm0001', product_img='',
+            product_price=1000, date_added=date.today())
+        self.product.user.add(self.user)
+        self.client.force_login(self.user)
+
+    def get(self, query):
+        return self.client.get(reverse('price_history', args=[self.product.id]) + '?' + query,
+                               SERVER_NAME='localhost')
+
+    def test_rejects_invalid_page_parameters(self):
+        for query in ('limit=0', 'limit=-1', 'points=-1', 'limit=ten', 'points=1.5'):
+            with self.subTest(query=query):
+                response = self.get(query)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_accepts_valid_page_parameters(self):
+        for query in ('limit=1', 'points=0', 'limit=5&points=3'):
+            with self.subTest(query=query):
+                self.assertEqual(self.get(query).status_code, 200)
+
+    def test_compaction_changes_the_etag_and_chart(self):
+        # Two aged daily rows in one week, rolled up into a single point by the retention job
+        monday = week_start(date.today() - timedelta(days=settings.PRICE_HISTORY_DAILY_DAYS + 14))
+        PriceUpdate.objects.bulk_create([PriceUpdate(product=self.product, dates=monday, price=1000),
+                                         PriceUpdate(product=self.product, dates=monday + timedelta(days=1), price=900)])
+        Products.objects.filter(id=self.product.id).update(last_checked_at=now())
+        response = self.get('')
+        self.assertEqual(response.json()['prices'], [1000, -100])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('price_history', args=[self.product.id]), SERVER_NAME='localhost',
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        compact_history(date.today())
+        response = self.client.get(reverse('price_history', args=[self.product.id]), SERVER_NAME='localhost',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # The cached chart of the uncompacted rows is not served either
+        self.assertEqual(response.json()['prices'], [900])
@@ -0,0 +1,29 @@
+import time
+from django.db import IntegrityError
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from trackit.db import write_atomic
+from .models import RetailerThrottle
+
+
+def reserve_request_slot(retailer, interval):
+    """Reserve a request to a retailer under its shared rate limit and return the Unix time it may be sent.
+
+    Each reservation moves the retailer's next free slot at least interval seconds forward
+    with a single UPDATE, which locks the row until the transaction commits, so reading the
+    slot back in the same transaction gives every process and host a slot of its own.
+    """
+    current = time.time()
+    with write_atomic():
+        reserved = RetailerThrottle.objects.filter(retailer=retailer).update(
+            next_request_at=Greatest(F('next_request_at'), Value(current)) + interval)
+        if reserved:
+            return RetailerThrottle.objects.filter(retailer=retailer).values_list(
+                'next_request_at', flat=True).get() - interval
+    # First request to this retailer: create its row, unless another process just did
+    try:
+        with write_atomic():
+            RetailerThrottle.objects.create(retailer=retailer, next_request_at=current + interval)
+        return current
+    except IntegrityError:
+        return reserve_request_slot(retailer, interval)
@@ -1,73 +1,224 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from datetime import datetime, timezone
+import hashlib
+import logging
+import random
+import threading
 import time
-import re
+from trackit import metrics
 
-# Function to make a web request with retries
-def make_request(url, retries=3):
-    for _ in range(retries):
+logger = logging.getLogger(__name__)
+
+try:
+    # Brotli support is optional; urllib3 only decodes 'br' responses when it is installed
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+# Connect and read timeouts (seconds) for every product page request
+REQUEST_TIMEOUT = (5, 20)
+# Base and cap (seconds) of the jittered exponential backoff between retries
+BACKOFF_BASE = 1
+BACKOFF_MAX = 30
+# Number of keep-alive connections kept open per retailer domain
+POOL_SIZE = 10
+# Client errors that are worth retrying; any other 4xx fails immediately
+RETRYABLE_CLIENT_ERRORS = {408, 429}
+
+# One pooled session per retailer hostname, created on first use and shared by all threads
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Counters for the whole process, read through get_http_stats()
+_http_stats = {'requests': 0, 'retries': 0, 'failures': 0, 'request_seconds': 0.0, 'backoff_seconds': 0.0}
+_http_stats_lock = threading.Lock()
+
+
+def _count(**increments):
+    with _http_stats_lock:
+        for key, value in increments.items():
+            _http_stats[key] += value
+
+
+# Retailer of the request the current thread is making, for timing the connections it opens
+_request_context = threading.local()
+
+
+class TimedHTTPConnection(HTTPConnection):
+    # Records the DNS lookup and TCP connect of every new connection as the 'connect' stage
+    def connect(self):
+        with metrics.timed('connect', getattr(_request_context, 'retailer', '')):
+            super().connect()
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    # As above, including the TLS handshake
+    def connect(self):
+        with metrics.timed('connect', getattr(_request_context, 'retailer', '')):
+            super().connect()
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def get_session(url):
+    # Return the shared keep-alive session for the URL's hostname
+    hostname = urlparse(url).hostname or ''
+    with _sessions_lock:
+        session = _sessions.get(hostname)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            adapter.poolmanager.pool_classes_by_scheme = {
+                'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+            _sessions[hostname] = session
+        return session
+
+
+def get_http_stats():
+    """Return request, retry and timing counters plus connection reuse figures for all sessions."""
+    with _http_stats_lock:
+        stats = dict(_http_stats)
+    # urllib3 counts every new connection and every request sent on each pool
+    connections = pooled_requests = 0
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    pooled_requests += pool.num_requests
+    stats['connections_opened'] = connections
+    stats['connections_reused'] = max(0, pooled_requests - connections)
+    return stats
+
+
+def _retry_after(response):
+    # Parse a Retry-After header given either as seconds or as an HTTP date
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    # Full-jitter exponential backoff: a random delay up to BACKOFF_BASE * 2^attempt, capped at BACKOFF_MAX
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+# Function to make a web request with retries over the pooled session of the URL's domain.
+# retailer labels the request's metrics: the wait for the response headers and the body download
+# are timed separately, and every request is counted by response status.
+def make_request(url, retries=3, headers=None, retailer=''):
+    session = get_session(url)
+    _request_context.retailer = retailer
+    for attempt in range(retries):
+        response = None
+        started = time.monotonic()
         try:
-            response = requests.get(url)
-            # Return the response if the request was successful
-            if response.status_code == 200:
+            response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+            headers_at = time.monotonic()
+            response.content  # Download the body
+            finished = time.monotonic()
+            _count(requests=1, request_seconds=finished - started)
+            metrics.observe('trackit_stage_seconds', headers_at - started, stage='wait', retailer=retailer)
+            metrics.observe('trackit_stage_seconds', finished - headers_at, stage='download', retailer=retailer)
+            metrics.inc('trackit_http_requests_total', retailer=retailer, status=response.status_code)
+            # Return the response if the request was successful, or if a conditional request found no change
+            if response.status_code == 200 or (headers and response.status_code == 304):
                 return response
+            # Don't retry client errors other than timeouts and rate limiting
+            if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_CLIENT_ERRORS:
+                break
         except requests.exceptions.RequestException as e:
-            # Print an error message if the request fails
-            print('Error making request:', e)
-        # Wait for 1 second before retrying to avoid overwhelming the server
-        time.sleep(1)
+            _count(requests=1, request_seconds=time.monotonic() - started)
+            metrics.inc('trackit_http_requests_total', retailer=retailer, status='error')
+            # The failure is counted above; the retries below decide whether the fetch gives up
+            logger.warning("Error making request to %s: %s", url, e)
+        if attempt + 1 < retries:
+            # Honor the server's Retry-After if it sent one, otherwise back off exponentially with jitter
+            delay = _retry_after(response)
+            if delay is None:
+                delay = _backoff(attempt)
+            delay = min(delay, BACKOFF_MAX)
+            _count(retries=1, backoff_seconds=delay)
+            metrics.inc('trackit_http_retries_total', retailer=retailer)
+            time.sleep(delay)
     # Return None if all retries fail
+    _count(failures=1)
     return None
 
-# Function to scrape data from a Flipkart product page
-def flipkart_scrapper(url):
-    response = make_request(url)
-    if response:
-        soup = BeautifulSoup(response.content, 'html.parser')
-        # Extract the product title
-        title = soup.find('span', class_='B_NuCI')
-        if title is not None:
-            title = title.get_text(strip=True)
-        # Extract the product price and convert it to an integer
-        price_element = soup.find('div', class_='_30jeq3 _16Jk6d')
-        if price_element:
-            price = int(re.sub(r'\D', '', price_element.get_text(strip=True)))
-        else:
-            price = None
-        # Extract the image URL
-        image_element = soup.select_one('img._2r_T1I._396QI4, img._396cs4._2amPTt._3qGmMb')
-        image = image_element['src'] if image_element else None
-        # Return the scraped data
-        return {'title': title, 'price': price, 'img_link': image}
-    else:
+# Number of bytes around a price marker that make up the fingerprinted region of a page
+FINGERPRINT_WINDOW = 4096
+
+
+def page_fingerprint(content, marker):
+    # Hash the region of the page that starts at the price marker, or None if the marker is missing
+    position = content.find(marker)
+    if position == -1:
+        return None
+    return hashlib.sha1(content[position:position + FINGERPRINT_WINDOW]).hexdigest()
+
+
+def fetch_and_parse(url, parse, marker, cache=None, retailer=''):
+    """Fetch a product page and parse it, reusing cached data when the page has not changed.
+
+    With a cache, the stored ETag/Last-Modified validators are sent as a conditional request,
+    and a 304 or an unchanged fingerprint of the price region returns the previously parsed
+    data without building a parse tree. retailer labels the request and parse metrics.
+    """
+    entry = cache.get(url) if cache is not None else None
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    response = make_request(url, headers=headers or None, retailer=retailer)
+    if not response:
         # Return an error message if the request fails
         return {'error': 'Failed to fetch data from URL'}
+    if response.status_code == 304 and entry:
+        cache.record('not_modified')
+        return dict(entry['data'])
 
-# Function to scrape data from an eBay product page
-def ebay_scrapper(url):
-    response = make_request(url)
-    if response:
-        soup = BeautifulSoup(response.content, 'html.parser')
-        # Extract the product title
-        title_element = soup.find('span', class_='ux-textspans ux-textspans--BOLD')
-        title = title_element.get_text(strip=True) if title_element else None
-        # Extract the product price, convert it to a float, then to an integer representing cents
-        price_element = soup.find('div', class_='x-price-primary').find('span', class_='ux-textspans')
-        price = None
-        if price_element:
-            price_text = re.sub(r'[^\d.]', '', price_element.get_text(strip=True))
-            try:
-                price = int(float(price_text) * 100)
-            except ValueError:
-                print("Price conversion error")
-                price = None
-        # Extract the image URL
-        image_element = soup.find('div', class_='ux-image-carousel-item')
-        img_link = None
-        if image_element and image_element.find('img'):
-            img_link = image_element.find('img')['src']
-        # Return the scraped data
-        return {'title': title, 'price': price, 'img_link': img_link}
+    fingerprint = page_fingerprint(response.content, marker)
+    if entry and fingerprint is not None and fingerprint == entry.get('fingerprint'):
+        cache.record('hit')
+        data = dict(entry['data'])
     else:
-        # Return an error message if the request fails
-        return {'error': 'Failed to fetch data from URL'}
+        if cache is not None:
+            cache.record('miss')
+        with metrics.timed('parse', retailer):
+            data = parse(response.content)
+    if cache is not None and data.get('price') is not None:
+        cache.put(
+            url,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            fingerprint=fingerprint,
+            data=data,
+        )
+    return data
@@ -1,10 +1,18 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, HttpResponseForbidden
+from django.conf import settings
+from django.utils.dateparse import parse_date
 from django.contrib.auth import get_user_model, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from products.models import Products, PriceUpdate
-from datetime import date
-from .utils import flipkart_scrapper, ebay_scrapper
+from products.models import Products
+from .retailers import canonical_product, get_retailer, product_key
+from .history import get_chart_histories, downsample_lttb, encode_series, history_version, history_points
+from .product_fetch import add_product
+from .bulk_import import import_urls, normalize_url, read_urls
+from .profiling import collect_metrics, current_gauges
+from trackit import metrics
+import hashlib
 
 User = get_user_model()
 
@@ -15,46 +23,45 @@ def dashboard(request):
     if request.method == 'POST':
         # Adding a product through the search form
         if 'search' in request.POST:
-            product_url = request.POST.get('search')
-            # Checking if the product already exists for the user
-            existing_product = Products.objects.filter(product_url=product_url).first()
-            if existing_product:
+            # Normalizing the URL so the same product pasted from different places is stored once
+            product_url = normalize_url(request.POST.get('search', '')) or ''
+            # Checking if the product already exists, by its retailer item where the URL has one
+            existing_product = Products.objects.filter(**product_key(*canonical_product(product_url))).first()
+            if (existing_product and existing_product.status != Products.FAILED
+                    and existing_product.user.filter(id=request.user.id).exists()):
                 # Informing the user if the product is already in their cart
-                if existing_product.user.filter(id=request.user.id).exists():
-                    messages.info(request, "Product present in your cart!")
-                else:
-                    # Adding the product to the user's cart if it's not already there
-                    existing_product.user.add(request.user)
-                    messages.success(request, 'Product added in your cart!')
-                return redirect('dashboard')
+                messages.info(request, "Product present in your cart!")
+            elif existing_product is None and get_retailer(product_url) is None:
+                # Rejecting URLs no retailer scraper can handle
+                messages.error(request, "Can't fetch details!")
             else:
-                # Differentiating between Flipkart and eBay for scraping
-                if product_url.startswith("https://www.flipkart.com/"):
-                    product = flipkart_scrapper(product_url)
-                elif product_url.startswith("https://www.ebay.com/"):
-                    product = ebay_scrapper(product_url)
+                # Adding the product right away; its details are scraped by the fetch service, and
+                # users adding the same URL at once share that one fetch
+                product, _ = add_product(product_url, request.user)
+                if product.status == Products.PENDING:
+                    messages.success(request, 'Product added in your cart! Fetching its details...')
                 else:
-                    product = None  # Adding a fallback case for unsupported URLs
-                
-                # Validating and adding the new product to the database
-                if product and 'error' not in product:
-                    new_product = Products.objects.create(
-                        product_url=product_url,
-                        product_name=product['title'],
-                        product_img=product['img_link'],
-                        product_price=product['price'],
-                        date_added=date.today()
-                    )
-                    print(product)
-                    new_product.user.add(request.user)
-                    # Creating a record for the initial price update
-                    PriceUpdate.objects.create(product=new_product, price=product['price'], dates=date.today())
                     messages.success(request, 'Product added in your cart!')
-                else:
-                    # Handling failed product fetch attempts
-                    messages.error(request, "Can't fetch details!")
-                return redirect('dashboard')
+            return redirect('dashboard')
         
+        # Adding many products at once from an uploaded CSV or text file of URLs
+        if 'import_file' in request.FILES:
+            upload = request.FILES['import_file']
+            if upload.size > settings.BULK_IMPORT_MAX_BYTES:
+                messages.error(request, f"File too large, imports are limited to {settings.BULK_IMPORT_MAX_BYTES // 1024} KB")
+                return redirect('dashboard')
+            report = import_urls(request.user, read_urls(upload.read().decode('utf-8-sig', errors='replace')))
+            messages.success(request, f"Imported {report['attached']} products, {report['queued']} of them "
+                                      f"fetching details; {report['tracked']} already in your cart")
+            # Reporting the rows that could not be imported
+            failures = report['failures']
+            for line_number, url, reason in failures[:settings.BULK_IMPORT_REPORTED_FAILURES]:
+                messages.warning(request, f"Line {line_number}: {reason} ({url})")
+            if len(failures) > settings.BULK_IMPORT_REPORTED_FAILURES:
+                messages.warning(request, f"...and {len(failures) - settings.BULK_IMPORT_REPORTED_FAILURES} "
+                                          "more rows could not be imported")
+            return redirect('dashboard')
+
         # Removing a product from the user's cart
         if 'remove_product' in request.POST:
             product_id = request.POST.get('product_id')
@@ -67,21 +74,104 @@ def dashboard(request):
             logout(request)
             return redirect('entry')
 
-    # Preparing product data for display on the dashboard
+    # Preparing product data for display; chart histories are fetched lazily from price_history
     product_display = {}
     user_products = request.user.products_set.all()
     for product in user_products:
-        price_updates = product.priceupdate_set.all()
         product_display[product.id] = {
             'product_id': product.id,
             'product_name': product.product_name,
             'product_url': product.product_url,
             'product_image': product.product_img,
             'product_price': product.product_price,
+            'current_price': product.current_price if product.current_price is not None else product.product_price,
             'date_added': product.date_added,
-            'all_price': [update.price for update in price_updates],
-            'all_dates': [str(update.dates) for update in price_updates],
+            'status': product.status,
+            'fetch_error': product.fetch_error,
         }
 
     # Rendering the dashboard with the user's products
     return render(request, 'dashboard.html', {'products_info': product_display})
+
+
+# JSON view serving one product's price history to the dashboard charts
+@login_required(login_url='/entry/')
+def price_history(request, product_id):
+    """Return a page of a product's price history as a delta-encoded JSON series.
+
+    Query parameters: start/end (YYYY-MM-DD) limit the date range, before pages backwards from a
+    date, limit caps the page size and points downsamples the page for charting. Without a range
+    or page, the cached downsampled chart series is returned. Responses carry an ETag derived from
+    the product's last check and history revision, so unchanged histories are answered with 304
+    Not Modified.
+    """
+    product = get_object_or_404(request.user.products_set.only('id', 'last_checked_at', 'history_revision'),
+                                id=product_id)
+
+    # The history only changes when the tracker checks the product or compaction rewrites it, so its
+    # version and the query identify the response
+    query = '&'.join(f'{key}={value}' for key, value in sorted(request.GET.items()))
+    etag = '"' + hashlib.md5(f'{product.id}:{history_version(product)}:{query}'.encode()).hexdigest() + '"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return HttpResponseNotModified(headers={'ETag': etag})
+
+    # Validating the range, paging and downsampling parameters
+    dates = {key: parse_date(request.GET[key]) if request.GET.get(key) else None for key in ('start', 'end', 'before')}
+    if any(request.GET.get(key) and value is None for key, value in dates.items()):
+        return JsonResponse({'error': 'Dates must be given as YYYY-MM-DD'}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', settings.HISTORY_PAGE_SIZE)), settings.HISTORY_PAGE_SIZE)
+        points = int(request.GET.get('points', 0))
+        # A page holds at least one row; 0 points means no downsampling
+        if limit < 1 or points < 0:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a positive integer and points a non-negative integer'},
+                            status=400)
+
+    next_before = None
+    if not any(dates.values()) and 'limit' not in request.GET:
+        # The whole history for a chart: served from the downsampled chart cache
+        series_dates, series_prices = get_chart_histories([product], points or None)[product.id]
+    else:
+        # Newest rows first, one extra to know whether an older page exists
+        rows = history_points(product.id, dates['start'], dates['end'], dates['before'], limit + 1)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_before = str(rows[-1][0])
+        rows.reverse()
+        series_dates = [row[0] for row in rows]
+        series_prices = [row[1] for row in rows]
+        if points:
+            series_dates, series_prices = downsample_lttb(series_dates, series_prices, points)
+
+    payload = encode_series(series_dates, series_prices)
+    payload['product_id'] = product.id
+    payload['next_before'] = next_before
+    response = JsonResponse(payload, json_dumps_params={'separators': (',', ':')})
+    response['ETag'] = etag
+    # Browsers must revalidate with the ETag before reusing a cached history
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# JSON view listing the user's products still waiting for their details, polled by the dashboard
+@login_required(login_url='/entry/')
+def product_status(request):
+    pending = request.user.products_set.filter(status=Products.PENDING).values_list('id', flat=True)
+    response = JsonResponse({'pending': list(pending)})
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Prometheus scrape target: counters and timings saved by every tracker and email process, plus
+# gauges of the latest tracking pass and the email queues
+def metrics_endpoint(request):
+    if settings.METRICS_TOKEN:
+        if request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+            return HttpResponseForbidden()
+    elif request.META.get('REMOTE_ADDR') not in ('127.0.0.1', '::1'):
+        # Without a token, metrics are only served to scrapers on this machine
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(collect_metrics(), current_gauges()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
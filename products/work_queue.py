@@ -0,0 +1,146 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q, F
+from django.utils.timezone import now
+from trackit.db import write_atomic
+from .models import Products, TrackingJob, TrackingTask
+from .refresh import record_check_failures
+
+
+def get_open_job():
+    # The oldest tracking pass that has not finished yet, if any
+    return TrackingJob.objects.filter(finished_at__isnull=True).order_by('created_at').first()
+
+
+def create_job():
+    """Start a tracking pass over the products due for a check, or return None if none are due.
+
+    The pass is one job row plus one pending task per due product, inserted in bulk. The due
+    products are walked in id order one chunk of ids at a time (keyset pagination), so memory
+    stays flat however large the catalog; a plain iterator() would be buffered whole by database
+    drivers running without server-side cursors, as behind a connection pooler.
+    """
+    # Products still waiting for their first fetch are left to the fetch service
+    due = Products.objects.filter(Q(next_check_at__isnull=True) | Q(next_check_at__lte=now()),
+                                  status=Products.ACTIVE)
+    if not due.exists():
+        return None
+    with write_atomic():
+        job = TrackingJob.objects.create()
+        last_id = 0
+        while True:
+            product_ids = list(due.filter(id__gt=last_id).order_by('id')
+                               .values_list('id', flat=True)[:settings.PRICE_UPDATE_BATCH_SIZE])
+            if not product_ids:
+                break
+            TrackingTask.objects.bulk_create([TrackingTask(job=job, product_id=product_id)
+                                              for product_id in product_ids])
+            last_id = product_ids[-1]
+    return job
+
+
+def _claimable(queryset, current):
+    return queryset.filter(status=TrackingTask.PENDING).filter(
+        Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=current))
+
+
+# The product columns a worker needs to scrape a product and save its price
+TASK_PRODUCT_FIELDS = ('product__product_url', 'product__product_name', 'product__retailer')
+
+
+def claim_tasks(job, worker, limit):
+    """Lease up to limit pending tasks of a job to worker and return them with their products.
+
+    Candidates are leased with a conditional UPDATE that only matches tasks that are still
+    free, so when workers race for the same rows each task goes to exactly one of them. The
+    products are joined in with only the columns in TASK_PRODUCT_FIELDS.
+    """
+    current = now()
+    expires = current + timedelta(seconds=settings.TASK_LEASE_SECONDS)
+    candidates = list(_claimable(job.tasks.all(), current).order_by('id').values_list('id', flat=True)[:limit])
+    if not candidates:
+        return []
+    _claimable(TrackingTask.objects.filter(id__in=candidates), current).update(
+        lease_owner=worker, lease_expires_at=expires, attempts=F('attempts') + 1)
+    return list(TrackingTask.objects.filter(id__in=candidates, lease_owner=worker, lease_expires_at=expires)
+                .select_related('product')
+                .only(*(field.name for field in TrackingTask._meta.concrete_fields), *TASK_PRODUCT_FIELDS))
+
+
+def _held(tasks, worker, current):
+    # The given tasks still pending and leased to worker, locked until the transaction ends where
+    # the database supports it, so a lease can not lapse to another worker while they are saved
+    return TrackingTask.objects.select_for_update().filter(
+        id__in=[task.id for task in tasks], status=TrackingTask.PENDING,
+        lease_owner=worker, lease_expires_at__gte=current)
+
+
+def renew_leases(tasks, worker):
+    """Extend worker's lease on the given tasks by TASK_LEASE_SECONDS; returns the ids still held.
+
+    Called periodically while a batch is being scraped, so a slow batch keeps its tasks instead of
+    having them claimed again by another worker once the original lease runs out.
+    """
+    current = now()
+    with write_atomic():
+        held = set(_held(tasks, worker, current).values_list('id', flat=True))
+        TrackingTask.objects.filter(id__in=held).update(
+            lease_expires_at=current + timedelta(seconds=settings.TASK_LEASE_SECONDS))
+    return held
+
+
+def complete_tasks(tasks, worker):
+    """Mark done the given tasks that are still leased to worker and return their ids.
+
+    Tasks whose lease lapsed may have been claimed by another worker, which then owns saving
+    their results; they are left alone.
+    """
+    current = now()
+    held = set(_held(tasks, worker, current).values_list('id', flat=True))
+    TrackingTask.objects.filter(id__in=held).update(
+        status=TrackingTask.DONE, finished_at=current, lease_expires_at=None, last_error='')
+    return held
+
+
+def fail_tasks(tasks_with_errors, worker):
+    """Record failed attempts: retry later, or give up once a task has used all its attempts.
+
+    Only tasks still leased to worker are updated. Products whose task is given up are backed off
+    in the refresh schedule.
+    """
+    current = now()
+    retry_at = current + timedelta(seconds=settings.TASK_RETRY_DELAY)
+    with write_atomic():
+        held = set(_held([task for task, _ in tasks_with_errors], worker, current).values_list('id', flat=True))
+        given_up = []
+        failed = []
+        for task, error in tasks_with_errors:
+            if task.id not in held:
+                continue
+            if task.attempts >= settings.TASK_MAX_ATTEMPTS:
+                task.status, task.finished_at = TrackingTask.FAILED, current
+                given_up.append(task.product_id)
+            else:
+                # Keep the task pending but leased until the retry delay has passed
+                task.lease_expires_at = retry_at
+            task.last_error = (error or '')[:255]
+            failed.append(task)
+        TrackingTask.objects.bulk_update(failed, ['status', 'finished_at', 'lease_expires_at', 'last_error'])
+        if given_up:
+            record_check_failures(given_up, current)
+
+
+def release_tasks(tasks, worker):
+    # Hand unfinished tasks back to the queue immediately, e.g. when a worker pauses mid-batch
+    TrackingTask.objects.filter(
+        id__in=[task.id for task in tasks], status=TrackingTask.PENDING, lease_owner=worker
+    ).update(lease_owner='', lease_expires_at=None, attempts=F('attempts') - 1)
+
+
+def finish_job_if_complete(job):
+    # Close the job once no task is pending; returns True if the job is finished
+    if job.tasks.filter(status=TrackingTask.PENDING).exists():
+        return False
+    TrackingJob.objects.filter(pk=job.pk, finished_at__isnull=True).update(finished_at=now())
+    job.refresh_from_db()
+    return True
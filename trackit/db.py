@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+from django.db import transaction
+
+
+@contextmanager
+def write_atomic(using=None):
+    """transaction.atomic() for a block that writes to the database.
+
+    On the SQLite backend (trackit/sqlite_backend) the transaction begins with BEGIN IMMEDIATE,
+    taking the write lock up front and waiting for it within the busy timeout, instead of failing
+    with "database is locked" when a block that read first tries to write while another process
+    holds the lock. Plain atomic() blocks, such as the admin's, stay deferred so reads never take
+    the write lock. Other backends, and blocks nested in an open transaction, get a plain atomic().
+    """
+    connection = transaction.get_connection(using)
+    # Only the outermost block begins the transaction; the backend consumes the flag when it does
+    immediate = not connection.in_atomic_block and hasattr(connection, 'begin_immediate')
+    if immediate:
+        connection.begin_immediate = True
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        if immediate:
+            connection.begin_immediate = False
@@ -0,0 +1,139 @@
+import base64
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+import httplib2
+from django.conf import settings
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.send']
+
+# Seconds between checks of the token file for credentials saved by another process
+TOKEN_CHECK_INTERVAL = 30
+
+
+def encode_message(to, subject, body, subtype='plain', sender=None):
+    message = MIMEText(body, subtype)
+    message['to'] = to
+    if sender:
+        message['from'] = sender
+    message['subject'] = subject
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+
+class GmailClient:
+    """Gmail API credentials and client shared by every email the process sends.
+
+    The token file is read once (and again only when another process replaces it), the
+    credentials are refreshed under a lock shortly before they expire and saved atomically,
+    and the API client is built once. httplib2 connections are not thread-safe, so each
+    thread sends through its own authorized connection to the shared client.
+    """
+
+    def __init__(self, token_path, refresh_margin):
+        self.token_path = token_path
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.creds = None
+        self.token_mtime = None
+        self.token_checked_at = 0.0
+        self.service = None
+
+    def _load(self):
+        # Pick up the token file on first use and whenever it has been replaced since
+        current = time.monotonic()
+        if self.creds is not None and current - self.token_checked_at < TOKEN_CHECK_INTERVAL:
+            return
+        self.token_checked_at = current
+        try:
+            mtime = os.path.getmtime(self.token_path)
+        except OSError:
+            return
+        if mtime != self.token_mtime:
+            self.creds = Credentials.from_authorized_user_file(self.token_path, SCOPES)
+            self.token_mtime = mtime
+            self.service = None
+
+    def _save(self):
+        # Write to a temporary file and swap it in, so no reader ever sees a half-written token
+        directory = os.path.dirname(os.path.abspath(self.token_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.token-', suffix='.json')
+        with os.fdopen(fd, 'w') as token:
+            token.write(self.creds.to_json())
+        os.replace(temp_path, self.token_path)
+        self.token_mtime = os.path.getmtime(self.token_path)
+
+    def credentials(self):
+        """Return valid credentials, refreshing them ahead of expiry, or None if there are none."""
+        with self.lock:
+            self._load()
+            creds = self.creds
+            if creds is None:
+                return None
+            # google-auth keeps expiry as a naive UTC datetime
+            expiring = creds.expiry is not None and creds.expiry - datetime.utcnow() < self.refresh_margin
+            if (expiring or not creds.valid) and creds.refresh_token:
+                creds.refresh(Request())
+                self._save()
+            return creds if creds.valid else None
+
+    def store(self, creds):
+        """Use newly authorized credentials from now on and save them to the token file."""
+        with self.lock:
+            self.creds = creds
+            self.service = None
+            self._save()
+
+    def _client(self):
+        # The shared API client and this thread's authorized connection
+        creds = self.credentials()
+        if creds is None:
+            raise RuntimeError("No valid credentials provided for Gmail API.")
+        with self.lock:
+            if self.service is None:
+                self.service = build('gmail', 'v1', credentials=creds)
+            service = self.service
+        if getattr(self.local, 'creds', None) is not creds:
+            self.local.http = AuthorizedHttp(creds, http=httplib2.Http())
+            self.local.creds = creds
+        return service, self.local.http
+
+    def send(self, to, subject, body, subtype='plain', sender=None):
+        service, http = self._client()
+        raw_message = encode_message(to, subject, body, subtype, sender)
+        return service.users().messages().send(userId='me', body={'raw': raw_message}).execute(http=http)
+
+    def send_batch(self, messages, subtype='plain', sender=None):
+        """Send {key: (to, subject, body)} in one Gmail batch request; returns {key: error or None}."""
+        service, http = self._client()
+        results = {}
+
+        def record(request_id, response, exception):
+            results[request_id] = str(exception) if exception else None
+
+        batch = service.new_batch_http_request(callback=record)
+        for key, (to, subject, body) in messages.items():
+            raw_message = encode_message(to, subject, body, subtype, sender)
+            batch.add(service.users().messages().send(userId='me', body={'raw': raw_message}), request_id=str(key))
+        batch.execute(http=http)
+        return {key: results.get(str(key), 'No response from Gmail') for key in messages}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gmail_client():
+    # The process-wide GmailClient, created on first use
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GmailClient(settings.GMAIL_TOKEN_PATH, settings.GMAIL_REFRESH_MARGIN)
+        return _client
@@ -0,0 +1,173 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the histogram buckets shared by every stage timer
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Every metric the application records: name -> (type, help text, label names)
+METRICS = {
+    'trackit_stage_seconds': (
+        'histogram', "Seconds spent per stage: connect (DNS, TCP and TLS of new connections), wait "
+        "(request sent to response headers), download, parse, db and email", ('stage', 'retailer')),
+    'trackit_scrapes_total': (
+        'counter', "Product pages scraped, by retailer and outcome (success, failure, over_budget, and "
+        "unsupported for products no retailer handles)", ('retailer', 'outcome')),
+    'trackit_parse_errors_total': ('counter', "Prices found on a page that could not be read as a number",
+                                   ('retailer',)),
+    'trackit_extraction_fallbacks_total': (
+        'counter', "Pages the extraction backend failed on and BeautifulSoup parsed instead", ('backend',)),
+    'trackit_http_requests_total': (
+        'counter', "HTTP requests sent to retailers, by response status ('error' when none came back)",
+        ('retailer', 'status')),
+    'trackit_http_retries_total': ('counter', "HTTP requests retried after a failure", ('retailer',)),
+    'trackit_prices_saved_total': ('counter', "Prices saved by the tracker", ()),
+    'trackit_emails_total': (
+        'counter', "Emails handed to the email transport, by kind (alert, account) and outcome (sent, failed)",
+        ('kind', 'outcome')),
+}
+
+_counters = {}
+_histograms = {}
+_lock = threading.Lock()
+
+
+def _series(name, labels):
+    # The Prometheus series name, e.g. trackit_scrapes_total{outcome="success",retailer="flipkart"}
+    label_names = METRICS[name][2]
+    if not label_names:
+        return name
+    return name + '{' + ','.join(f'{label}="{labels.get(label, "")}"' for label in label_names) + '}'
+
+
+def inc(name, amount=1, **labels):
+    key = _series(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    key = _series(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+        # The last bucket counts the observations above every bound (+Inf)
+        histogram['buckets'][bisect.bisect_left(BUCKETS, value)] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+@contextmanager
+def timed(stage, retailer=''):
+    # Time the enclosed block as one observation of the stage
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe('trackit_stage_seconds', time.monotonic() - started, stage=stage, retailer=retailer)
+
+
+def snapshot():
+    """Return a JSON-serializable copy of every counter and histogram of this process."""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'histograms': {key: {'buckets': list(histogram['buckets']), 'sum': histogram['sum'],
+                                 'count': histogram['count']}
+                           for key, histogram in _histograms.items()},
+        }
+
+
+def merge(snapshots):
+    """Add up snapshots, e.g. those saved by several processes."""
+    merged = {'counters': {}, 'histograms': {}}
+    for data in snapshots:
+        for key, value in data.get('counters', {}).items():
+            merged['counters'][key] = merged['counters'].get(key, 0) + value
+        for key, histogram in data.get('histograms', {}).items():
+            total = merged['histograms'].setdefault(
+                key, {'buckets': [0] * len(histogram['buckets']), 'sum': 0.0, 'count': 0})
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], histogram['buckets'])]
+            total['sum'] += histogram['sum']
+            total['count'] += histogram['count']
+    return merged
+
+
+def subtract(later, earlier):
+    """Return what was recorded between two snapshots of the same process."""
+    difference = {'counters': {}, 'histograms': {}}
+    for key, value in later['counters'].items():
+        if value - earlier['counters'].get(key, 0):
+            difference['counters'][key] = value - earlier['counters'].get(key, 0)
+    for key, histogram in later['histograms'].items():
+        before = earlier['histograms'].get(key)
+        if before is None:
+            difference['histograms'][key] = histogram
+        elif histogram['count'] > before['count']:
+            difference['histograms'][key] = {
+                'buckets': [a - b for a, b in zip(histogram['buckets'], before['buckets'])],
+                'sum': histogram['sum'] - before['sum'],
+                'count': histogram['count'] - before['count'],
+            }
+    return difference
+
+
+def quantile(histogram, fraction):
+    """Estimate a quantile of a histogram by interpolating within the bucket it falls in."""
+    if not histogram['count']:
+        return 0.0
+    rank = fraction * histogram['count']
+    seen = 0
+    for index, count in enumerate(histogram['buckets']):
+        if count and seen + count >= rank:
+            lower = BUCKETS[index - 1] if index else 0.0
+            if index == len(BUCKETS):
+                # Beyond the last bound there is nothing to interpolate towards
+                return lower
+            return lower + (BUCKETS[index] - lower) * (rank - seen) / count
+        seen += count
+    return BUCKETS[-1]
+
+
+def _split(key):
+    name, _, labels = key.partition('{')
+    return name, labels.rstrip('}')
+
+
+def parse_series(key):
+    # The metric name and {label: value} of a series name built by _series
+    name, labels = _split(key)
+    return name, {label: value.strip('"') for label, _, value in
+                  (pair.partition('=') for pair in labels.split(',') if pair)}
+
+
+def render(data, gauges=()):
+    """Render a snapshot, plus (name, help, value) gauges, in the Prometheus text exposition format."""
+    lines = []
+    by_name = {}
+    for key in list(data['counters']) + list(data['histograms']):
+        by_name.setdefault(_split(key)[0], []).append(key)
+    for name, (kind, help_text, _) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key in sorted(by_name.get(name, [])):
+            if kind == 'counter':
+                lines.append(f'{key} {data["counters"][key]}')
+                continue
+            histogram = data['histograms'][key]
+            labels = _split(key)[1]
+            prefix = labels + ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip([*BUCKETS, '+Inf'], histogram['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = '{' + labels + '}' if labels else ''
+            lines.append(f'{name}_sum{suffix} {histogram["sum"]}')
+            lines.append(f'{name}_count{suffix} {histogram["count"]}')
+    for name, help_text, value in gauges:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
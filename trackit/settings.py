@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from os.path import join
 from pathlib import Path
 
@@ -80,12 +81,51 @@ WSGI_APPLICATION = 'trackit.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Configured from the environment: SQLite by default, PostgreSQL in production with
+# TRACKIT_DB_ENGINE=postgresql (requires the psycopg driver) and the TRACKIT_DB_* variables below.
+DB_ENGINE = os.environ.get('TRACKIT_DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('TRACKIT_DB_NAME', 'trackit'),
+            'USER': os.environ.get('TRACKIT_DB_USER', ''),
+            'PASSWORD': os.environ.get('TRACKIT_DB_PASSWORD', ''),
+            'HOST': os.environ.get('TRACKIT_DB_HOST', ''),
+            'PORT': os.environ.get('TRACKIT_DB_PORT', ''),
+            # Persistent connections: each process keeps its connection open for this many seconds
+            # instead of reconnecting on every request, and checks it is still usable before reuse
+            'CONN_MAX_AGE': int(os.environ.get('TRACKIT_DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            # Behind a transaction-pooling proxy such as PgBouncer (TRACKIT_DB_POOLED=1), server-side
+            # cursors do not survive between transactions and must be turned off
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('TRACKIT_DB_POOLED') == '1',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            # Django's SQLite backend plus the pragmas below (trackit/sqlite_backend); the tracker's
+            # writes take the write lock up front through trackit.db.write_atomic()
+            'ENGINE': 'trackit.sqlite_backend',
+            'NAME': os.environ.get('TRACKIT_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Seconds a connection waits for the write lock before failing with "database is locked"
+                'timeout': 20,
+                'pragmas': {
+                    # Readers see the last commit while the tracker writes, and the writer never waits for them
+                    'journal_mode': 'WAL',
+                    # Safe with WAL: a power cut may lose the last commits but never corrupts the database
+                    'synchronous': 'NORMAL',
+                    # 64 MB page cache per connection and memory-mapped reads
+                    'cache_size': -64000,
+                    'mmap_size': 256 * 1024 * 1024,
+                    'temp_store': 'MEMORY',
+                },
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -178,5 +218,138 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'DEBUG',
         },
+        # Progress and failures reported by the tracker, fetch and email services
+        'products': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'accounts': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
     },
-}
\ No newline at end of file
+}
+
+# Number of worker threads used to scrape product pages during a tracking pass
+SCRAPE_WORKERS = 8
+
+# Overrides of the per-retailer scraping limits registered in products/retailers.py: concurrent
+# requests, requests per pass (None for unlimited) and minimum seconds between requests
+SCRAPE_RETAILER_LIMITS = {
+    'flipkart': {'max_concurrency': 4, 'request_budget': None, 'min_interval': 0.25},
+    'ebay': {'max_concurrency': 4, 'request_budget': None, 'min_interval': 0.25},
+}
+
+# Minimum seconds between requests to a retailer across all tracker processes and hosts sharing the
+# database (manage.py run_tracker and run_worker); the limits above apply to each process on its own
+SCRAPE_GLOBAL_MIN_INTERVAL = {
+    'flipkart': 0.05,
+    'ebay': 0.05,
+}
+
+# Persistent cache of ETag/Last-Modified validators and price-region fingerprints per product URL
+PAGE_CACHE_PATH = join(BASE_DIR, 'page_cache.json')
+# Maximum number of URLs kept in the page cache; least recently used entries are evicted first
+PAGE_CACHE_SIZE = 50000
+
+# Backend used to extract title, price and image from product pages: 'streaming', 'lxml' (if installed)
+# or 'soup'. Anything other than 'soup' falls back to BeautifulSoup when it finds no price.
+EXTRACTION_BACKEND = 'streaming'
+
+# Optional JSON file of selector overrides keyed by retailer name, picked up without a restart
+RETAILER_SELECTORS_PATH = join(BASE_DIR, 'retailer_selectors.json')
+
+# Number of scraped prices buffered and written per bulk INSERT/transaction during a tracking pass
+PRICE_UPDATE_BATCH_SIZE = 500
+
+# Maximum number of points drawn in a dashboard price chart; longer histories are downsampled
+CHART_MAX_POINTS = 90
+
+# Maximum number of price points returned in one page of the price history API
+HISTORY_PAGE_SIZE = 365
+
+# Tracking scheduler (manage.py run_tracker): seconds between passes over the products that are due
+# for a check, seconds between tracking status checks while idle, and seconds after which a silent
+# scheduler's lock may be taken over
+TRACKING_INTERVAL = 15 * 60
+TRACKER_POLL_SECONDS = 15
+TRACKER_LEASE_SECONDS = 600
+
+# Tracking work queue: seconds a worker holds claimed tasks before others may take them over (renewed
+# every TASK_CHECKPOINT_SECONDS while a batch is being scraped), claims per task before it is marked
+# failed, and seconds before a failed attempt is retried
+TASK_LEASE_SECONDS = 300
+TASK_CHECKPOINT_SECONDS = 30
+TASK_MAX_ATTEMPTS = 3
+TASK_RETRY_DELAY = 600
+
+# Adaptive refresh schedule: every product has its own check interval, halved when its price changes
+# and stretched by half when it holds, between these bounds (seconds). New products start at the default;
+# products whose page keeps failing back off exponentially from REFRESH_FAILURE_DELAY.
+REFRESH_MIN_INTERVAL = 2 * 60 * 60
+REFRESH_MAX_INTERVAL = 7 * 24 * 60 * 60
+REFRESH_DEFAULT_INTERVAL = 24 * 60 * 60
+REFRESH_FAILURE_DELAY = 60 * 60
+
+# Price drop notifications (manage.py send_alerts): the transport class that sends emails (Gmail API,
+# or products.notifications.FakeTransport to record them locally), emails per Gmail batch request,
+# seconds a user's first pending alert waits so later drops join the same digest, and the polling,
+# lease, retry and attempt limits of the delivery queue
+NOTIFICATION_TRANSPORT = 'products.notifications.GmailTransport'
+NOTIFICATION_BATCH_SIZE = 50
+NOTIFICATION_DIGEST_WINDOW = 5 * 60
+NOTIFICATION_POLL_SECONDS = 30
+NOTIFICATION_LEASE_SECONDS = 300
+NOTIFICATION_RETRY_DELAY = 600
+NOTIFICATION_MAX_ATTEMPTS = 5
+
+# Gmail API credentials shared by signup and price drop emails: the token file written by the Google
+# OAuth callback, and how many seconds before expiry the access token is refreshed
+GMAIL_TOKEN_PATH = join(BASE_DIR, 'token.json')
+GMAIL_REFRESH_MARGIN = 5 * 60
+
+# Account email outbox (manage.py send_emails): the sender address, emails per Gmail batch request,
+# seconds between checks for queued emails, and the lease, first retry delay (doubled on each further
+# failure) and attempts after which an email is kept as a dead letter
+ACCOUNT_EMAIL_SENDER = 'your_email@gmail.com'  # Replace with your actual email
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_POLL_SECONDS = 2
+EMAIL_OUTBOX_LEASE_SECONDS = 300
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6
+
+# Percentage drop from the previous price that alerts subscribers who have not set up alert rules
+DEFAULT_ALERT_DROP_PERCENT = 25
+
+# Where dashboard charts read price history from: 'rows' (one PriceUpdate row per day) or 'series'
+# (the compact per-product PriceSeries, expanded to a daily series). The tracker keeps both up to date;
+# run manage.py build_price_series once before switching to 'series'.
+PRICE_HISTORY_BACKEND = 'rows'
+
+# Price history retention (manage.py compact_history): days of daily PriceUpdate rows kept, days after
+# which older history is kept as monthly rather than weekly min/max/close rollups, and products
+# compacted per transaction
+PRICE_HISTORY_DAILY_DAYS = 365
+PRICE_HISTORY_WEEKLY_DAYS = 3 * 365
+PRICE_HISTORY_COMPACTION_BATCH_SIZE = 100
+PRICE_HISTORY_COMPACTION_INTERVAL = 24 * 60 * 60
+
+# Metrics endpoint (/metrics/, Prometheus text format): the bearer token scrapers must send, or None to
+# only answer requests from this machine, and seconds after which a silent process's metrics are dropped
+METRICS_TOKEN = os.environ.get('TRACKIT_METRICS_TOKEN')
+METRICS_RETENTION_SECONDS = 24 * 60 * 60
+
+# Background fetch of newly added products (manage.py fetch_products): products scraped per batch, seconds
+# between checks for queued fetches, and the lease, retry delay and attempts after which a product is
+# shown to its users as failed
+PRODUCT_FETCH_BATCH_SIZE = 20
+PRODUCT_FETCH_POLL_SECONDS = 2
+PRODUCT_FETCH_LEASE_SECONDS = 120
+PRODUCT_FETCH_RETRY_DELAY = 30
+PRODUCT_FETCH_MAX_ATTEMPTS = 3
+
+# Bulk import of product URLs (dashboard upload or manage.py import_products): URLs accepted per import,
+# the largest file the dashboard accepts, and row failures listed on the dashboard after an import
+BULK_IMPORT_MAX_URLS = 1000
+BULK_IMPORT_MAX_BYTES = 1024 * 1024
+BULK_IMPORT_REPORTED_FAILURES = 10
@@ -0,0 +1,34 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Django's SQLite backend tuned for a tracker writing while the dashboard reads.
+
+    Two extra OPTIONS are understood: 'pragmas', a dict of PRAGMA values applied to every new
+    connection (e.g. WAL journaling, so readers no longer block the writer), and
+    'transaction_mode', the BEGIN mode of atomic blocks (deferred by default). Blocks opened
+    with trackit.db.write_atomic() always begin IMMEDIATE: they take the write lock when they
+    start and wait for it within the busy timeout, whereas a deferred transaction that reads
+    first fails at once with "database is locked" when it later tries to write while another
+    connection holds the lock.
+    """
+
+    # Set by trackit.db.write_atomic() for the transaction about to begin
+    begin_immediate = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        immediate, self.begin_immediate = self.begin_immediate, False
+        mode = 'IMMEDIATE' if immediate else self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from accounts.views import entry
-from products.views import dashboard
+from products.views import dashboard, price_history, product_status, metrics_endpoint
 from django.conf.urls.static import static
 from django.conf import settings
 from accounts.views import google_authenticate, google_callback, activate
@@ -12,6 +12,9 @@ urlpatterns = [
     path('entry/', entry, name='entry'),
     path('activate/<uidb64>/<token>/', activate, name='activate'),
     path('dashboard/', dashboard, name='dashboard'),
+    path('products/<int:product_id>/history/', price_history, name='price_history'),
+    path('products/status/', product_status, name='product_status'),
+    path('metrics/', metrics_endpoint, name='metrics'),
     path('google_authenticate/', google_authenticate, name='google_authenticate'),
     path('google_callback/', google_callback, name='google_callback'),
 ]